@@ -0,0 +1,48 @@
+"""
+Gunicorn settings for the WSGI deployment (see render.yaml):
+
+    gunicorn -c gunicorn.conf.py rojmel.wsgi:application
+
+The app is preloaded and warmed in the master (rojmel.warmup), so Django,
+every view and the numpy/pandas/scikit-learn stack are imported once and
+shared copy-on-write by the workers. Each worker then connects its request
+threads to the database before it accepts traffic. Workers are recycled
+after a jittered number of requests to bound slow memory growth.
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+preload_app = True
+
+# Threads overlap database and network waits; processes add CPU parallelism
+worker_class = "gthread"
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() + 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 1000))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 100))
+
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = "-"
+
+
+def when_ready(server):
+    # Runs in the master once the preloaded app is imported, before any fork
+    from rojmel.warmup import warm_up
+
+    warm_up(server.app.wsgi())
+
+
+def post_worker_init(worker):
+    from rojmel.warmup import open_connections
+
+    try:
+        open_connections(getattr(worker, "tpool", None), threads=worker.cfg.threads)
+    except Exception as exc:
+        # Not fatal: the request threads connect on first use as usual
+        worker.log.warning("Could not open database connections during warm-up: %s", exc)
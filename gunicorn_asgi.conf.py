@@ -0,0 +1,27 @@
+"""
+Gunicorn settings for serving rojmel over ASGI with uvicorn workers, the
+deployment profile for the async endpoints under /api/async/:
+
+    gunicorn -c gunicorn_asgi.conf.py rojmel.asgi:application
+
+Locally, `uvicorn rojmel.asgi:application --reload` serves the same app.
+
+Each worker runs one event loop, so a request waiting on the database no
+longer holds a worker. Async views overlap their queries on the loop's
+thread pool; the sync DRF views still work, run by asgiref one at a time per
+worker, so keep the WSGI profile for sync-heavy traffic.
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+worker_class = "uvicorn_worker.UvicornWorker"
+# One event loop per core; concurrency comes from the loop, not more processes
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = "-"
@@ -1,13 +1,113 @@
-from django.contrib import admin
+"""
+Admin for tables that grow to millions of rows.
+
+- Changelists join the businesses (and their owners, which name a business
+  without a name) instead of loading one per row.
+- Foreign keys are edited as raw ids, or with autocomplete for businesses,
+  instead of a <select> of every row.
+- Orders and returns drill down by date, on its index.
+- An unfiltered changelist of a large table is counted from the database's
+  statistics (EstimatedCountPaginator), not with COUNT(*).
+
+Tenant tables are read from `default` (and tenants on other shards aren't
+listed; see inventory.sharding).
+"""
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.utils.functional import cached_property
+
+from . import stock
 from .models import Product, UserProfile, Business, Order, Return, SalesForecastModel
 
-# Register your models here.
-admin.site.register(Product)
+# Tables up to this many rows are counted exactly
+ESTIMATE_ABOVE = 100_000
+
+
+def estimated_count(model, using):
+    """The rows in `model`'s table according to the database's statistics; None without any."""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute("SELECT reltuples FROM pg_class WHERE oid = %s::regclass", [connection.ops.quote_name(table)])
+            counts = [row[0] for row in cursor.fetchall()]
+        elif connection.vendor == "sqlite":
+            try:
+                # Written by ANALYZE: each index's row count comes first, a partial index's being smaller
+                cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s", [table])
+            except DatabaseError:
+                # Never analyzed
+                return None
+            counts = [int(row[0].split()[0]) for row in cursor.fetchall()]
+        else:
+            return None
+    # PostgreSQL's -1: never analyzed
+    count = max(counts, default=-1)
+    return int(count) if count >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Counts an unfiltered changelist from the table's statistics once the
+    table has more than ESTIMATE_ABOVE rows. Filtered ones (a date drill-down,
+    a search) are counted exactly.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > ESTIMATE_ABOVE:
+                return estimate
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    # No second COUNT(*) of the whole table for "N of M selected"
+    show_full_result_count = False
+    autocomplete_fields = ("business",)
+    list_select_related = ("business__owner",)
+
+
+@admin.register(Business)
+class BusinessAdmin(admin.ModelAdmin):
+    list_display = ("business_name", "owner", "business_type", "department_branch")
+    list_select_related = ("owner",)
+    raw_id_fields = ("owner",)
+    search_fields = ("business_name", "owner__username")
+
+
+@admin.register(Product)
+class ProductAdmin(LargeTableAdmin):
+    list_display = ("product_name", "sku", "business", "category", "current_stock", "min_stock", "is_low_stock", "stock_shards")
+    search_fields = ("sku", "product_name")
+    # Changed with manage.py shard_stock, which moves the stock into the shards
+    readonly_fields = ("stock_shards",)
+    actions = ["recompute_stock"]
+
+    @admin.action(description="Recompute stock of the selected sharded products from their shards")
+    def recompute_stock(self, request, queryset):
+        updated = stock.reconcile(product_ids=queryset.values("pk"), using=queryset.db)
+        self.message_user(request, f"Updated the stock of {updated} products.", messages.SUCCESS)
+
+
+@admin.register(Order)
+class OrderAdmin(LargeTableAdmin):
+    list_display = ("order_id", "business", "product_name", "quantity", "customer_name", "date", "is_returned")
+    date_hierarchy = "date"
+    raw_id_fields = ("customer",)
+
+
+@admin.register(Return)
+class ReturnAdmin(LargeTableAdmin):
+    list_display = ("order", "business", "product_name", "quantity", "customer_name", "date")
+    list_select_related = ("business__owner", "order")
+    date_hierarchy = "date"
+    raw_id_fields = ("order", "customer")
+
+
 admin.site.register(UserProfile)
-admin.site.register(Business)
-admin.site.register(Order)
-admin.site.register(Return)
 admin.site.register(SalesForecastModel)
-
-class ProductAdmin(admin.ModelAdmin):
-    exclude = ('business',)  # hide business field
\ No newline at end of file
@@ -0,0 +1,315 @@
+"""
+Columnar engine shared by the analysis helpers in views.py.
+
+A window's orders and returns are fetched once with values_list() and held as
+NumPy columns: bucket index, product code, customer code and quantity. Money
+is int64 paise (see money.py). Time buckets, per-product/customer/category
+totals and top-N rankings are then array operations instead of dict loops.
+
+Rankings reproduce what the helpers did with dicts and a stable sort: ties
+keep the order in which keys were first seen in the rows (orders, then
+returns).
+"""
+import copy
+from datetime import date, timedelta
+
+import numpy as np
+from django.dispatch import Signal
+
+from .archive import with_summaries
+from .async_db import gather_queries
+from .customers import normalize
+from .models import Order, Product, Return
+from .money import to_paise
+
+UNCATEGORIZED = "uncategorized"
+
+# Sent by every SalesFrame once it has loaded its rows. Arguments: `filters`
+# (the business filter it was built with), `days` (the days of its window) and
+# `rows` (the order and return rows loaded).
+frame_loaded = Signal()
+
+# first_seen() value for codes that never occur
+NEVER = np.iinfo(np.int64).max
+
+
+def add_months(d, m):
+    y = d.year + (d.month - 1 + m) // 12
+    mm = (d.month - 1 + m) % 12 + 1
+    return date(y, mm, 1)
+
+
+class Window:
+    """
+    A date range split into daily buckets, or monthly buckets when `monthly`
+    is set. Labels are ISO dates or YYYY-MM.
+    """
+
+    def __init__(self, start, end, monthly=False):
+        self.start = start
+        self.end = end
+        self.monthly = monthly
+        days = max((end - start).days + 1, 0)
+        if monthly:
+            first = date(start.year, start.month, 1)
+            months = (end.year - first.year) * 12 + end.month - first.month + 1
+            self.labels = [add_months(first, i).strftime("%Y-%m") for i in range(max(months, 0))]
+            # day offset -> month bucket
+            self._day_bucket = np.array([
+                (d.year - first.year) * 12 + d.month - first.month
+                for d in (start + timedelta(days=i) for i in range(days))
+            ], dtype=np.int64)
+        else:
+            self.labels = [(start + timedelta(days=i)).isoformat() for i in range(days)]
+            self._day_bucket = None
+
+    @classmethod
+    def for_range(cls, rng, today, start_date=None, end_date=None):
+        """
+        The window for a `range` parameter ('weekly', 'monthly' or 'yearly')
+        ending today, or daily buckets for an explicit start/end date.
+        Returns (window, rng) with rng normalised like the helpers always did.
+        """
+        if start_date and end_date and isinstance(start_date, date) and isinstance(end_date, date):
+            return cls(start_date, end_date), rng
+        if rng not in ("weekly", "monthly", "yearly"):
+            rng = "monthly"
+        if rng == "weekly":
+            return cls(today - timedelta(days=6), today), rng
+        if rng == "monthly":
+            return cls(today - timedelta(days=29), today), rng
+        return cls(add_months(date(today.year, today.month, 1), -11), today, monthly=True), rng
+
+    @property
+    def size(self):
+        return len(self.labels)
+
+    def buckets(self, days):
+        """Bucket index for an array of day offsets from `start`."""
+        return days if self._day_bucket is None else self._day_bucket[days]
+
+
+class Columns:
+    """
+    Orders or returns as parallel arrays. `day` is the offset from the start
+    of the loaded range, `bucket` the index into the current window's labels.
+    """
+
+    def __init__(self, day, bucket, product, quantity, customer=None):
+        self.day = day
+        self.bucket = bucket
+        self.product = product
+        self.quantity = quantity
+        self.customer = customer
+
+    def __len__(self):
+        return len(self.quantity)
+
+    def filter(self, mask):
+        return Columns(
+            self.day[mask], self.bucket[mask], self.product[mask], self.quantity[mask],
+            None if self.customer is None else self.customer[mask],
+        )
+
+
+class SalesFrame:
+    """
+    Products plus the orders (and optionally returns) of one window.
+    within() reuses the loaded rows for a narrower or differently bucketed
+    window, so several analyses can share one scan.
+
+    Products get integer codes; order/return rows whose product_name matches
+    no product get extra codes with zero prices (`known` is False for them).
+    As with the name-keyed dicts this replaces, a name shared by several
+    products takes the last product's prices.
+    """
+
+    def __init__(self, filters, window, returns=True, customers=False, rows=None):
+        """
+        `rows` are the results of queries() when they were run elsewhere
+        (see aload()); by default they are fetched here.
+        """
+        if rows is None:
+            rows = [None if qs is None else list(qs) for qs in self.queries(filters, window, returns, customers)]
+        product_rows, order_rows, return_rows = rows
+        self.window = window
+        # Columns.day is relative to the start of the loaded range
+        self.origin = window.start
+        self.product_index = {}
+        self.product_names = []
+        selling, cost, stock, categories = [], [], [], []
+        for name, selling_price, price, category, current_stock in product_rows:
+            code = self.product_index.get(name)
+            if code is None:
+                code = self.product_index[name] = len(self.product_names)
+                self.product_names.append(name)
+                selling.append(0)
+                cost.append(0)
+                stock.append(0)
+                categories.append(None)
+            selling[code] = to_paise(selling_price)
+            cost[code] = to_paise(price)
+            stock[code] = current_stock
+            categories[code] = category
+        self.product_count = len(self.product_names)
+
+        self.customer_index = {}
+        self.customer_keys = {}
+        self.customer_names = []
+        self.orders = self._load(order_rows, customers)
+        self.returns = self._load(return_rows, customers) if returns else None
+        frame_loaded.send(
+            sender=SalesFrame, filters=filters, days=(window.end - window.start).days + 1,
+            rows=len(order_rows) + (len(return_rows) if returns else 0),
+        )
+
+        # Codes added for unknown product names have no price and no category
+        extra = len(self.product_names) - self.product_count
+        self.selling_paise = np.array(selling + [0] * extra, dtype=np.int64)
+        self.cost_paise = np.array(cost + [0] * extra, dtype=np.int64)
+        self.stock = np.array(stock, dtype=np.int64)
+        self.known = np.arange(len(self.product_names)) < self.product_count
+        categories += [UNCATEGORIZED] * extra
+        category_index = {}
+        for category in categories:
+            category_index.setdefault(category, len(category_index))
+        self.category_names = list(category_index)
+        self.product_category = np.array([category_index[c] for c in categories], dtype=np.int64)
+
+    @staticmethod
+    def queries(filters, window, returns=True, customers=False):
+        """
+        The product, order and return querysets a frame is built from (None
+        for skipped returns). Archived orders and returns come in as their
+        daily summaries.
+        """
+        window_filter = dict(filters, date__gte=window.start, date__lte=window.end)
+        row_fields = ["date", "product_name", "quantity"] + (["customer_name"] if customers else [])
+        return (
+            Product.objects.filter(**filters)
+            .values_list("product_name", "selling_price", "price", "category", "current_stock"),
+            with_summaries(Order.objects.filter(**window_filter).values_list(*row_fields), "order", row_fields, **window_filter),
+            with_summaries(Return.objects.filter(**window_filter).values_list(*row_fields), "return", row_fields, **window_filter)
+            if returns else None,
+        )
+
+    @classmethod
+    async def aload(cls, filters, window, returns=True, customers=False):
+        """A frame whose product, order and return queries run concurrently (see async_db)."""
+        rows = await gather_queries(*cls.queries(filters, window, returns, customers))
+        return cls(filters, window, returns, customers, rows=rows)
+
+    @property
+    def product_size(self):
+        return len(self.product_names)
+
+    @property
+    def customer_size(self):
+        return len(self.customer_names)
+
+    def _code(self, name):
+        code = self.product_index.get(name)
+        if code is None:
+            code = self.product_index[name] = len(self.product_names)
+            self.product_names.append(name)
+        return code
+
+    def _customer_code(self, name):
+        code = self.customer_index.get(name)
+        if code is None:
+            # Spellings of one customer (customers.normalize()) share a code, shown by the first seen
+            key = normalize(name)
+            code = self.customer_keys.get(key)
+            if code is None:
+                code = self.customer_keys[key] = len(self.customer_names)
+                self.customer_names.append(name)
+            self.customer_index[name] = code
+        return code
+
+    def _load(self, rows, customers):
+        n = len(rows)
+        start = self.origin.toordinal()
+        days = np.fromiter((r[0].toordinal() - start for r in rows), dtype=np.int64, count=n)
+        product = np.fromiter((self._code(r[1]) for r in rows), dtype=np.int64, count=n)
+        quantity = np.fromiter((r[2] for r in rows), dtype=np.int64, count=n)
+        customer = np.fromiter((self._customer_code(r[3]) for r in rows), dtype=np.int64, count=n) if customers else None
+        return Columns(days, self.window.buckets(days), product, quantity, customer)
+
+    def within(self, window):
+        """
+        This frame restricted to `window`, which must lie inside the loaded
+        range, with rows bucketed by the new window's labels. Product and
+        customer tables are shared with this frame.
+        """
+        if window is self.window:
+            return self
+        view = copy.copy(self)
+        view.window = window
+        view.orders = self._narrow(self.orders, window)
+        view.returns = None if self.returns is None else self._narrow(self.returns, window)
+        return view
+
+    def _narrow(self, rows, window):
+        days = rows.day + (self.origin - window.start).days
+        inside = (days >= 0) & (days <= (window.end - window.start).days)
+        rows = rows.filter(inside)
+        rows.bucket = window.buckets(days[inside])
+        return rows
+
+    def revenue(self, rows):
+        """Selling value of each row, in paise."""
+        return self.selling_paise[rows.product] * rows.quantity
+
+    def cost(self, rows):
+        return self.cost_paise[rows.product] * rows.quantity
+
+    def sellable(self, rows):
+        """Rows with a quantity whose product exists (what the helpers priced)."""
+        return rows.filter((rows.quantity > 0) & self.known[rows.product])
+
+
+def group_sum(codes, values, size):
+    """int64 totals of `values` per code (exact, unlike float bincount weights)."""
+    out = np.zeros(size, dtype=np.int64)
+    np.add.at(out, codes, values)
+    return out
+
+
+def net_totals(codes, values, size):
+    """
+    Per-code totals of order values minus return values, plus first-seen
+    positions over the order rows followed by the return rows.
+    `codes` and `values` are (orders, returns) pairs.
+    """
+    (order_codes, return_codes), (order_values, return_values) = codes, values
+    totals = group_sum(order_codes, order_values, size) - group_sum(return_codes, return_values, size)
+    return totals, first_seen(np.concatenate([order_codes, return_codes]), size)
+
+
+def first_seen(codes, size):
+    """Position at which each code first occurs in `codes` (NEVER if it doesn't)."""
+    out = np.full(size, NEVER, dtype=np.int64)
+    np.minimum.at(out, codes, np.arange(len(codes), dtype=np.int64))
+    return out
+
+
+def rank(values, seen, mask=None, limit=None):
+    """
+    Codes ordered by `values` descending, ties by first appearance. Only codes
+    that were seen (and match `mask`) are ranked; `limit` keeps the top N,
+    found with a partition instead of a full sort.
+    """
+    candidates = seen != NEVER
+    candidates = np.flatnonzero(candidates if mask is None else candidates & mask)
+    if limit is not None and len(candidates) > limit:
+        # Everything tied with the N-th largest value stays a candidate
+        kth = np.partition(values[candidates], len(candidates) - limit)[len(candidates) - limit]
+        candidates = candidates[values[candidates] >= kth]
+    order = np.lexsort((seen[candidates], -values[candidates]))
+    return candidates[order][:limit]
+
+
+def in_first_seen_order(seen, mask=None):
+    """Seen codes (matching `mask`) in order of first appearance."""
+    codes = np.flatnonzero(seen != NEVER if mask is None else (seen != NEVER) & mask)
+    return codes[np.argsort(seen[codes], kind="stable")]
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class InventoryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'inventory'
+
+    def ready(self):
+        # Registers the DashboardSnapshot, Customer, stock shard, tenant shard, throttle density and SQLite journal receivers
+        from . import customers, sharding, snapshots, sqlite, stock, throttling  # noqa: F401
@@ -0,0 +1,132 @@
+"""
+Cold storage for old orders and returns (manage.py archive_orders and
+restore_orders).
+
+archive() moves orders dated before a cutoff, together with their returns,
+into ArchivedOrder and ArchivedReturn, so the per-business queries on Order
+and Return scan a bounded number of rows. What the analysis views need from
+the archived rows is kept in DailySummary: quantities per business, day,
+product and customer. with_summaries() appends those to a query of hot rows,
+so analyses over archived periods give the same totals as before. The
+summaries always equal the totals of the archive tables; every move
+rebuilds the summaries of the days it touched.
+
+Archiving is not a delete for the change feed: no tombstones are written and
+synced clients keep their copies. restore() moves rows back with new change
+sequence numbers, so the feed sends them again.
+"""
+from collections import defaultdict
+
+from django.db import router, transaction
+from django.db.models import Count, Sum
+
+from .models import ArchivedOrder, ArchivedReturn, DailySummary, Order, Return, delete_rows
+
+ORDER_FIELDS = [f.attname for f in Order._meta.concrete_fields]
+RETURN_FIELDS = [f.attname for f in Return._meta.concrete_fields]
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def with_summaries(rows, kind, fields, **filters):
+    """
+    `rows`, a values_list() of hot orders or returns (`kind`), followed in the
+    same query by the DailySummary rows matching `filters`, with the same
+    `fields` (date, product_name, quantity, customer_name).
+    """
+    summaries = DailySummary.objects.filter(kind=kind, **filters).values_list(*fields)
+    return rows.union(summaries, all=True)
+
+
+def archivable_orders(cutoff, business_ids=None):
+    """Orders dated before `cutoff` none of whose returns is dated on or after it."""
+    orders = Order.objects.filter(date__lt=cutoff).exclude(returns__date__gte=cutoff)
+    if business_ids is not None:
+        orders = orders.filter(business_id__in=business_ids)
+    return orders
+
+
+def archive(cutoff, business_ids=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Move archivable_orders() and their returns to the archive tables, one
+    transaction per `batch_size` orders. Returns (orders, returns) moved.
+    """
+    using = router.db_for_write(Order)
+    # Batches in date order, so each one rebuilds the summaries of only a few days
+    candidates = list(
+        archivable_orders(cutoff, business_ids).using(using)
+        .order_by("business_id", "date", "pk").values_list("pk", flat=True)
+    )
+    moved = [0, 0]
+    for start in range(0, len(candidates), batch_size):
+        with transaction.atomic(using=using):
+            # Filtered again: a return may have been added since
+            order_rows = list(
+                archivable_orders(cutoff).using(using)
+                .filter(pk__in=candidates[start:start + batch_size]).values(*ORDER_FIELDS)
+            )
+            ids = [row["id"] for row in order_rows]
+            return_rows = list(Return.objects.using(using).filter(order_id__in=ids).values(*RETURN_FIELDS))
+            ArchivedOrder.objects.using(using).bulk_create([ArchivedOrder(**row) for row in order_rows])
+            ArchivedReturn.objects.using(using).bulk_create([ArchivedReturn(**row) for row in return_rows])
+            # Plain DELETEs: no post_delete, so no tombstones for the change feed
+            delete_rows(Return, [row["id"] for row in return_rows], using)
+            delete_rows(Order, ids, using)
+            _rebuild_summaries(order_rows + return_rows, using)
+        moved[0] += len(order_rows)
+        moved[1] += len(return_rows)
+    return tuple(moved)
+
+
+def restore(start, end, business_ids=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Move archived orders dated `start`..`end`, with their returns, back into
+    Order and Return under their original ids. Returns (orders, returns).
+    """
+    archived = ArchivedOrder.objects.filter(date__gte=start, date__lte=end)
+    if business_ids is not None:
+        archived = archived.filter(business_id__in=business_ids)
+    using = router.db_for_write(Order)
+    archived = archived.using(using).order_by("business_id", "date", "pk").values_list("pk", flat=True)
+    moved = [0, 0]
+    while True:
+        with transaction.atomic(using=using):
+            ids = list(archived[:batch_size])
+            if not ids:
+                return tuple(moved)
+            order_rows = list(ArchivedOrder.objects.using(using).filter(pk__in=ids).values(*ORDER_FIELDS))
+            return_rows = list(ArchivedReturn.objects.using(using).filter(order_id__in=ids).values(*RETURN_FIELDS))
+            # bulk_create() stamps new change_seq values
+            Order.objects.using(using).bulk_create([Order(**row) for row in order_rows])
+            Return.objects.using(using).bulk_create([Return(**row) for row in return_rows])
+            ArchivedOrder.objects.using(using).filter(pk__in=ids).delete()
+            _rebuild_summaries(order_rows + return_rows, using)
+        moved[0] += len(order_rows)
+        moved[1] += len(return_rows)
+
+
+def _rebuild_summaries(rows, using):
+    """Recompute the DailySummary rows of the businesses and days of `rows` from the archive tables."""
+    days = defaultdict(set)
+    for row in rows:
+        days[row["business_id"]].add(row["date"])
+    for business_id, dates in days.items():
+        DailySummary.objects.using(using).filter(business_id=business_id, date__in=dates).delete()
+        summaries = []
+        for kind, model, keys in (
+            ("order", ArchivedOrder, ["date", "product_name", "customer_name", "is_returned"]),
+            ("return", ArchivedReturn, ["date", "product_name", "customer_name"]),
+        ):
+            totals = (
+                model.objects.using(using).filter(business_id=business_id, date__in=dates)
+                .values(*keys).annotate(total=Sum("quantity"), count=Count("pk")).order_by()
+            )
+            summaries += [
+                DailySummary(
+                    business_id=business_id, kind=kind, date=t["date"], product_name=t["product_name"],
+                    customer_name=t["customer_name"], is_returned=t.get("is_returned", False),
+                    quantity=t["total"], rows=t["count"],
+                )
+                for t in totals
+            ]
+        DailySummary.objects.using(using).bulk_create(summaries)
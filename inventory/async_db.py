@@ -0,0 +1,95 @@
+"""
+Concurrent ORM queries for the async views.
+
+Django's async ORM (aiterator(), aaggregate(), ...) hands every query to one
+shared thread, so awaiting several of them with asyncio.gather() still runs
+them one after another. run_query() instead evaluates a queryset on a worker
+thread of its own, with that thread's own database connection, so independent
+queries overlap. When the awaiting task is cancelled, for example because
+ASGIHandler noticed the client disconnect, the query still running is
+interrupted rather than left to finish.
+"""
+import asyncio
+from contextlib import ExitStack
+
+from asgiref.sync import sync_to_async
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+def _interrupt(connection):
+    """Abort the statement running on `connection` (sqlite3 interrupt(), psycopg cancel())."""
+    raw = connection.connection
+    cancel = getattr(raw, "interrupt", None) or getattr(raw, "cancel", None)
+    if cancel is not None:
+        cancel()
+
+
+def _evaluate(queryset, running):
+    """list(queryset), recording which connections are mid-statement in `running`."""
+
+    def track(execute, sql, params, many, context):
+        running.add(context["connection"])
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            running.discard(context["connection"])
+
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all(initialized_only=False):
+                stack.enter_context(connection.execute_wrapper(track))
+            return list(queryset)
+    finally:
+        _close_obsolete()
+
+
+def _close_obsolete():
+    # Worker threads never see request_finished: apply CONN_MAX_AGE here
+    for connection in connections.all(initialized_only=True):
+        connection.close_if_unusable_or_obsolete()
+
+
+def _call(func, args, kwargs):
+    try:
+        return func(*args, **kwargs)
+    finally:
+        _close_obsolete()
+
+
+async def run_query(queryset):
+    """The rows of `queryset`, fetched on a worker thread with its own connection."""
+    running = set()
+    try:
+        return await sync_to_async(_evaluate, thread_sensitive=False)(queryset, running)
+    except asyncio.CancelledError:
+        for connection in list(running):
+            _interrupt(connection)
+        raise
+
+
+def _in_transaction():
+    return connections[DEFAULT_DB_ALIAS].in_atomic_block
+
+
+async def gather_queries(*querysets):
+    """
+    Rows of each queryset (None stays None), evaluated concurrently. Inside a
+    transaction other connections can't see its writes, so the querysets
+    are then evaluated in turn on the transaction's own connection.
+    """
+    if await sync_to_async(_in_transaction)():
+        return [None if qs is None else await sync_to_async(list)(qs) for qs in querysets]
+    pending = [run_query(qs) for qs in querysets if qs is not None]
+    results = iter(await asyncio.gather(*pending))
+    return [None if qs is None else next(results) for qs in querysets]
+
+
+async def run_sync(func, *args, **kwargs):
+    """
+    func(*args, **kwargs) on a worker thread of its own, so slow work (password
+    hashing, ...) holds up neither the event loop nor the thread the other
+    sync_to_async() calls share. Inside a transaction it runs on the
+    transaction's thread, as in gather_queries().
+    """
+    thread_sensitive = await sync_to_async(_in_transaction)()
+    return await sync_to_async(_call, thread_sensitive=thread_sensitive)(func, args, kwargs)
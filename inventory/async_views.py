@@ -0,0 +1,273 @@
+"""
+Async versions of the dashboard and analysis endpoints, served under
+/api/async/. They return the same JSON as the views in views.py but fetch
+their product, order and return rows concurrently (see async_db), and the
+queries are interrupted if the client disconnects. The dashboard and sales
+overview are the exception: they share the sync views' cached results (and
+the dashboard its snapshots). Serve them over ASGI
+(gunicorn_asgi.conf.py); under WSGI they still work but gain nothing.
+
+DRF's @api_view does not support coroutines, so @async_api_view does the
+parts these read-only views need: GET only, the same JWT authentication, and
+FastJSONRenderer output.
+
+login is here too: under ASGI the sync views share one thread per worker,
+so the sync login's password hashing would hold up every other sync request.
+"""
+from datetime import date, datetime
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import authenticate
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException, AuthenticationFailed, ParseError
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
+from rest_framework.request import Request
+
+from .analytics import SalesFrame, Window
+from .async_db import gather_queries, run_sync
+from .authentication import BusinessScopedJWTAuthentication
+from .renderers import FastJSONRenderer
+from .replica import use_replica
+from .scope import BusinessNotFound, BusinessScopeError, get_business_scope
+from .views import (
+    ANALYSIS_SECTIONS, LOGIN_FAILED, LOGIN_REQUIRED, _batch_sections, _batch_windows, _business_filter, _cached_dashboard,
+    _cached_sales_overview, _get_customer_sales_analysis_data, _get_inventory_analysis_data, _get_returns_analysis_data,
+    _get_revenue_profit_analysis_data, _inventory_queries, _inventory_window,
+    _login_response, _login_user, _overview_dates,
+)
+
+
+def json_response(data, status=200, headers=None):
+    return HttpResponse(FastJSONRenderer().render(data), content_type="application/json", status=status, headers=headers)
+
+
+def async_api_view(view):
+    """Authenticate a GET request like the DRF views and pass `view` the DRF Request."""
+
+    @wraps(view)
+    async def wrapped(request, *args, **kwargs):
+        if request.method != "GET":
+            return json_response({"detail": f'Method "{request.method}" not allowed.'}, status=405, headers={"Allow": "GET"})
+        authenticator = BusinessScopedJWTAuthentication()
+        request = Request(request, authenticators=[authenticator])
+        unauthorized = {"WWW-Authenticate": authenticator.authenticate_header(request)}
+        try:
+            # Tokens without scope claims load the user from the database
+            user = await sync_to_async(lambda: request.user)()
+        except AuthenticationFailed as exc:
+            data = exc.detail if isinstance(exc.detail, dict) else {"detail": exc.detail}
+            return json_response(data, status=401, headers=unauthorized)
+        if not user.is_authenticated:
+            return json_response({"detail": "Authentication credentials were not provided."}, status=401, headers=unauthorized)
+        try:
+            return await view(request, *args, **kwargs)
+        except APIException as exc:
+            # As DRF answers them (sharding.CrossShardQuery, TenantMoving)
+            data = exc.detail if isinstance(exc.detail, dict) else {"detail": exc.detail}
+            return json_response(data, status=exc.status_code)
+
+    return wrapped
+
+
+async def select_businesses(request):
+    """
+    The business ids selected by the request (see BusinessScope.select), or
+    None when the user has no business. Raises BusinessScopeError.
+    """
+    scope = get_business_scope(request)
+
+    def select():
+        # Loads the user's businesses unless the token carries their ids
+        return scope.select() if scope else None
+
+    return await sync_to_async(select)()
+
+
+def date_range(request):
+    """
+    (start_date, end_date) from the query string, or (None, None) unless both
+    are given. Raises ValueError with the message the sync views respond with.
+    """
+    start_date_str = request.GET.get("start_date")
+    end_date_str = request.GET.get("end_date")
+    if not (start_date_str and end_date_str):
+        return None, None
+    try:
+        start_date = datetime.strptime(start_date_str, "%Y-%m-%d").date()
+        end_date = datetime.strptime(end_date_str, "%Y-%m-%d").date()
+    except ValueError:
+        raise ValueError("Invalid date format. Use YYYY-MM-DD.")
+    if start_date > end_date:
+        raise ValueError("start_date cannot be after end_date")
+    return start_date, end_date
+
+
+@csrf_exempt
+async def login(request):
+    """
+    Same response as views.login, through the same authenticate() call, run
+    with async_db.run_sync() so the PBKDF2 hashing holds up neither the event
+    loop nor the sync views' thread.
+    """
+    if request.method != "POST":
+        return json_response({"detail": f'Method "{request.method}" not allowed.'}, status=405, headers={"Allow": "POST"})
+    try:
+        data = Request(request, parsers=[JSONParser(), FormParser(), MultiPartParser()]).data
+    except ParseError as exc:
+        return json_response({"detail": exc.detail}, status=400)
+    username_or_email = data.get("username", "")
+    password = data.get("password", "")
+    if not username_or_email or not password:
+        return json_response(LOGIN_REQUIRED, status=400)
+
+    user = await sync_to_async(_login_user)(username_or_email)
+    if user is None:
+        return json_response(LOGIN_FAILED, status=401)
+    user = await run_sync(authenticate, username=user.username, password=password)
+    if not user:
+        return json_response(LOGIN_FAILED, status=401)
+    return json_response(await sync_to_async(_login_response)(user, data.get("refresh_token")))
+
+
+@async_api_view
+@use_replica
+async def dashboard_metrics(request):
+    """Same response as views.dashboard_metrics, from the same cache."""
+    try:
+        business_ids = await select_businesses(request)
+    except BusinessNotFound:
+        return json_response({"error": "Business not found for user"}, status=404)
+    except BusinessScopeError:
+        return json_response({"error": "Invalid business id"}, status=400)
+    if business_ids is None:
+        return json_response({"error": "No business found for this user."}, status=400)
+
+    days = int(request.GET.get("days", 30))
+    if days <= 0 or days > 365:
+        days = 30
+    # The sync view's cache and snapshots, so both cost the same
+    return json_response(await sync_to_async(_cached_dashboard)(business_ids, days))
+
+
+async def _analysis(request, compute, inventory=False, **frame_options):
+    """
+    Shared body of the analysis views: select businesses, parse the dates,
+    load the window's rows concurrently and call
+    compute(business_ids, today, start_date, end_date, frame, inventory_rows).
+    """
+    try:
+        business_ids = await select_businesses(request)
+    except BusinessScopeError:
+        return json_response({"detail": "Invalid business id"}, status=400)
+    if business_ids is None:
+        return json_response({"detail": "No business found."}, status=400)
+    try:
+        start_date, end_date = date_range(request)
+    except ValueError as exc:
+        return json_response({"detail": str(exc)}, status=400)
+
+    today = date.today()
+    if inventory:
+        window = _inventory_window(today, start_date, end_date)
+    else:
+        window, _rng = Window.for_range(request.GET.get("range", "monthly").lower(), today, start_date, end_date)
+    business_filter = _business_filter(business_ids)
+    extra = _inventory_queries(business_filter) if inventory else ()
+    rows = await gather_queries(*extra, *SalesFrame.queries(business_filter, window, **frame_options))
+    frame = SalesFrame(business_filter, window, rows=rows[len(extra):], **frame_options)
+    return json_response(compute(business_ids, today, start_date, end_date, frame, rows[:len(extra)]))
+
+
+@async_api_view
+@use_replica
+async def sales_overview(request):
+    """Same response as views.sales_overview."""
+    try:
+        business_ids = await select_businesses(request)
+    except BusinessScopeError:
+        return json_response({"detail": "Invalid business id"}, status=400)
+    if business_ids is None:
+        return json_response({"detail": "No business found."}, status=400)
+
+    start, end = _overview_dates(request.GET.get("start_date"), request.GET.get("end_date"))
+    # The sync view's cache, as for the dashboard
+    return json_response(await sync_to_async(_cached_sales_overview)(business_ids, start, end))
+
+
+@async_api_view
+@use_replica
+async def returns_analysis(request):
+    """Same response as views.returns_analysis."""
+    rng = request.GET.get("range", "monthly").lower()
+    return await _analysis(request, lambda business_ids, today, start_date, end_date, frame, _rows:
+                           _get_returns_analysis_data(business_ids, rng, today, start_date, end_date, frame=frame))
+
+
+@async_api_view
+@use_replica
+async def revenue_profit_analysis(request):
+    """Same response as views.revenue_profit_analysis."""
+    rng = request.GET.get("range", "monthly").lower()
+    return await _analysis(request, lambda business_ids, today, start_date, end_date, frame, _rows:
+                           _get_revenue_profit_analysis_data(business_ids, rng, today, start_date, end_date, frame=frame))
+
+
+@async_api_view
+@use_replica
+async def inventory_analysis(request):
+    """Same response as views.inventory_analysis."""
+
+    def compute(business_ids, today, start_date, end_date, frame, rows):
+        data = _get_inventory_analysis_data(business_ids, today, start_date, end_date, frame=frame, rows=rows)
+        return {key: data[key] for key in ("low_stock_products", "inventory_value", "stock_movement_data")}
+
+    return await _analysis(request, compute, inventory=True)
+
+
+@async_api_view
+@use_replica
+async def customer_sales_analysis(request):
+    """Same response as views.customer_sales_analysis."""
+    rng = request.GET.get("range", "monthly").lower()
+
+    def compute(business_ids, today, start_date, end_date, frame, _rows):
+        data = _get_customer_sales_analysis_data(business_ids, rng, today, start_date, end_date, frame=frame)
+        return {key: data[key] for key in ("top_customers", "top_selling_products", "sales_trend_data")}
+
+    return await _analysis(request, compute, returns=False, customers=True)
+
+
+@async_api_view
+@use_replica
+async def analysis_batch(request):
+    """Same response as views.analysis_batch."""
+    try:
+        business_ids = await select_businesses(request)
+    except BusinessScopeError:
+        return json_response({"detail": "Invalid business id"}, status=400)
+    if business_ids is None:
+        return json_response({"detail": "No business found."}, status=400)
+
+    sections_param = request.GET.get("sections", "")
+    sections = list(dict.fromkeys(name.strip() for name in sections_param.split(",") if name.strip()))
+    sections = sections or list(ANALYSIS_SECTIONS)
+    unknown = [name for name in sections if name not in ANALYSIS_SECTIONS]
+    if unknown:
+        return json_response({"detail": f"Unknown sections: {', '.join(unknown)}. Choose from {', '.join(ANALYSIS_SECTIONS)}."}, status=400)
+    try:
+        start_date, end_date = date_range(request)
+    except ValueError as exc:
+        return json_response({"detail": str(exc)}, status=400)
+
+    today = date.today()
+    window, rng, loaded = _batch_windows(sections, request.GET.get("range", "monthly").lower(), today, start_date, end_date)
+    business_filter = _business_filter(business_ids)
+    customers = "customer-sales-analysis" in sections
+    extra = _inventory_queries(business_filter) if "inventory-analysis" in sections else ()
+    rows = await gather_queries(*extra, *SalesFrame.queries(business_filter, loaded, customers=customers))
+    frame = SalesFrame(business_filter, loaded, customers=customers, rows=rows[len(extra):])
+    data = _batch_sections(business_ids, sections, frame, window, rng, today, start_date, end_date,
+                           inventory_rows=rows[:len(extra)] or None)
+    return json_response({"range": rng, "start": str(window.start), "end": str(window.end), "sections": data})
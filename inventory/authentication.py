@@ -0,0 +1,90 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .scope import BusinessScope
+from .sharding import route
+from .tokens import BUSINESS_IDS_CLAIM, ScopedTokenUser
+
+
+class VerifiedTokenCache:
+    """
+    Thread-safe LRU of raw token -> validated token. Entries are dropped once
+    the token's `exp` has passed, so a cached token is never accepted late.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, raw_token):
+        if not self.maxsize:
+            return None
+        with self._lock:
+            token = self._entries.get(raw_token)
+            if token is None:
+                return None
+            if token.get("exp", 0) <= time.time():
+                del self._entries[raw_token]
+                return None
+            self._entries.move_to_end(raw_token)
+            return token
+
+    def set(self, raw_token, token):
+        if not self.maxsize:
+            return
+        with self._lock:
+            self._entries[raw_token] = token
+            self._entries.move_to_end(raw_token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+verified_tokens = VerifiedTokenCache(getattr(settings, "JWT_VERIFIED_TOKEN_CACHE_SIZE", 1024))
+
+
+class BusinessScopedJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that also attaches a lazily-loaded BusinessScope to the
+    request, so views share one lookup of the user's businesses.
+
+    Tokens issued with scope claims (see tokens.ScopedRefreshToken) are
+    authenticated statelessly: the user and their business ids come from the
+    token, and no database query is made. That skips the user's is_active
+    check, so these access tokens are short-lived (tokens.ScopedAccessToken)
+    and refreshing one checks the user again. Older tokens fall back to
+    loading the UserProfile. When tenants are sharded, the request's queries are
+    routed to the database of the businesses it selects.
+    """
+
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is not None:
+            user, _token = result
+            request.business_scope = BusinessScope(
+                user,
+                business_ids=getattr(user, "business_ids", None),
+                requested=request.query_params.get("business"),
+            )
+            route(request.business_scope)
+        return result
+
+    def get_validated_token(self, raw_token):
+        token = verified_tokens.get(raw_token)
+        if token is None:
+            token = super().get_validated_token(raw_token)
+            verified_tokens.set(raw_token, token)
+        return token
+
+    def get_user(self, validated_token):
+        if BUSINESS_IDS_CLAIM not in validated_token:
+            return super().get_user(validated_token)
+        return ScopedTokenUser(validated_token)
@@ -0,0 +1,152 @@
+"""
+Copying a business's product catalog into a new business (add_business's
+`copy_from_business`).
+
+copy_batch() copies with one INSERT ... SELECT per batch of source
+products, so the rows never leave the database. Products whose SKU the new
+business already has are skipped (ON CONFLICT DO NOTHING), and the count it
+reports is the rows the database inserted. Each batch is one transaction
+with one change sequence number, and records its position and counts on
+the business's CatalogCopy:
+
+- catalogs of up to settings.CATALOG_COPY_INLINE_LIMIT products are copied
+  inside the request;
+- larger ones are copied on a background thread, and GET
+  businesses/<id>/catalog-copy/ reports the progress. A copy that made no
+  progress for STALE_AFTER (its process died) is resumed by the next poll,
+  from the batch it had reached.
+
+A copy of a sharded business lives in the source's database
+(inventory.sharding), where the INSERT ... SELECT can read the source rows.
+"""
+import contextvars
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, models, transaction
+from django.db.models.constants import OnConflict
+from django.utils import timezone
+
+from . import sharding
+from .models import CatalogCopy, Product, TenantShard, allocate_change_seq, bulk_written
+
+logger = logging.getLogger(__name__)
+
+# Columns taken from the source product as they are
+COPIED_FIELDS = [
+    "product_name", "sku", "category", "current_stock", "min_stock", "max_stock", "price", "selling_price", "supplier",
+]
+
+BATCH_SIZE = 5000
+STALE_AFTER = timedelta(minutes=2)
+
+
+class CatalogCopyError(Exception):
+    pass
+
+
+def start(business, source):
+    """
+    Copy `source`'s products into the new `business`: within the call for
+    small catalogs, else on a background thread. Returns its CatalogCopy.
+    """
+    alias = sharding.shard_for(source.pk)
+    if alias != sharding.shard_for(business.pk):
+        TenantShard.objects.create(business=business, alias=alias)
+        sharding.forget()
+    total = Product.objects.using(alias).filter(business_id=source.pk).count()
+    copy = CatalogCopy.objects.create(business=business, source=source, total=total)
+    if total <= settings.CATALOG_COPY_INLINE_LIMIT:
+        run(copy)
+    else:
+        _in_background(copy)
+    return copy
+
+
+def resume_if_stale(copy):
+    """Start `copy` again if it is running but made no progress for STALE_AFTER. Returns whether it did."""
+    if copy.status != CatalogCopy.RUNNING or copy.updated_at > timezone.now() - STALE_AFTER:
+        return False
+    # Claimed by one poller: the others see updated_at changed
+    claimed = CatalogCopy.objects.filter(pk=copy.pk, updated_at=copy.updated_at).update(updated_at=timezone.now())
+    if claimed:
+        _in_background(copy)
+    return bool(claimed)
+
+
+def run(copy, batch_size=BATCH_SIZE):
+    """Copy batches until the catalog is done, marking `copy` failed (and logging why) on an error."""
+    try:
+        while copy_batch(copy, batch_size):
+            pass
+    except Exception as e:
+        logger.exception("Copying the catalog of business %s into %s failed", copy.source_id, copy.business_id)
+        CatalogCopy.objects.filter(pk=copy.pk).update(status=CatalogCopy.FAILED, error=str(e), updated_at=timezone.now())
+        copy.status, copy.error = CatalogCopy.FAILED, str(e)
+
+
+def copy_batch(copy, batch_size=BATCH_SIZE):
+    """Copy the next `batch_size` source products. Returns False once there are none left."""
+    if copy.source_id is None:
+        raise CatalogCopyError("The source business was deleted.")
+    alias = sharding.shard_for(copy.business_id)
+    if sharding.shard_for(copy.source_id) != alias:
+        raise CatalogCopyError("The source business moved to another database during the copy.")
+    source = Product.objects.using(alias).filter(business_id=copy.source_id, pk__gt=copy.last_source_id)
+    pks = list(source.order_by("pk").values_list("pk", flat=True)[:batch_size])
+    inserted = 0
+    if pks:
+        with transaction.atomic(using=alias):
+            # A range, so the SELECT doesn't carry the ids back; products added in it meanwhile are copied too
+            inserted = _insert_select(source.filter(pk__lte=pks[-1]).order_by(), copy.business_id, alias)
+            if inserted:
+                bulk_written.send(sender=Product, using=alias, pks=None, business_ids={copy.business_id}, fields=None)
+        copy.last_source_id = pks[-1]
+    more = len(pks) == batch_size
+    copy.processed += len(pks)
+    copy.copied += inserted
+    copy.status = CatalogCopy.RUNNING if more else CatalogCopy.DONE
+    copy.save(update_fields=["processed", "copied", "last_source_id", "status", "updated_at"])
+    return more
+
+
+def _insert_select(batch, business_id, alias):
+    """INSERT ... SELECT the products of `batch` as products of `business_id`. Returns the rows inserted."""
+    connection = connections[alias]
+    now = timezone.now()
+    # Every column without a default in the database, in the order of `columns`
+    values = {
+        "business_id": models.Value(business_id, output_field=models.BigIntegerField()),
+        "change_seq": models.Value(allocate_change_seq(business_id, using=alias), output_field=models.BigIntegerField()),
+        "stock_shards": models.Value(0, output_field=models.IntegerField()),
+        "created_at": models.Value(now, output_field=models.DateTimeField()),
+        "updated_at": models.Value(now, output_field=models.DateTimeField()),
+    }
+    names = {f"copy_{name}": value for name, value in values.items()}
+    select = batch.annotate(**names).values_list(*names, *COPIED_FIELDS)
+    sql, params = select.query.get_compiler(using=alias).as_sql()
+    opts = Product._meta
+    columns = [opts.get_field(name).column for name in values] + [opts.get_field(name).column for name in COPIED_FIELDS]
+    fields = [opts.get_field(name) for name in COPIED_FIELDS]
+    statement = "%s %s (%s) %s %s" % (
+        connection.ops.insert_statement(on_conflict=OnConflict.IGNORE),
+        connection.ops.quote_name(opts.db_table),
+        ", ".join(connection.ops.quote_name(column) for column in columns),
+        sql,
+        connection.ops.on_conflict_suffix_sql(fields, OnConflict.IGNORE, None, None) or "",
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(statement, params)
+        return cursor.rowcount
+
+
+def _in_background(copy):
+    def work():
+        try:
+            run(copy)
+        finally:
+            connections.close_all()
+
+    threading.Thread(target=contextvars.copy_context().run, args=(work,), daemon=True).start()
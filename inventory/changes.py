@@ -0,0 +1,167 @@
+"""
+Change feed for incremental sync: the Products, Orders and Returns written,
+and the ones deleted, after a cursor.
+
+Every tracked row carries the change sequence number of its last write in
+its business's sequence (see models.ChangeTracked), and every delete leaves a
+Tombstone. A page is the next `limit` entries in (change_seq, business,
+source, id) order. Its cursor names the last entry returned of each business,
+so a page boundary never skips or repeats a change, even when one bulk update
+gave many rows the same sequence number. Rows written before the feed existed
+all have change_seq 0 and are paged by id.
+"""
+from collections import defaultdict, namedtuple
+from heapq import merge
+from itertools import islice
+
+from django.db.models import Q
+
+from .models import Order, Product, Return, Tombstone
+from .serializers import OrderValuesSerializer, ProductValuesSerializer, ReturnValuesSerializer
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 5000
+
+# (response key, model, serializer). The position is the source's rank in a
+# cursor, so the order must not change.
+SOURCES = (
+    ("products", Product, ProductValuesSerializer),
+    ("orders", Order, OrderValuesSerializer),
+    ("returns", Return, ReturnValuesSerializer),
+)
+TOMBSTONES = len(SOURCES)
+# Cursor source rank that sorts after every source at the same sequence number
+END_OF_SEQ = TOMBSTONES + 1
+DELETE_KEYS = {"product": "products", "order": "orders", "return": "returns"}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class Position(namedtuple("Position", "seq source pk")):
+    """Position in one business's changes: the (change_seq, source rank, id) of the last entry read."""
+
+    @classmethod
+    def parse(cls, value):
+        """'N' is everything after change sequence N, 'N.S.I' everything after that entry."""
+        try:
+            numbers = [int(part) for part in value.split(".")]
+        except ValueError:
+            raise InvalidCursor(f"Invalid cursor: {value!r}")
+        if len(numbers) == 1 and numbers[0] >= 0:
+            return cls(numbers[0], END_OF_SEQ, 0)
+        if len(numbers) == 3 and numbers[0] >= 0 and 0 <= numbers[1] <= END_OF_SEQ:
+            return cls(*numbers)
+        raise InvalidCursor(f"Invalid cursor: {value!r}")
+
+    def __str__(self):
+        return f"{self.seq}.{self.source}.{self.pk}"
+
+    def after(self, source):
+        """Filter for the rows of `source` that come after this position."""
+        if source < self.source:
+            return Q(change_seq__gt=self.seq)
+        if source == self.source:
+            return Q(change_seq__gt=self.seq) | Q(change_seq=self.seq, pk__gt=self.pk)
+        return Q(change_seq__gte=self.seq)
+
+
+class Cursor:
+    """
+    Position in the feed: a Position per business ('B:N.S.I', comma
+    separated), and one for the businesses not named (a bare 'N' or 'N.S.I',
+    the cursors of the single sequence the feed had before).
+    """
+
+    def __init__(self, positions=None, default=None):
+        self.positions = dict(positions or {})
+        self.default = default
+
+    @classmethod
+    def parse(cls, value):
+        """A Cursor, or None for the start of the feed (None or '')."""
+        if value in (None, ""):
+            return None
+        cursor = cls()
+        for part in str(value).split(","):
+            business, sep, position = part.rpartition(":")
+            if not sep:
+                cursor.default = Position.parse(position)
+                continue
+            try:
+                business_id = int(business)
+            except ValueError:
+                raise InvalidCursor(f"Invalid cursor: {value!r}")
+            cursor.positions[business_id] = Position.parse(position)
+        return cursor
+
+    def __str__(self):
+        parts = [str(self.default)] if self.default is not None else []
+        parts += [f"{b}:{p}" for b, p in sorted(self.positions.items())]
+        return ",".join(parts) or str(Position(0, 0, 0))
+
+    def __eq__(self, other):
+        return isinstance(other, Cursor) and (self.positions, self.default) == (other.positions, other.default)
+
+    def position(self, business_id):
+        return self.positions.get(business_id, self.default)
+
+    def after(self, business_ids, source):
+        """Filter for the rows of `source` of `business_ids` past their positions."""
+        match, unread = Q(pk__in=[]), []
+        for business_id in business_ids:
+            position = self.position(business_id)
+            if position is None:
+                unread.append(business_id)
+            else:
+                match |= Q(business_id=business_id) & position.after(source)
+        return match | Q(business_id__in=unread) if unread else match
+
+
+def read_changes(business_ids, since=None, limit=DEFAULT_LIMIT):
+    """
+    The next `limit` changes for `business_ids` after the Cursor `since`
+    (None for a full sync):
+
+        {"cursor": str, "has_more": bool,
+         "upserts": {"products": [...], "orders": [...], "returns": [...]},
+         "deletes": {"products": [id, ...], "orders": [...], "returns": [...]}}
+
+    Upserts are current row values; a row changed several times appears once.
+    Each source is read with index range scans on (business, change_seq)
+    and the streams are merged in memory.
+    """
+    streams = []
+    for source, model in enumerate([model for _key, model, _serializer in SOURCES] + [Tombstone]):
+        qs = model.objects.filter(business_id__in=business_ids)
+        if since is not None:
+            qs = qs.filter(since.after(business_ids, source))
+        fields = ["change_seq", "business_id", "pk"] + (["kind", "object_id"] if model is Tombstone else [])
+        rows = qs.order_by("change_seq", "business_id", "pk").values_list(*fields)[:limit + 1]
+        # (seq, business, source, pk) is unique, so the trailing payload is never compared
+        streams.append([(row[0], row[1], source, row[2], row[3:]) for row in rows])
+
+    entries = list(islice(merge(*streams), limit + 1))
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    picked = defaultdict(list)
+    deletes = {key: [] for key, _model, _serializer in SOURCES}
+    cursor = Cursor(since.positions, since.default) if since is not None else Cursor()
+    for seq, business_id, source, pk, payload in entries:
+        cursor.positions[business_id] = Position(seq, source, pk)
+        if source == TOMBSTONES:
+            kind, object_id = payload
+            deletes[DELETE_KEYS[kind]].append(object_id)
+        else:
+            picked[source].append(pk)
+
+    upserts = {}
+    for source, (key, model, serializer) in enumerate(SOURCES):
+        pks = picked.get(source)
+        upserts[key] = serializer.serialize(
+            model.objects.filter(pk__in=pks).order_by("change_seq", "pk")
+        ) if pks else []
+
+    return {"cursor": str(cursor), "has_more": has_more, "upserts": upserts, "deletes": deletes}
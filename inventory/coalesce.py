@@ -0,0 +1,188 @@
+"""
+Single-flight caching with stale-while-revalidate for the analytics views
+(dashboard_metrics, sales_overview).
+
+cached() keeps a result in the "analytics" cache, which all workers share,
+together with the data version it was computed at (data_version(): the
+highest change sequence number of each business read).
+
+- A fresh entry of the current version is returned as is.
+- An entry of the current version older than `fresh` seconds is still
+  returned, and one background thread per process recomputes it; the entry is
+  dropped `stale` seconds later if nobody does.
+- Without an entry of the current version (nothing cached, or a write since)
+  the result is computed once: concurrent callers in the process wait for the
+  first one, and callers in other workers wait on a lock key in the cache
+  until the leader's result appears. A caller that has waited LOCK_TIMEOUT
+  computes the result itself.
+
+Errors are raised to the leader and its in-process followers, never cached.
+"""
+import contextvars
+import hashlib
+import logging
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.db.models import Max
+
+from . import sharding
+from .models import Order, Product, Return, Tombstone
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_CACHE = "analytics"
+
+# Longest a computation may hold its lock, and followers wait for it (seconds)
+LOCK_TIMEOUT = 30
+
+# How often a follower in another worker looks for the leader's result (seconds)
+POLL_INTERVAL = 0.05
+
+_lock = threading.Lock()
+# (key, version) -> _Flight being computed in this process
+_flights = {}
+# keys this process is refreshing in the background
+_refreshing = set()
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+def cache_key(name, *parts):
+    """Cache key of view `name` for the request `parts` (business ids, dates, ...)."""
+    digest = hashlib.sha1(repr(parts).encode()).hexdigest()
+    return f"analytics:{name}:{digest}"
+
+
+def data_version(business_ids):
+    """
+    ((business_id, highest change_seq), ...) over the products, orders,
+    returns and tombstones of `business_ids`, in one query per database they
+    live in. Every save, bulk write and delete raises its business's number.
+    """
+    version = {}
+    for seqs in sharding.fan_out(business_ids, _max_seqs):
+        for business_id, seq in seqs:
+            version[business_id] = max(version.get(business_id, 0), seq or 0)
+    return tuple(sorted(version.items()))
+
+
+def _max_seqs(business_ids):
+    per_business = [
+        model.objects.filter(business_id__in=business_ids).order_by()
+        .values("business_id").annotate(seq=Max("change_seq")).values_list("business_id", "seq")
+        for model in (Product, Order, Return, Tombstone)
+    ]
+    return list(per_business[0].union(*per_business[1:], all=True))
+
+
+def cached(key, compute, version=0, fresh=None, stale=None):
+    """compute()'s result for `key` at data `version`, from the cache when possible (see above)."""
+    fresh = settings.ANALYTICS_CACHE_FRESH if fresh is None else fresh
+    stale = settings.ANALYTICS_CACHE_STALE if stale is None else stale
+    entry = caches[ANALYTICS_CACHE].get(key)
+    if entry is not None and entry[1] == version:
+        value, _version, fresh_until = entry
+        if time.time() >= fresh_until:
+            _refresh_in_background(key, compute, version, fresh, stale)
+        return value
+    return _single_flight(key, compute, version, fresh, stale)
+
+
+def _store(key, value, version, fresh, stale):
+    caches[ANALYTICS_CACHE].set(key, (value, version, time.time() + fresh), fresh + stale)
+    return value
+
+
+def _cached_value(key, version):
+    entry = caches[ANALYTICS_CACHE].get(key)
+    if entry is not None and entry[1] == version:
+        return entry
+    return None
+
+
+def _single_flight(key, compute, version, fresh, stale):
+    """Compute once per process; the first caller leads and the others wait for its result."""
+    with _lock:
+        flight = _flights.get((key, version))
+        leader = flight is None
+        if leader:
+            flight = _flights[(key, version)] = _Flight()
+    if not leader:
+        if not flight.done.wait(LOCK_TIMEOUT):
+            return compute()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+    try:
+        flight.value = _compute_once(key, compute, version, fresh, stale)
+        return flight.value
+    except Exception as error:
+        flight.error = error
+        raise
+    finally:
+        with _lock:
+            del _flights[(key, version)]
+        flight.done.set()
+
+
+def _compute_once(key, compute, version, fresh, stale):
+    """Compute once across workers: whoever takes the lock key computes, the others poll for its result."""
+    cache = caches[ANALYTICS_CACHE]
+    lock_key, token = f"{key}:lock", uuid.uuid4().hex
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while not cache.add(lock_key, token, LOCK_TIMEOUT):
+        entry = _cached_value(key, version)
+        if entry is not None:
+            return entry[0]
+        if time.monotonic() >= deadline:
+            return compute()
+        time.sleep(POLL_INTERVAL)
+    try:
+        # The previous lock holder may have stored it just before letting go
+        entry = _cached_value(key, version)
+        if entry is not None:
+            return entry[0]
+        return _store(key, compute(), version, fresh, stale)
+    finally:
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+
+
+def _refresh_in_background(key, compute, version, fresh, stale):
+    """Recompute a stale entry on a thread, unless this process or another worker already is."""
+    with _lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+    cache = caches[ANALYTICS_CACHE]
+    lock_key, token = f"{key}:lock", uuid.uuid4().hex
+
+    def refresh():
+        try:
+            if cache.add(lock_key, token, LOCK_TIMEOUT):
+                try:
+                    _store(key, compute(), version, fresh, stale)
+                finally:
+                    if cache.get(lock_key) == token:
+                        cache.delete(lock_key)
+        except Exception:
+            # The stale entry stays until it expires; the next request after that computes it
+            logger.exception("Refreshing %s failed", key)
+        finally:
+            with _lock:
+                _refreshing.discard(key)
+            connections.close_all()
+
+    # The request's context, so compute() reads from the same database (see replica.use_replica)
+    context = contextvars.copy_context()
+    threading.Thread(target=context.run, args=(refresh,), daemon=True).start()
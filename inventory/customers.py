@@ -0,0 +1,233 @@
+"""
+The Customer dimension: one row per business and normalised customer name.
+
+Orders and returns still carry the customer_name they were entered with; the
+receivers below point their `customer` at the Customer of its normalised form
+(normalize(): Unicode-compatibility folded, whitespace collapsed,
+case-folded), creating it on first use, so spelling variants of one name
+share a customer.
+
+A customer's lifetime_revenue, order_count and last_order_date cover its
+orders, hot and archived. Every save and delete of an Order applies its
+change to them as a delta. Revenue is the quantity times the product's
+selling price at the time of the write, like the analysis views value it at
+the current price; rebuild_totals() revalues a customer at today's prices.
+Bulk writes (models.bulk_written) rebuild the totals of the customers they
+touch. manage.py backfill_customers links the rows written before the
+customer FK existed and rebuilds every total.
+"""
+import re
+import unicodedata
+from collections import defaultdict
+
+from django.db import router
+from django.db.models import F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import ArchivedOrder, Customer, Order, Return, bulk_written
+from .snapshots import prices
+
+# Attributes of an order that its customer's totals depend on
+TOTAL_ATTRS = ("customer_id", "business_id", "product_name", "quantity", "date")
+TOTAL_FIELDS = {"customer", "customer_id", "customer_name", "business", "business_id", "product_name", "quantity", "date"}
+
+# Fields that decide which customer a row belongs to
+NAME_FIELDS = {"customer_name", "business", "business_id"}
+
+# Customers whose totals rebuild_totals() recomputes per batch of queries
+BATCH_SIZE = 500
+
+_spaces = re.compile(r"\s+")
+_as_date = Order._meta.get_field("date").to_python
+_max_length = Customer._meta.get_field("normalized_name").max_length
+
+
+def normalize(name):
+    """The form of a customer name that tells customers apart."""
+    return _spaces.sub(" ", unicodedata.normalize("NFKC", name or "")).strip().casefold()[:_max_length]
+
+
+def resolve(business_id, names, using=None):
+    """
+    {normalised name: customer id} for the customer `names` of a business,
+    creating the customers that don't exist yet (named by their first spelling).
+    """
+    using = using or router.db_for_write(Customer)
+    spellings = {}
+    for name in names:
+        spellings.setdefault(normalize(name), name)
+    customers = Customer.objects.using(using).filter(business_id=business_id)
+    ids = dict(customers.filter(normalized_name__in=list(spellings)).values_list("normalized_name", "pk"))
+    missing = [key for key in spellings if key not in ids]
+    if missing:
+        # An upsert, so a customer another writer created meanwhile comes back with its id (and first spelling)
+        created = Customer.objects.using(using).bulk_create(
+            [Customer(business_id=business_id, name=spellings[key], normalized_name=key) for key in missing],
+            update_conflicts=True, unique_fields=["business", "normalized_name"], update_fields=["normalized_name"],
+        )
+        ids.update((customer.normalized_name, customer.pk) for customer in created)
+    return ids
+
+
+def assign(model, rows, using=None):
+    """
+    Point the `rows` of `model` (a queryset of Order, Return or their archived
+    counterparts) at their customers. Returns the ids of the customers assigned.
+    """
+    using = using or router.db_for_write(model)
+    names = defaultdict(lambda: defaultdict(list))
+    for pk, business_id, name in rows.using(using).values_list("pk", "business_id", "customer_name"):
+        if business_id is not None:
+            names[business_id][name].append(pk)
+    assigned = set()
+    for business_id, pks_by_name in names.items():
+        ids = resolve(business_id, pks_by_name, using)
+        pks_by_customer = defaultdict(list)
+        for name, pks in pks_by_name.items():
+            pks_by_customer[ids[normalize(name)]] += pks
+        # Plain UPDATEs: linking a row to its customer is not a change the feed sends
+        for customer_id, pks in pks_by_customer.items():
+            model._base_manager.using(using).filter(pk__in=pks).update(customer_id=customer_id)
+        assigned.update(pks_by_customer)
+    return assigned
+
+
+def rebuild_totals(customer_ids, using=None):
+    """Recompute the totals of `customer_ids` from their hot and archived orders at today's prices."""
+    using = using or router.db_for_write(Customer)
+    customer_ids = list(customer_ids)
+    for start in range(0, len(customer_ids), BATCH_SIZE):
+        batch = customer_ids[start:start + BATCH_SIZE]
+        totals = {pk: [0, 0, None] for pk in batch}
+        quantities = []
+        for model in (Order, ArchivedOrder):
+            quantities += (
+                model.objects.using(using).filter(customer_id__in=batch)
+                .values_list("customer_id", "business_id", "product_name", "quantity", "date")
+            )
+        price = prices({(business_id, name) for _, business_id, name, _, _ in quantities}, using) if quantities else {}
+        for customer_id, business_id, name, quantity, day in quantities:
+            total = totals[customer_id]
+            total[0] += quantity * price.get((business_id, name), (0, 0))[0]
+            total[1] += 1
+            total[2] = day if total[2] is None or day > total[2] else total[2]
+        customers = list(Customer.objects.using(using).filter(pk__in=batch).only("pk"))
+        for customer in customers:
+            customer.lifetime_revenue, customer.order_count, customer.last_order_date = totals[customer.pk]
+        Customer.objects.using(using).bulk_update(customers, ["lifetime_revenue", "order_count", "last_order_date"])
+
+
+def _last_order_date():
+    """The date of a customer's latest order, hot or archived, as an expression."""
+    hot, archived = (
+        Subquery(model.objects.filter(customer_id=OuterRef("pk")).order_by("-date").values("date")[:1])
+        for model in (Order, ArchivedOrder)
+    )
+    # GREATEST() is NULL when either side is on some databases
+    return Greatest(Coalesce(hot, archived), Coalesce(archived, hot))
+
+
+def _apply(changes, using):
+    """
+    Apply (customer_id, business_id, product_name, quantity, date, sign)
+    changes of orders to their customers' totals; sign -1 takes one away.
+    """
+    changes = [change for change in changes if change[0] is not None and change[1] is not None]
+    if not changes:
+        return
+    price = prices({(business_id, name) for _, business_id, name, *_ in changes}, using)
+    deltas = defaultdict(lambda: [0, 0, [], False])
+    for customer_id, business_id, name, quantity, day, sign in changes:
+        delta = deltas[customer_id]
+        delta[0] += sign * quantity * price.get((business_id, name), (0, 0))[0]
+        delta[1] += sign
+        if sign > 0:
+            delta[2].append(day)
+        else:
+            delta[3] = True
+    for customer_id, (revenue, count, dates, removed) in deltas.items():
+        if removed:
+            # The row is written already, so the latest remaining order says it
+            last_order_date = _last_order_date()
+        else:
+            day = Value(max(_as_date(d) for d in dates))
+            last_order_date = Greatest(Coalesce(F("last_order_date"), day), day)
+        Customer.objects.using(using).filter(pk=customer_id).update(
+            lifetime_revenue=F("lifetime_revenue") + revenue,
+            order_count=F("order_count") + count,
+            last_order_date=last_order_date,
+        )
+
+
+@receiver(pre_save, sender=Order, dispatch_uid="order_customer")
+@receiver(pre_save, sender=Return, dispatch_uid="return_customer")
+def customer_assigned(sender, instance, using, update_fields, raw, **kwargs):
+    if raw or instance.business_id is None:
+        return
+    if update_fields is not None and not NAME_FIELDS & set(update_fields):
+        return
+    key = normalize(instance.customer_name)
+    loaded = getattr(instance, "_loaded", {})
+    if instance.customer_id is not None:
+        if instance.customer_id != loaded.get("customer_id"):
+            # Set by the caller
+            return
+        if loaded.get("business_id") == instance.business_id and normalize(loaded.get("customer_name")) == key:
+            return
+    order = instance.order if sender is Return and Return.order.is_cached(instance) else None
+    if (
+        order is not None and order.customer_id is not None and order.business_id == instance.business_id
+        and normalize(order.customer_name) == key
+    ):
+        instance.customer_id = order.customer_id
+    else:
+        instance.customer_id = resolve(instance.business_id, [instance.customer_name], using)[key]
+    if update_fields is not None and "customer" not in update_fields:
+        # Not part of this save's UPDATE, so written on its own
+        sender._base_manager.using(using).filter(pk=instance.pk).update(customer_id=instance.customer_id)
+
+
+@receiver(post_save, sender=Order, dispatch_uid="order_customer")
+def order_saved(sender, instance, created, using, update_fields, **kwargs):
+    if update_fields is not None and not TOTAL_FIELDS & set(update_fields):
+        return
+    new = tuple(getattr(instance, attr) for attr in TOTAL_ATTRS)
+    changes = [(*new, 1)]
+    if not created:
+        loaded = getattr(instance, "_loaded", {})
+        if any(attr not in loaded for attr in TOTAL_ATTRS):
+            # Saved without being loaded: what it replaced is unknown
+            rebuild_totals({instance.customer_id} - {None}, using)
+            return
+        old = tuple(loaded[attr] for attr in TOTAL_ATTRS)
+        if old == new:
+            return
+        changes.append((*old, -1))
+    _apply(changes, using)
+
+
+@receiver(post_delete, sender=Order, dispatch_uid="order_customer")
+def order_deleted(sender, instance, using, **kwargs):
+    _apply([(*(getattr(instance, attr) for attr in TOTAL_ATTRS), -1)], using)
+
+
+@receiver(bulk_written, sender=Order, dispatch_uid="order_customer")
+@receiver(bulk_written, sender=Return, dispatch_uid="return_customer")
+def rows_bulk_written(sender, using, business_ids, pks, fields, **kwargs):
+    fields = None if fields is None else set(fields)
+    watched = TOTAL_FIELDS if sender is Order else NAME_FIELDS
+    if fields is not None and not watched & fields:
+        return
+    renamed = fields is not None and bool(NAME_FIELDS & fields)
+    rows = sender.objects.using(using).filter(pk__in=pks) if pks is not None else sender.objects.using(using).filter(business_id__in=business_ids)
+    # An update has not moved the rows' customer yet: these are the customers they leave
+    before = set(rows.exclude(customer=None).values_list("customer_id", flat=True).distinct()) if sender is Order else set()
+    assigned = assign(sender, rows if renamed else rows.filter(customer__isnull=True), using)
+    if sender is not Order:
+        return
+    if pks is None or {"customer", "customer_id"} & (fields or set()):
+        # Which customers the rows left is unknown
+        before |= set(Customer.objects.using(using).filter(business_id__in=business_ids).values_list("pk", flat=True))
+    rebuild_totals(before | assigned, using)
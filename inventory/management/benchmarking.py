@@ -0,0 +1,71 @@
+"""
+Helpers shared by the bench_* management commands.
+
+Benchmarks run against a throwaway database created the same way the test
+runner creates one, so they never touch the configured database's data.
+"""
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import connection
+
+from ..models import Business, Order, Product, Return, UserProfile
+
+
+@contextmanager
+def scratch_database(verbosity=0):
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+
+
+def timed(fn, repeat=3):
+    """Best wall-clock time of `repeat` calls, and the last result."""
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def seed_business(products=100, orders=1000, return_every=10, days=365, customers=200, username="bench", batch_size=5000):
+    """
+    Create a user and business with `products` products and `orders` orders
+    spread over the last `days` days; every `return_every`-th order is returned.
+    """
+    user = UserProfile.objects.create_user(username=username, password="Bench123", full_name="Bench", role="admin")
+    business = Business.objects.create(owner=user, business_name=f"{username} shop")
+    categories = [c for c, _label in Product.CATEGORY_CHOICES]
+    Product.objects.bulk_create([
+        Product(
+            business=business, product_name=f"Product {i}", sku=f"SKU-{i}", category=categories[i % len(categories)],
+            current_stock=1000 + i, min_stock=50, max_stock=5000,
+            price=Decimal(100 + i % 900) / 4, selling_price=Decimal(150 + i % 900) / 4, supplier="Bench supplier",
+        )
+        for i in range(products)
+    ], batch_size=batch_size)
+
+    today = date.today()
+    for start in range(0, orders, batch_size):
+        stop = min(start + batch_size, orders)
+        created = Order.objects.bulk_create([
+            Order(
+                business=business, order_id=f"ORD-{i}", tracking_id=f"TRK-{i}", product_name=f"Product {i % products}",
+                quantity=1 + i % 5, customer_name=f"Customer {i % customers}",
+                date=today - timedelta(days=i % days), is_returned=(i % return_every == 0),
+            )
+            for i in range(start, stop)
+        ])
+        Return.objects.bulk_create([
+            Return(business=business, order=o, product_name=o.product_name, customer_name=o.customer_name,
+                   quantity=1, date=o.date)
+            for o in created if o.is_returned
+        ])
+    return user, business
@@ -0,0 +1,54 @@
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import archive, sharding
+from ...models import Order
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise CommandError(f"Invalid date {value!r}. Use YYYY-MM-DD.")
+
+
+class Command(BaseCommand):
+    help = (
+        "Move orders older than --days (settings.ARCHIVE_AFTER_DAYS) and their returns into the archive "
+        "tables. Analytics keep seeing them through daily summaries; restore_orders brings them back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=settings.ARCHIVE_AFTER_DAYS, help="Keep this many days hot.")
+        parser.add_argument("--before", help="Archive orders dated before YYYY-MM-DD instead of using --days.")
+        parser.add_argument("--business", type=int, action="append", help="Only this business id (repeatable).")
+        parser.add_argument("--batch-size", type=int, default=archive.DEFAULT_BATCH_SIZE)
+        parser.add_argument("--dry-run", action="store_true", help="Count what would be archived.")
+
+    def handle(self, *args, **options):
+        if options["before"]:
+            cutoff = parse_date(options["before"])
+        elif options["days"] < 1:
+            raise CommandError("--days must be at least 1.")
+        else:
+            cutoff = date.today() - timedelta(days=options["days"])
+        if cutoff > date.today():
+            raise CommandError("The cutoff can't be in the future.")
+
+        for alias in sharding.databases():
+            with sharding.use_shard(alias):
+                self.archive(alias, cutoff, options)
+
+    def archive(self, alias, cutoff, options):
+        where = f" in {alias!r}" if sharding.sharded() else ""
+        if options["dry_run"]:
+            count = archive.archivable_orders(cutoff, options["business"]).count()
+            self.stdout.write(f"{count} of {Order.objects.count()} orders{where} are dated before {cutoff} and can be archived.")
+            return
+        orders, returns = archive.archive(cutoff, options["business"], batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {orders} orders and {returns} returns dated before {cutoff}{where}; "
+            f"{Order.objects.count()} orders remain."
+        ))
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from ... import customers, sharding
+from ...models import ArchivedOrder, ArchivedReturn, Customer, Order, Return
+
+
+class Command(BaseCommand):
+    help = (
+        "Link the orders and returns, hot and archived, that have no customer yet to the Customer of their "
+        "normalised customer_name, one transaction per batch, then recompute every customer's totals."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--business", type=int, action="append", help="Only this business id (repeatable).")
+        parser.add_argument("--batch-size", type=int, default=customers.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        if batch_size < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        for alias in sharding.databases():
+            self.backfill(alias, batch_size, options)
+
+    def backfill(self, using, batch_size, options):
+        for model in (Order, Return, ArchivedOrder, ArchivedReturn):
+            rows = model._base_manager.using(using).filter(customer__isnull=True, business__isnull=False)
+            if options["business"]:
+                rows = rows.filter(business_id__in=options["business"])
+            pks = list(rows.order_by("pk").values_list("pk", flat=True))
+            for start in range(0, len(pks), batch_size):
+                with transaction.atomic(using=using):
+                    # Filtered again: a save may have linked some since
+                    customers.assign(model, rows.filter(pk__in=pks[start:start + batch_size]), using)
+            self.stdout.write(f"Linked {len(pks)} {model._meta.verbose_name_plural}.")
+
+        linked = Customer.objects.using(using).order_by("pk")
+        if options["business"]:
+            linked = linked.filter(business_id__in=options["business"])
+        customer_ids = list(linked.values_list("pk", flat=True))
+        for start in range(0, len(customer_ids), batch_size):
+            with transaction.atomic(using=using):
+                customers.rebuild_totals(customer_ids[start:start + batch_size], using)
+        self.stdout.write(self.style.SUCCESS(f"Recomputed the totals of {len(customer_ids)} customers."))
@@ -0,0 +1,80 @@
+from collections import OrderedDict, defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from ...models import Order, Product, Return
+from ...views import _get_revenue_profit_analysis_data, add_months
+from ..benchmarking import scratch_database, seed_business, timed
+
+
+def decimal_revenue_profit(business, rng, today):
+    """
+    Reference: the per-row Decimal implementation _get_revenue_profit_analysis_data
+    used before money moved to integer paise (monthly and yearly windows only).
+    """
+    if rng == "yearly":
+        start = add_months(date(today.year, today.month, 1), -11)
+        labels = [add_months(start, i).strftime("%Y-%m") for i in range(12)]
+        def label_for(d): return d.strftime("%Y-%m")
+    else:
+        start = today - timedelta(days=29)
+        labels = [(start + timedelta(days=i)).isoformat() for i in range(30)]
+        def label_for(d): return d.isoformat()
+
+    products = Product.objects.filter(business=business).only("product_name", "selling_price", "price", "category")
+    orders = list(Order.objects.filter(business=business, date__gte=start, date__lte=today))
+    returns = list(Return.objects.filter(business=business, date__gte=start, date__lte=today))
+    sp_map = {p.product_name: Decimal(str(p.selling_price)) for p in products}
+    cp_map = {p.product_name: Decimal(str(p.price)) for p in products}
+    cat_map = {p.product_name: p.category for p in products}
+
+    product_data = defaultdict(lambda: {"revenue": Decimal("0.00"), "cost": Decimal("0.00")})
+    growth = OrderedDict((k, Decimal("0.00")) for k in labels)
+    profit = defaultdict(lambda: defaultdict(Decimal))
+    for sign, rows in ((1, orders), (-1, returns)):
+        for row in rows:
+            name = row.product_name
+            if row.quantity and name in sp_map:
+                quantity = Decimal(str(row.quantity))
+                product_data[name]["revenue"] += sign * sp_map[name] * quantity
+                if sign > 0:
+                    product_data[name]["cost"] += cp_map[name] * quantity
+                growth[label_for(row.date)] += sign * sp_map[name] * quantity
+                profit[cat_map[name]][name] += sign * (sp_map[name] - cp_map[name]) * quantity
+
+    revenue_cost_data = [{"product_name": k, "revenue": float(v["revenue"]), "cost": float(v["cost"])}
+                         for k, v in product_data.items() if v["revenue"] > 0]
+    revenue_cost_data.sort(key=lambda x: x["revenue"], reverse=True)
+    profit_category_data = [
+        {"category": category, **{p: float(v) for p, v in per_product.items() if v > 0}}
+        for category, per_product in profit.items() if any(v > 0 for v in per_product.values())
+    ]
+    return {
+        "revenue_cost_data": revenue_cost_data,
+        "revenue_growth_data": [{"label": k, "revenue": float(v)} for k, v in growth.items()],
+        "profit_category_data": profit_category_data,
+        "range": rng,
+    }
+
+
+class Command(BaseCommand):
+    help = "Time _get_revenue_profit_analysis_data against the per-row Decimal reference implementation."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orders", type=int, nargs="+", default=[10_000, 100_000])
+        parser.add_argument("--products", type=int, default=500)
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **options):
+        today = date.today()
+        self.stdout.write(f"{'orders':>8} {'range':<8} {'Decimal':>9} {'current':>9} {'x':>6}")
+        for orders in options["orders"]:
+            with scratch_database():
+                _user, business = seed_business(products=options["products"], orders=orders)
+                for rng in ("monthly", "yearly"):
+                    t_ref, expected = timed(lambda: decimal_revenue_profit(business, rng, today), options["repeat"])
+                    t_new, actual = timed(lambda: _get_revenue_profit_analysis_data(business, rng, today), options["repeat"])
+                    assert actual == expected, f"results differ for {rng}"
+                    self.stdout.write(f"{orders:>8} {rng:<8} {t_ref:>8.3f}s {t_new:>8.3f}s {t_ref / t_new:>5.1f}x")
@@ -0,0 +1,111 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+
+from ...tokens import ScopedRefreshToken
+from ..benchmarking import scratch_database, seed_business
+
+# (sync url name, async url name)
+ENDPOINTS = [
+    ("dashboard_metrics", "async-dashboard"),
+    ("revenue-profit-analysis", "async-revenue-profit-analysis"),
+    ("analysis-batch", "async-analysis-batch"),
+]
+
+
+def summarize(latencies, wall):
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    return len(latencies) / wall, statistics.median(latencies), p95
+
+
+def run_wsgi(path, headers, requests, concurrency):
+    """`requests` GETs through the WSGI handler from `concurrency` threads, like one gthread worker."""
+
+    def one(_):
+        client = Client()
+        start = time.perf_counter()
+        response = client.get(path, headers=headers)
+        assert response.status_code == 200, response.content
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        latencies = list(pool.map(one, range(requests)))
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def run_asgi(path, headers, requests, concurrency):
+    """`requests` GETs through the ASGI handler, `concurrency` at a time on one event loop, like one uvicorn worker."""
+
+    async def main():
+        client = AsyncClient()
+        slots = asyncio.Semaphore(concurrency)
+
+        async def one():
+            async with slots:
+                start = time.perf_counter()
+                response = await client.get(path, headers=headers)
+                assert response.status_code == 200, response.content
+                return time.perf_counter() - start
+
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(one() for _ in range(requests)))
+        return summarize(latencies, time.perf_counter() - start)
+
+    return asyncio.run(main())
+
+
+class Command(BaseCommand):
+    help = (
+        "Throughput and latency of the sync dashboard/analysis views under WSGI threads against "
+        "their /api/async/ versions under ASGI, at several concurrency levels."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orders", type=int, default=20_000)
+        parser.add_argument("--products", type=int, default=500)
+        parser.add_argument("--requests", type=int, default=64)
+        parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+        parser.add_argument(
+            "--db-latency-ms", type=float, default=0.0,
+            help="Added to every query to mimic a networked database (SQLite has no round trip).",
+        )
+
+    def handle(self, *args, **options):
+        delay = options["db_latency_ms"] / 1000
+
+        def add_latency(execute, sql, params, many, context):
+            time.sleep(delay)
+            return execute(sql, params, many, context)
+
+        def on_connect(sender, connection, **kwargs):
+            connection.execute_wrappers.append(add_latency)
+
+        # The test clients send Host: testserver
+        with scratch_database(), override_settings(ALLOWED_HOSTS=["testserver"]):
+            user, _business = seed_business(products=options["products"], orders=options["orders"])
+            headers = {"Authorization": f"Bearer {ScopedRefreshToken.for_user(user).access_token}"}
+            if delay:
+                connection.execute_wrappers.append(add_latency)
+                connection_created.connect(on_connect)
+            try:
+                self.stdout.write(f"{'endpoint':<26} {'conc':>4} {'server':<5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8}")
+                for sync_name, async_name in ENDPOINTS:
+                    for concurrency in options["concurrency"]:
+                        for server, name, run in (("wsgi", sync_name, run_wsgi), ("asgi", async_name, run_asgi)):
+                            rate, p50, p95 = run(reverse(name), headers, options["requests"], concurrency)
+                            self.stdout.write(
+                                f"{sync_name:<26} {concurrency:>4} {server:<5} {rate:>8.1f} {p50 * 1000:>8.1f} {p95 * 1000:>8.1f}"
+                            )
+            finally:
+                connection_created.disconnect(on_connect)
+                if add_latency in connection.execute_wrappers:
+                    connection.execute_wrappers.remove(add_latency)
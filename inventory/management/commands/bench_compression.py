@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from ... import views
+from ...middleware import available_encodings, compress
+from ..benchmarking import scratch_database, seed_business
+
+ENDPOINTS = [
+    ("product_list", views.product_list),
+    ("orders_list", views.orders_list),
+    ("returns_list", views.returns_list),
+    ("sales-overview-report", views.sales_overview_report),
+    ("returns-analysis-report", views.returns_analysis_report),
+    ("revenue-profit-analysis-report", views.revenue_profit_analysis_report),
+    ("inventory-analysis-report", views.inventory_analysis_report),
+    ("customer-sales-analysis-report", views.customer_sales_analysis_report),
+]
+
+LEVELS = {"gzip": (1, 6, 9), "br": (4, 5, 11)}
+
+
+def cpu_time(fn, repeat):
+    """Best process CPU time of `repeat` calls, and the last result."""
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.process_time()
+        result = fn()
+        elapsed = time.process_time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+class Command(BaseCommand):
+    help = "Bytes saved and CPU cost of response compression for the largest list and report endpoints."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orders", type=int, default=20_000)
+        parser.add_argument("--products", type=int, default=2_000)
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        with scratch_database():
+            user, business = seed_business(products=options["products"], orders=options["orders"])
+            self.stdout.write(f"{'endpoint':<32} {'coding':<8} {'bytes':>11} {'ratio':>6} {'cpu':>9} {'MB/s':>7}")
+            for name, view in ENDPOINTS:
+                request = factory.get("/", {"business": business.id, "range": "1y"})
+                force_authenticate(request, user=user)
+                response = view(request)
+                if hasattr(response, "render"):
+                    response.render()
+                body = response.content
+                self.stdout.write(f"{name:<32} {'identity':<8} {len(body):>11,} {1:>6.2f}")
+                for encoding in available_encodings():
+                    for level in LEVELS[encoding]:
+                        cpu, compressed = cpu_time(lambda: compress(encoding, body, level), options["repeat"])
+                        self.stdout.write(
+                            f"{'':<32} {f'{encoding}-{level}':<8} {len(compressed):>11,}"
+                            f" {len(body) / len(compressed):>6.2f} {cpu * 1000:>7.1f}ms"
+                            f" {len(body) / 1e6 / max(cpu, 1e-9):>7.0f}"
+                        )
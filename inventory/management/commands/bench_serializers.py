@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from ...models import Order, Product, Return
+from ...renderers import FastJSONRenderer
+from ...serializers import (
+    OrderSerializer, OrderValuesSerializer, ProductSerializer, ProductValuesSerializer,
+    ReturnSerializer, ReturnValuesSerializer,
+)
+from ..benchmarking import scratch_database, seed_business, timed
+
+
+class Command(BaseCommand):
+    help = "Compare ModelSerializer(many=True) + JSONRenderer with the values() read path + FastJSONRenderer."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **options):
+        cases = [
+            ("orders", Order, OrderSerializer, OrderValuesSerializer, None),
+            ("returns", Return, ReturnSerializer, ReturnValuesSerializer, "order"),
+            ("products", Product, ProductSerializer, ProductValuesSerializer, None),
+        ]
+        self.stdout.write(f"{'rows':>8} {'list':<9} {'serializer':>11} {'values()':>9} {'x':>6}"
+                          f" {'DRF json':>9} {'fast json':>9} {'x':>6}")
+        for rows in options["rows"]:
+            with scratch_database():
+                # Products get as many rows as orders so every list is `rows` long
+                seed_business(products=rows, orders=rows, return_every=1)
+                for name, model, serializer_class, values_class, related in cases:
+                    qs = model.objects.all()
+                    if related:
+                        qs = qs.select_related(related)
+                    t_slow, slow = timed(lambda: serializer_class(qs.all(), many=True).data, options["repeat"])
+                    t_fast, fast = timed(lambda: values_class.serialize(model.objects.all()), options["repeat"])
+                    assert list(map(dict, slow)) == fast
+                    t_json, _ = timed(lambda: JSONRenderer().render(fast), options["repeat"])
+                    t_orjson, _ = timed(lambda: FastJSONRenderer().render(fast), options["repeat"])
+                    self.stdout.write(
+                        f"{rows:>8} {name:<9} {t_slow:>10.3f}s {t_fast:>8.3f}s {t_slow / t_fast:>5.1f}x"
+                        f" {t_json:>8.3f}s {t_orjson:>8.3f}s {t_json / t_orjson:>5.1f}x"
+                    )
@@ -0,0 +1,120 @@
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from ...sqlite import set_journal_mode
+from ...tokens import ScopedRefreshToken
+from ..benchmarking import scratch_database, seed_business
+
+# mode -> (connection OPTIONS, journal mode). Django's own SQLite behaviour:
+# rollback journal, synchronous=FULL, DEFERRED transactions and a 5 second
+# busy timeout
+MODES = {
+    "default": ({}, "DELETE"),
+    "tuned": (settings.SQLITE_OPTIONS, settings.SQLITE_JOURNAL_MODE),
+}
+
+
+def run_mix(user, products, threads, duration, write_ratio):
+    """
+    `threads` clients, each entering orders (add_edit_order) or reading the
+    dashboard for `duration` seconds. Returns {kind: (latencies of successful
+    requests, latencies of failed ones)} for kinds "write" and "read".
+    """
+    headers = {"Authorization": f"Bearer {ScopedRefreshToken.for_user(user).access_token}"}
+    results = {kind: ([], []) for kind in ("write", "read")}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client_loop(n):
+        client = APIClient(headers=headers, raise_request_exception=False)
+        rng = random.Random(n)
+        i = 0
+        try:
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                if rng.random() < write_ratio:
+                    kind = "write"
+                    response = client.post(reverse("add_edit_order"), {
+                        "order_id": f"BENCH-{n}-{i}", "product_name": rng.choice(products),
+                        "quantity": 1, "customer_name": "Walk-in", "date": date.today().isoformat(),
+                    }, format="json")
+                    ok = response.status_code == 201
+                else:
+                    kind = "read"
+                    ok = client.get(reverse("dashboard_metrics")).status_code == 200
+                elapsed = time.perf_counter() - start
+                with lock:
+                    results[kind][0 if ok else 1].append(elapsed)
+                i += 1
+        finally:
+            connections.close_all()
+
+    workers = [threading.Thread(target=client_loop, args=(n,)) for n in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return results
+
+
+def p95(latencies):
+    latencies = sorted(latencies)
+    return latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else 0.0
+
+
+class Command(BaseCommand):
+    help = (
+        "Throughput of concurrent order entry and dashboard reads on a SQLite file, with Django's "
+        "default SQLite settings against settings.SQLITE_OPTIONS and SQLITE_JOURNAL_MODE (WAL, BEGIN IMMEDIATE, ...)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orders", type=int, default=5_000)
+        parser.add_argument("--products", type=int, default=100)
+        parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 16])
+        parser.add_argument("--duration", type=float, default=5.0, help="Seconds per run.")
+        parser.add_argument("--write-ratio", type=float, default=0.3)
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("bench_sqlite needs a SQLite default database.")
+        test_settings = connection.settings_dict.setdefault("TEST", {})
+        old_test_name, old_options = test_settings.get("NAME"), connection.settings_dict["OPTIONS"]
+        self.stdout.write(
+            f"{'mode':<8} {'threads':>7} {'writes/s':>9} {'reads/s':>8} {'failed':>7} "
+            f"{'write p95 ms':>12} {'read p95 ms':>11}"
+        )
+        try:
+            for mode, (sqlite_options, journal_mode) in MODES.items():
+                with tempfile.TemporaryDirectory() as tmp:
+                    # A file, not the test runner's in-memory database: locking is what's measured
+                    test_settings["NAME"] = os.path.join(tmp, "bench.sqlite3")
+                    connection.settings_dict["OPTIONS"] = dict(sqlite_options)
+                    connection.close()
+                    with scratch_database(), override_settings(ALLOWED_HOSTS=["testserver"]):
+                        set_journal_mode(connection, journal_mode)
+                        user, business = seed_business(products=options["products"], orders=options["orders"])
+                        products = list(business.products.values_list("product_name", flat=True))
+                        connection.close()
+                        for threads in options["threads"]:
+                            results = run_mix(user, products, threads, options["duration"], options["write_ratio"])
+                            (writes, failed_writes), (reads, failed_reads) = results["write"], results["read"]
+                            self.stdout.write(
+                                f"{mode:<8} {threads:>7} {len(writes) / options['duration']:>9.1f} "
+                                f"{len(reads) / options['duration']:>8.1f} {len(failed_writes) + len(failed_reads):>7} "
+                                f"{p95(writes + failed_writes) * 1000:>12.1f} {p95(reads + failed_reads) * 1000:>11.1f}"
+                            )
+        finally:
+            test_settings["NAME"] = old_test_name
+            connection.settings_dict["OPTIONS"] = old_options
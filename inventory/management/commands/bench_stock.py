@@ -0,0 +1,125 @@
+import os
+import tempfile
+import threading
+import time
+from contextlib import ExitStack
+from datetime import date
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.db.models import Sum
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from ... import stock
+from ...models import Business, Order, Product, StockShard, UserProfile
+from ...tokens import ScopedRefreshToken
+from ..benchmarking import scratch_database
+
+STARTING_STOCK = 10_000_000
+
+
+def run_orders(user, businesses, threads, duration):
+    """
+    `threads` clients ordering the hot product of one of `businesses` (in
+    turn) for `duration` seconds. Returns (latencies of orders taken,
+    latencies of the ones refused).
+    """
+    headers = {"Authorization": f"Bearer {ScopedRefreshToken.for_user(user).access_token}"}
+    taken, refused = [], []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client_loop(n):
+        client = APIClient(headers=headers, raise_request_exception=False)
+        business = businesses[n % len(businesses)]
+        i = 0
+        try:
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                response = client.post(reverse("add_edit_order") + f"?business={business.pk}", {
+                    "order_id": f"HOT-{n}-{i}", "product_name": "Hot", "quantity": 1,
+                    "customer_name": f"Customer {i % 50}", "date": date.today().isoformat(),
+                }, format="json")
+                elapsed = time.perf_counter() - start
+                with lock:
+                    (taken if response.status_code == 201 else refused).append(elapsed)
+                i += 1
+        finally:
+            connections.close_all()
+
+    workers = [threading.Thread(target=client_loop, args=(n,)) for n in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return taken, refused
+
+
+def p95(latencies):
+    latencies = sorted(latencies)
+    return latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else 0.0
+
+
+class Command(BaseCommand):
+    help = (
+        "Orders per second on a single hot product from concurrent clients, with its stock in "
+        "current_stock and split across stock shards. Also checks that no unit was lost or oversold."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, nargs="+", default=[1, 8, 32])
+        parser.add_argument("--shards", type=int, nargs="+", default=[0, 8], help="0 runs without sharding.")
+        parser.add_argument("--duration", type=float, default=5.0, help="Seconds per run.")
+        parser.add_argument(
+            "--businesses", type=int, default=1,
+            help="Spread the clients over this many businesses, each with a hot product. Writes of different "
+            "businesses take different change counters, so with more than one they shouldn't queue on each other.",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"Database: {connection.vendor}. On SQLite every write takes the database lock, so shards can't "
+            "let orders overlap there; run against PostgreSQL (DATABASE_URL) to see row contention."
+        )
+        self.stdout.write(f"Businesses: {options['businesses']}")
+        self.stdout.write(f"{'shards':>6} {'threads':>7} {'orders/s':>9} {'refused':>8} {'p95 ms':>8} {'lost':>5}")
+        for shards in options["shards"]:
+            for threads in options["threads"]:
+                with ExitStack() as stack:
+                    if connection.vendor == "sqlite":
+                        # A file, not the test runner's in-memory database, shared by the client threads
+                        tmp = stack.enter_context(tempfile.TemporaryDirectory())
+                        test_settings = connection.settings_dict.setdefault("TEST", {})
+                        old_name = test_settings.get("NAME")
+                        test_settings["NAME"] = os.path.join(tmp, "bench.sqlite3")
+                        stack.callback(test_settings.__setitem__, "NAME", old_name)
+                        connection.close()
+                    stack.enter_context(scratch_database())
+                    stack.enter_context(override_settings(ALLOWED_HOSTS=["testserver"]))
+                    user = UserProfile.objects.create_user(username="bench", password="Bench123", full_name="Bench", role="admin")
+                    businesses = [
+                        Business.objects.create(owner=user, business_name=f"Flash sale {i}")
+                        for i in range(options["businesses"])
+                    ]
+                    for business in businesses:
+                        product = Product.objects.create(
+                            business=business, product_name="Hot", sku="HOT", category="gaming", current_stock=STARTING_STOCK,
+                            min_stock=0, price=Decimal("10.00"), selling_price=Decimal("15.00"), supplier="Bench",
+                        )
+                        if shards:
+                            stock.set_shards(product, shards)
+                    connection.close()
+
+                    taken, refused = run_orders(user, businesses, threads, options["duration"])
+                    stock.reconcile()
+                    ordered = Order.objects.aggregate(total=Sum("quantity"))["total"] or 0
+                    left = Product.objects.aggregate(total=Sum("current_stock"))["total"]
+                    if shards:
+                        assert left == StockShard.objects.aggregate(total=Sum("quantity"))["total"]
+                    self.stdout.write(
+                        f"{shards:>6} {threads:>7} {len(taken) / options['duration']:>9.1f} {len(refused):>8} "
+                        f"{p95(taken + refused) * 1000:>8.1f} {STARTING_STOCK * len(businesses) - ordered - left:>5}"
+                    )
@@ -0,0 +1,99 @@
+import statistics
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from ...models import UserProfile
+from ...tokens import ScopedRefreshToken, prune_expired_tokens
+from ..benchmarking import scratch_database
+
+SEED_BATCH_SIZE = 10_000
+
+
+def seed_tokens(user, count, expired_share, blacklisted_share):
+    """
+    `count` outstanding tokens of `user`, the oldest `expired_share` of them
+    expired, and every 1/`blacklisted_share`-th one blacklisted.
+    """
+    now = timezone.now()
+    # Real tokens are this long; the rows' size is part of what's measured
+    text = str(ScopedRefreshToken.for_user(user))
+    expired = int(count * expired_share)
+    every = max(1, round(1 / blacklisted_share)) if blacklisted_share else 0
+    for start in range(0, count, SEED_BATCH_SIZE):
+        tokens = OutstandingToken.objects.bulk_create([
+            OutstandingToken(
+                user=user, jti=uuid.uuid4().hex, token=text, created_at=now,
+                expires_at=now + (timedelta(days=-1) if i < expired else timedelta(days=30)),
+            )
+            for i in range(start, min(start + SEED_BATCH_SIZE, count))
+        ])
+        if every:
+            BlacklistedToken.objects.bulk_create([BlacklistedToken(token=t) for t in tokens[::every]])
+
+
+def logout_latencies(client, user, requests):
+    """Seconds each of `requests` logouts of fresh tokens took, and each blacklist check of the result."""
+    logouts, checks = [], []
+    for _ in range(requests):
+        token = str(ScopedRefreshToken.for_user(user))
+        start = time.perf_counter()
+        response = client.post(reverse("logout"), {"refresh_token": token}, format="json")
+        logouts.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.content
+        start = time.perf_counter()
+        try:
+            ScopedRefreshToken(token)
+        except Exception:
+            pass
+        else:
+            raise AssertionError("A logged out token still verified")
+        checks.append(time.perf_counter() - start)
+    return logouts, checks
+
+
+def ms(latencies, quantile):
+    latencies = sorted(latencies)
+    return latencies[min(len(latencies) - 1, int(len(latencies) * quantile))] * 1000
+
+
+class Command(BaseCommand):
+    help = (
+        "Latency of logout (blacklisting a refresh token) and of the blacklist check on verify, "
+        "with millions of outstanding tokens, before and after prune_tokens."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tokens", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+        parser.add_argument("--requests", type=int, default=200, help="Logouts timed per run.")
+        parser.add_argument("--expired", type=float, default=0.5, help="Share of the seeded tokens already expired.")
+        parser.add_argument("--blacklisted", type=float, default=0.1, help="Share of the seeded tokens blacklisted.")
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'tokens':>9} {'logout p50':>10} {'p95 ms':>7} {'check p50':>9} {'prune s':>8} "
+            f"{'left':>9} {'logout p50':>10} {'p95 ms':>7}"
+        )
+        for count in options["tokens"]:
+            with scratch_database(), override_settings(ALLOWED_HOSTS=["testserver"]):
+                user = UserProfile.objects.create_user(username="bench", password="Bench123", full_name="Bench", role="admin")
+                seed_tokens(user, count, options["expired"], options["blacklisted"])
+                client = APIClient()
+                logouts, checks = logout_latencies(client, user, options["requests"])
+                start = time.perf_counter()
+                prune_expired_tokens()
+                pruned = time.perf_counter() - start
+                left = OutstandingToken.objects.count()
+                after, _checks = logout_latencies(client, user, options["requests"])
+                self.stdout.write(
+                    f"{count:>9} {ms(logouts, 0.5):>10.2f} {ms(logouts, 0.95):>7.2f} "
+                    f"{statistics.median(checks) * 1000:>9.2f} {pruned:>8.2f} {left:>9} "
+                    f"{ms(after, 0.5):>10.2f} {ms(after, 0.95):>7.2f}"
+                )
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import sharding
+
+
+class Command(BaseCommand):
+    help = (
+        "Move a business's rows to another database of SHARD_ALIASES while it keeps taking orders; its "
+        "writes are refused only while the last changes are copied (see inventory.sharding)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--business", type=int, required=True)
+        parser.add_argument("--to", required=True, help="Alias of the target database.")
+        parser.add_argument("--batch-size", type=int, default=sharding.BATCH_SIZE)
+        parser.add_argument("--keep-source", action="store_true", help="Leave the rows in the old database.")
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        try:
+            source = sharding.move(
+                options["business"], options["to"], batch_size=options["batch_size"],
+                keep_source=options["keep_source"], log=self.stdout.write,
+            )
+        except sharding.MoveError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(f"Moved business {options['business']} from {source!r} to {options['to']!r}."))
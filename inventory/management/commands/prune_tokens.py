@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import tokens
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired outstanding refresh tokens and their blacklist entries in batches. "
+        "Run it daily (see render.yaml); unlike flushexpiredtokens it never loads the rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=tokens.PRUNE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        outstanding, blacklisted = tokens.prune_expired_tokens(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {outstanding} expired outstanding tokens and {blacklisted} blacklist entries."
+        ))
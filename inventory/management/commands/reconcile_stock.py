@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from ... import sharding, stock
+
+
+class Command(BaseCommand):
+    help = "Write the total of each sharded product's stock shards into its current_stock (see inventory.stock)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--business", type=int, action="append", help="Only this business id (repeatable).")
+
+    def handle(self, *args, **options):
+        updated = sum(stock.reconcile(options["business"], using=alias) for alias in sharding.databases())
+        self.stdout.write(self.style.SUCCESS(f"Updated the current_stock of {updated} sharded products."))
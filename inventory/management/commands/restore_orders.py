@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import archive, sharding
+from .archive_orders import parse_date
+
+
+class Command(BaseCommand):
+    help = "Move archived orders dated --start..--end, and their returns, back into the live tables (e.g. for an audit)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", required=True, help="YYYY-MM-DD")
+        parser.add_argument("--end", required=True, help="YYYY-MM-DD")
+        parser.add_argument("--business", type=int, action="append", help="Only this business id (repeatable).")
+        parser.add_argument("--batch-size", type=int, default=archive.DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        start, end = parse_date(options["start"]), parse_date(options["end"])
+        if start > end:
+            raise CommandError("--start cannot be after --end.")
+        orders = returns = 0
+        for alias in sharding.databases():
+            with sharding.use_shard(alias):
+                restored = archive.restore(start, end, options["business"], batch_size=options["batch_size"])
+            orders, returns = orders + restored[0], returns + restored[1]
+        self.stdout.write(self.style.SUCCESS(f"Restored {orders} orders and {returns} returns dated {start} to {end}."))
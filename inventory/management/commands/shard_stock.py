@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import stock
+from ...models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Split a hot product's stock across --shards counter rows so concurrent orders don't queue on its "
+        "row, or move it back into current_stock with --shards 0."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--business", type=int, required=True)
+        parser.add_argument("--sku", required=True)
+        parser.add_argument("--shards", type=int, required=True, help="Number of shards; 0 turns sharding off.")
+
+    def handle(self, *args, **options):
+        if not 0 <= options["shards"] <= 256:
+            raise CommandError("--shards must be between 0 and 256.")
+        try:
+            product = Product.objects.get(business_id=options["business"], sku=options["sku"])
+        except Product.DoesNotExist:
+            raise CommandError(f"No product {options['sku']!r} in business {options['business']}.")
+        stock.set_shards(product, options["shards"])
+        where = f"{product.stock_shards} shards" if product.stock_shards else "current_stock"
+        self.stdout.write(self.style.SUCCESS(f"{product.product_name}: {product.current_stock} in stock, kept in {where}."))
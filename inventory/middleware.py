@@ -0,0 +1,231 @@
+import gzip
+import io
+import secrets
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+from .replica import pin_to_primary
+from .sharding import clear as clear_tenant
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+
+# Content types that are already compressed (prefix match, see COMPRESSION_SKIP_CONTENT_TYPES)
+DEFAULT_SKIP_CONTENT_TYPES = (
+    "image/",
+    "video/",
+    "audio/",
+    "font/woff",
+    "application/zip",
+    "application/gzip",
+    "application/x-gzip",
+    "application/x-bzip2",
+    "application/x-xz",
+    "application/x-7z-compressed",
+    "application/zstd",
+    "application/pdf",
+)
+
+
+class GzipStream:
+    """
+    Incremental gzip encoder. A random-length file name is written into the
+    header so the compressed size does not leak the content (BREACH), the
+    same mitigation Django's GZipMiddleware uses.
+    """
+
+    encoding = "gzip"
+
+    def __init__(self, level=6, max_random_bytes=100):
+        filename = secrets.token_hex(secrets.randbelow(max_random_bytes + 1) // 2) if max_random_bytes else None
+        self._buf = io.BytesIO()
+        self._file = gzip.GzipFile(filename=filename, mode="wb", compresslevel=level, fileobj=self._buf, mtime=0)
+
+    def _drain(self):
+        data = self._buf.getvalue()
+        self._buf.seek(0)
+        self._buf.truncate()
+        return data
+
+    def write(self, data, flush=True):
+        self._file.write(data)
+        if flush:
+            self._file.flush()
+        return self._drain()
+
+    def finish(self):
+        self._file.close()
+        return self._drain()
+
+
+class BrotliStream:
+    """Incremental Brotli encoder (requires the `brotli` package)."""
+
+    encoding = "br"
+
+    def __init__(self, quality=5):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def write(self, data, flush=True):
+        out = self._compressor.process(data)
+        return out + self._compressor.flush() if flush else out
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+def available_encodings():
+    """Supported content codings, most preferred first."""
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def get_stream(encoding, level=None):
+    """A fresh encoder for `encoding`; `level` defaults to the configured one."""
+    if encoding == "br":
+        return BrotliStream(quality=level if level is not None else getattr(settings, "COMPRESSION_BROTLI_QUALITY", 5))
+    return GzipStream(level=level if level is not None else getattr(settings, "COMPRESSION_LEVEL", 6))
+
+
+def compress(encoding, data, level=None):
+    stream = get_stream(encoding, level)
+    return stream.write(data, flush=False) + stream.finish()
+
+
+def parse_accept_encoding(header):
+    """{coding: q} for an Accept-Encoding header."""
+    accepted = {}
+    for part in header.split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def negotiate_encoding(header, encodings=None):
+    """
+    The coding to use for a request's Accept-Encoding, or None. Highest q
+    wins; ties go to the server's preference (Brotli before gzip).
+    """
+    accepted = parse_accept_encoding(header or "")
+    best, best_q = None, 0.0
+    for encoding in encodings or available_encodings():
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compress responses with Brotli (when installed) or gzip, based on the
+    request's Accept-Encoding.
+
+    Responses smaller than COMPRESSION_MIN_SIZE, already-encoded responses and
+    content types in COMPRESSION_SKIP_CONTENT_TYPES are left alone. Streaming
+    responses (sync or async) are compressed chunk by chunk.
+    """
+
+    def should_compress(self, response):
+        if response.has_header("Content-Encoding") or response.status_code in (204, 304):
+            return False
+        if "no-transform" in response.get("Cache-Control", ""):
+            return False
+        content_type = response.get("Content-Type", "").split(";")[0].strip().lower()
+        skip_content_types = getattr(settings, "COMPRESSION_SKIP_CONTENT_TYPES", DEFAULT_SKIP_CONTENT_TYPES)
+        if content_type.startswith(tuple(skip_content_types)):
+            return False
+        return response.streaming or len(response.content) >= getattr(settings, "COMPRESSION_MIN_SIZE", 1024)
+
+    def process_response(self, request, response):
+        if not self.should_compress(response):
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+
+        encoding = negotiate_encoding(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            stream = get_stream(encoding)
+            if response.is_async:
+                response.streaming_content = self._acompress(response.streaming_content, stream)
+            else:
+                response.streaming_content = self._compress(response.streaming_content, stream)
+            # The compressed size isn't known until the stream is consumed
+            del response.headers["Content-Length"]
+        else:
+            compressed = compress(encoding, response.content)
+            # Only worth it if it is actually smaller
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers["Content-Length"] = str(len(compressed))
+
+        # A strong ETag must not survive a change of encoding (RFC 9110 8.8.1)
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = encoding
+        return response
+
+    @staticmethod
+    def _compress(chunks, stream):
+        for chunk in chunks:
+            data = stream.write(chunk)
+            if data:
+                yield data
+        yield stream.finish()
+
+    @staticmethod
+    async def _acompress(chunks, stream):
+        async for chunk in chunks:
+            data = stream.write(chunk)
+            if data:
+                yield data
+        yield stream.finish()
+
+
+class ReplicaPinMiddleware(MiddlewareMixin):
+    """
+    After a write request, read that user's replica-routed views from the
+    primary for REPLICA_MAX_LAG seconds so they see their own change (see
+    replica.py). DRF sets request.user once the view has authenticated.
+    """
+
+    SAFE_METHODS = ("GET", "HEAD", "OPTIONS", "TRACE")
+
+    def process_response(self, request, response):
+        if request.method not in self.SAFE_METHODS:
+            pin_to_primary(getattr(request, "user", None))
+        return response
+
+
+class TenantRoutingMiddleware(MiddlewareMixin):
+    """
+    Start and end every request without tenant routing. The authentication
+    class routes the request's queries once it knows its businesses (see
+    sharding.py), so no earlier request's routing carries over.
+    """
+
+    def process_request(self, request):
+        clear_tenant()
+
+    def process_response(self, request, response):
+        clear_tenant()
+        return response
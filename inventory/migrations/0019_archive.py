@@ -0,0 +1,71 @@
+# Generated by Django 5.2.4 on 2026-10-19 14:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0018_change_feed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('order_id', models.CharField(max_length=100)),
+                ('tracking_id', models.CharField(blank=True, max_length=100, null=True)),
+                ('product_name', models.CharField(max_length=255)),
+                ('quantity', models.PositiveIntegerField()),
+                ('customer_name', models.CharField(max_length=255)),
+                ('date', models.DateField()),
+                ('is_returned', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField()),
+                ('change_seq', models.BigIntegerField(default=0)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('business', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='inventory.business')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedReturn',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('product_name', models.CharField(max_length=255)),
+                ('customer_name', models.CharField(max_length=255)),
+                ('quantity', models.PositiveIntegerField()),
+                ('date', models.DateField()),
+                ('updated_at', models.DateTimeField()),
+                ('change_seq', models.BigIntegerField(default=0)),
+                ('business', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='inventory.business')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='returns', to='inventory.archivedorder')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('order', 'Order'), ('return', 'Return')], max_length=10)),
+                ('date', models.DateField()),
+                ('product_name', models.CharField(max_length=255)),
+                ('customer_name', models.CharField(max_length=255)),
+                ('is_returned', models.BooleanField(default=False)),
+                ('quantity', models.BigIntegerField()),
+                ('rows', models.IntegerField()),
+                ('business', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='inventory.business')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['business', 'date'], name='archivedorder_business_date'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedreturn',
+            index=models.Index(fields=['business', 'date'], name='archivedreturn_business_date'),
+        ),
+        migrations.AddIndex(
+            model_name='dailysummary',
+            index=models.Index(fields=['business', 'kind', 'date'], name='dailysummary_business_date'),
+        ),
+    ]
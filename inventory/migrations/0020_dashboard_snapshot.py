@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-19 14:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0019_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('orders', models.IntegerField(default=0)),
+                ('returns', models.IntegerField(default=0)),
+                ('lines', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('business', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='inventory.business')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('business', 'date'), name='dashboardsnapshot_business_date')],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.4 on 2026-10-19 15:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0020_dashboard_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='is_low_stock',
+            field=models.GeneratedField(db_persist=True, expression=models.Q(('current_stock__lte', models.F('min_stock'))), output_field=models.BooleanField()),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_low_stock', True)), fields=['business'], name='product_business_low_stock'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-19 15:18
+
+import django.db.models.functions.text
+import inventory.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('inventory', '0022_customer'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='userprofile',
+            managers=[
+                ('objects', inventory.models.UserProfileManager()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(django.db.models.functions.text.Lower('username'), name='userprofile_username_lower'),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(django.db.models.functions.text.Lower('email'), name='userprofile_email_lower'),
+        ),
+    ]
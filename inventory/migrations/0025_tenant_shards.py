@@ -0,0 +1,68 @@
+# Generated by Django 5.2.4 on 2026-10-19 15:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0024_stock_shards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TenantShard',
+            fields=[
+                ('business', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='tenant_shard', serialize=False, to='inventory.business')),
+                ('alias', models.CharField(max_length=100)),
+                ('moving', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='archivedorder',
+            name='business',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='inventory.business'),
+        ),
+        migrations.AlterField(
+            model_name='archivedreturn',
+            name='business',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='inventory.business'),
+        ),
+        migrations.AlterField(
+            model_name='customer',
+            name='business',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='customers', to='inventory.business'),
+        ),
+        migrations.AlterField(
+            model_name='dailysummary',
+            name='business',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='inventory.business'),
+        ),
+        migrations.AlterField(
+            model_name='dashboardsnapshot',
+            name='business',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='inventory.business'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='business',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='orders', to='inventory.business'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='business',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='products', to='inventory.business'),
+        ),
+        migrations.AlterField(
+            model_name='return',
+            name='business',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='returns', to='inventory.business'),
+        ),
+        migrations.AlterField(
+            model_name='salesforecastmodel',
+            name='business',
+            field=models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='inventory.business'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-19 15:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0025_tenant_shards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogCopy',
+            fields=[
+                ('business', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='catalog_copy', serialize=False, to='inventory.business')),
+                ('status', models.CharField(choices=[('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='running', max_length=20)),
+                ('total', models.IntegerField(default=0)),
+                ('processed', models.IntegerField(default=0)),
+                ('copied', models.IntegerField(default=0)),
+                ('last_source_id', models.BigIntegerField(default=0)),
+                ('error', models.TextField(blank=True, default='')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('source', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='inventory.business')),
+            ],
+        ),
+    ]
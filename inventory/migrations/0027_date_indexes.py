@@ -0,0 +1,21 @@
+# Generated by Django 5.2.4 on 2026-10-19 15:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0026_catalog_copy'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['date'], name='order_date'),
+        ),
+        migrations.AddIndex(
+            model_name='return',
+            index=models.Index(fields=['date'], name='return_date'),
+        ),
+    ]
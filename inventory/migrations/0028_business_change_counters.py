@@ -0,0 +1,21 @@
+# Generated by Django 5.2.4 on 2026-10-19 16:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0027_date_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BusinessChangeCounter',
+            fields=[
+                ('business', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='inventory.business')),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
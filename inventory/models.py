@@ -1,12 +1,39 @@
+from collections import defaultdict
+
 from django.conf import settings
-from django.db import models
-from django.contrib.auth.models import AbstractUser
+from django.db import connections, models, router, transaction
+from django.db.models.constants import OnConflict
+from django.db.models.functions import Lower
+from django.db.models.signals import post_delete
+from django.dispatch import Signal, receiver
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.core.validators import MinValueValidator
 from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
 
 # -------------------------
 # Custom User Model
 # -------------------------
+class UserProfileManager(UserManager):
+    def matching(self, username=None, email=None):
+        """
+        Users whose username equals `username` or whose email equals `email`,
+        ignoring case, found through the Lower() indexes. Annotated with
+        `username_matches` and `email_matches`.
+        """
+        users = self.alias(username_lower=Lower("username"), email_lower=Lower("email"))
+        match = models.Q(pk__in=[])
+        for field, value in (("username", username), ("email", email)):
+            if not value:
+                users = users.annotate(**{f"{field}_matches": models.Value(False)})
+                continue
+            # Lowered by the database like the column: its LOWER() may fold fewer characters than str.lower()
+            field_match = models.Q(**{f"{field}_lower": Lower(models.Value(value))})
+            users = users.annotate(**{f"{field}_matches": models.ExpressionWrapper(field_match, output_field=models.BooleanField())})
+            match |= field_match
+        return users.filter(match)
+
+
 class UserProfile(AbstractUser):
     ROLE_CHOICES = [
         ('admin', 'Admin'),
@@ -17,6 +44,15 @@ class UserProfile(AbstractUser):
     full_name = models.CharField(max_length=255)
     role = models.CharField(max_length=20, choices=ROLE_CHOICES)
 
+    objects = UserProfileManager()
+
+    class Meta(AbstractUser.Meta):
+        # Login and signup match usernames and emails case-insensitively (UserProfileManager.matching)
+        indexes = [
+            models.Index(Lower("username"), name="userprofile_username_lower"),
+            models.Index(Lower("email"), name="userprofile_email_lower"),
+        ]
+
     def __str__(self):
         return self.username
 
@@ -45,10 +81,321 @@ class Business(models.Model):
         return self.business_name if self.business_name else f"Business of {self.owner.username}"
 
 
+class TenantShard(models.Model):
+    """
+    The database a business's rows live in, when it isn't `default`
+    (inventory.sharding). While `moving`, the business's writes are refused.
+    The tenant tables' foreign keys to Business have no database constraint,
+    since on a shard the business row is elsewhere.
+    """
+    business = models.OneToOneField(Business, on_delete=models.CASCADE, primary_key=True, related_name="tenant_shard")
+    alias = models.CharField(max_length=100)
+    moving = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Business {self.business_id} in {self.alias}"
+
+
+class CatalogCopy(models.Model):
+    """
+    Progress of copying `source`'s products into a new business
+    (inventory.catalog). `total` counts the source's products when the copy
+    started, `processed` those gone through and `copied` the rows inserted.
+    """
+    RUNNING, DONE, FAILED = "running", "done", "failed"
+    STATUS_CHOICES = [(RUNNING, "Running"), (DONE, "Done"), (FAILED, "Failed")]
+
+    business = models.OneToOneField(Business, on_delete=models.CASCADE, primary_key=True, related_name="catalog_copy")
+    source = models.ForeignKey(Business, on_delete=models.SET_NULL, null=True, related_name="+")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=RUNNING)
+    total = models.IntegerField(default=0)
+    processed = models.IntegerField(default=0)
+    copied = models.IntegerField(default=0)
+    # The last source product id copied; the next batch starts after it
+    last_source_id = models.BigIntegerField(default=0)
+    error = models.TextField(blank=True, default="")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Catalog of business {self.source_id} into {self.business_id}: {self.status}"
+
+
+# -------------------------
+# Change tracking (incremental sync)
+# -------------------------
+class ChangeCounter(models.Model):
+    """
+    Single-row counter behind the change sequence of rows without a business.
+    Its value is also where a business's counter starts, so sequence numbers
+    handed out before the counters were per business stay below every new one.
+    """
+    value = models.BigIntegerField(default=0)
+
+
+class BusinessChangeCounter(models.Model):
+    """
+    A business's change sequence. Allocating takes the row lock until the
+    writing transaction commits, so the business's sequence numbers become
+    visible in order and a reader never skips a change behind its cursor.
+    Writes to other businesses don't wait for it.
+    """
+    business = models.OneToOneField(
+        Business, on_delete=models.CASCADE, primary_key=True, related_name="+", db_constraint=False,
+    )
+    value = models.BigIntegerField(default=0)
+
+
+def _increment(connection, model, pk, count):
+    """Add `count` to the counter row `pk` of `model` and return its new value; None without the row."""
+    table = connection.ops.quote_name(model._meta.db_table)
+    column = connection.ops.quote_name(model._meta.pk.column)
+    with connection.cursor() as cursor:
+        if connection.features.can_return_columns_from_insert:
+            cursor.execute(f"UPDATE {table} SET value = value + %s WHERE {column} = %s RETURNING value", [count, pk])
+        else:
+            cursor.execute(f"UPDATE {table} SET value = value + %s WHERE {column} = %s", [count, pk])
+            cursor.execute(f"SELECT value FROM {table} WHERE {column} = %s", [pk])
+        row = cursor.fetchone()
+    return None if row is None else row[0]
+
+
+def start_change_counter(business_id, using=None):
+    """Create `business_id`'s change counter at ChangeCounter's value, unless another writer just did."""
+    connection = connections[using or router.db_for_write(BusinessChangeCounter)]
+    quote = connection.ops.quote_name
+    fields = [BusinessChangeCounter._meta.pk]
+    with connection.cursor() as cursor:
+        # One INSERT ... SELECT: the floor is read in the statement that uses it
+        cursor.execute(
+            "%s %s (%s, value) SELECT %%s, COALESCE((SELECT value FROM %s WHERE id = 1), 0) %s" % (
+                connection.ops.insert_statement(on_conflict=OnConflict.IGNORE),
+                quote(BusinessChangeCounter._meta.db_table),
+                quote(BusinessChangeCounter._meta.pk.column),
+                quote(ChangeCounter._meta.db_table),
+                connection.ops.on_conflict_suffix_sql(fields, OnConflict.IGNORE, None, None) or "",
+            ),
+            [business_id],
+        )
+
+
+def delete_rows(model, pks, using):
+    """
+    Delete the rows `pks` of `model` from `using` in one DELETE and return how
+    many went. Unlike QuerySet.delete() it loads nothing, follows no relations
+    and sends no delete signals: delete referencing rows first.
+    """
+    if not pks:
+        return 0
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    pk = model._meta.pk
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "DELETE FROM %s WHERE %s IN (%s)" % (
+                quote(model._meta.db_table), quote(pk.column), ", ".join(["%s"] * len(pks)),
+            ),
+            [pk.get_db_prep_value(value, connection) for value in pks],
+        )
+        return cursor.rowcount
+
+
+def allocate_change_seq(business_id, count=1, using=None):
+    """
+    Reserve `count` consecutive change sequence numbers of `business_id`
+    (None: of the rows without a business) and return the first.
+    """
+    connection = connections[using or router.db_for_write(BusinessChangeCounter)]
+    if business_id is None:
+        value = _increment(connection, ChangeCounter, 1, count)
+        if value is None:
+            # Counter row missing (created by migration 0018); start it
+            ChangeCounter.objects.using(connection.alias).get_or_create(pk=1)
+            return allocate_change_seq(None, count, using=connection.alias)
+        return value - count + 1
+    value = _increment(connection, BusinessChangeCounter, business_id, count)
+    if value is None:
+        start_change_counter(business_id, connection.alias)
+        value = _increment(connection, BusinessChangeCounter, business_id, count)
+    return value - count + 1
+
+
+def allocate_change_seqs(counts, using=None):
+    """
+    allocate_change_seq() for several businesses: {business_id: count} ->
+    {business_id: first number}. Takes the counters in id order, so two
+    writers never wait on each other's.
+    """
+    return {
+        business_id: allocate_change_seq(business_id, counts[business_id], using=using)
+        for business_id in sorted(counts, key=lambda b: (b is None, b or 0))
+    }
+
+
+def lock_change_seqs(business_ids, using=None):
+    """
+    Hold the change counters of `business_ids` until the transaction ends:
+    none of their writes can commit meanwhile. Call inside atomic().
+    """
+    using = using or router.db_for_write(BusinessChangeCounter)
+    locked = (
+        BusinessChangeCounter.objects.using(using).select_for_update()
+        .filter(business_id__in=business_ids).order_by("pk").values_list("pk", flat=True)
+    )
+    # A counter created here is held by the inserting transaction as well
+    for business_id in sorted(set(business_ids) - set(locked)):
+        start_change_counter(business_id, using)
+
+
+# Sent inside the transaction of a bulk_create(), bulk_update() or update() of
+# a ChangeTracked model, none of which sends post_save. Arguments: `using`,
+# `business_ids` (set of the businesses of the rows written), `pks` (their
+# ids, or None when bulk_create() could not return them) and `fields` (names
+# of the fields written; None for bulk_create()).
+bulk_written = Signal()
+
+
+def _business_id(value):
+    return value.pk if isinstance(value, models.Model) else value
+
+
+class ChangeTrackedQuerySet(models.QuerySet):
+    """Bulk writes stamp rows with change sequence numbers like save() does."""
+
+    def update(self, **kwargs):
+        with transaction.atomic(using=self.db, savepoint=False):
+            if any(f.name == "updated_at" for f in self.model._meta.concrete_fields):
+                kwargs.setdefault("updated_at", timezone.now())
+            # Read first: the update may change what the filter matches
+            listened = bulk_written.has_listeners(self.model)
+            rows = list(self.values_list("pk", "business_id")) if listened else []
+            if "change_seq" not in kwargs:
+                if "business" in kwargs or "business_id" in kwargs:
+                    # Moved to a business: numbered in its sequence
+                    business_ids = {_business_id(kwargs.get("business", kwargs.get("business_id")))}
+                elif listened:
+                    business_ids = {b for _, b in rows}
+                else:
+                    business_ids = set(self.order_by().values_list("business_id", flat=True).distinct())
+                firsts = allocate_change_seqs(dict.fromkeys(business_ids, 1), using=self.db)
+                if len(firsts) == 1:
+                    kwargs["change_seq"] = next(iter(firsts.values()))
+                elif firsts:
+                    # A row moved into the filter since the read above gets the highest number taken
+                    kwargs["change_seq"] = models.Case(
+                        *[models.When(business_id=b, then=models.Value(seq)) for b, seq in firsts.items()],
+                        default=models.Value(max(firsts.values())), output_field=models.BigIntegerField(),
+                    )
+            updated = super().update(**kwargs)
+            if rows:
+                self._send_bulk_written([pk for pk, _ in rows], {b for _, b in rows}, list(kwargs))
+            return updated
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        if not objs:
+            return super().bulk_create(objs, *args, **kwargs)
+        with transaction.atomic(using=self.db, savepoint=False):
+            self._number(objs)
+            created = super().bulk_create(objs, *args, **kwargs)
+            pks = [obj.pk for obj in objs]
+            self._send_bulk_written(None if None in pks else pks, {obj.business_id for obj in objs}, None)
+            return created
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        if not objs:
+            return super().bulk_update(objs, fields, *args, **kwargs)
+        fields = [*fields, "change_seq"]
+        with transaction.atomic(using=self.db, savepoint=False):
+            self._number(objs)
+            updated = super().bulk_update(objs, fields, *args, **kwargs)
+            self._send_bulk_written([obj.pk for obj in objs], {obj.business_id for obj in objs}, fields)
+            return updated
+
+    def _number(self, objs):
+        """Give `objs` consecutive change sequence numbers of their businesses."""
+        by_business = defaultdict(list)
+        for obj in objs:
+            by_business[obj.business_id].append(obj)
+        firsts = allocate_change_seqs({b: len(group) for b, group in by_business.items()}, using=self.db)
+        for business_id, group in by_business.items():
+            for i, obj in enumerate(group):
+                obj.change_seq = firsts[business_id] + i
+
+    def _send_bulk_written(self, pks, business_ids, fields):
+        bulk_written.send(
+            sender=self.model, using=self.db, pks=pks, business_ids=business_ids - {None}, fields=fields,
+        )
+
+
+class ChangeTracked(models.Model):
+    """
+    Rows carry `change_seq`, the change sequence number of their last write in
+    their business's sequence. Deletes are recorded as Tombstones (see the
+    post_delete receiver below).
+    """
+    change_seq = models.BigIntegerField(default=0, editable=False)
+
+    objects = ChangeTrackedQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The values as loaded, so post_save receivers can tell what a save changed
+        instance._loaded = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get("using") or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            self.change_seq = allocate_change_seq(self.business_id, using=using)
+            if kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = {*kwargs["update_fields"], "change_seq"}
+            super().save(*args, **kwargs)
+        # What the row now holds, for the receivers of the next save
+        saved = kwargs.get("update_fields")
+        self._loaded = {
+            **getattr(self, "_loaded", {}),
+            **{
+                f.attname: self.__dict__[f.attname] for f in self._meta.concrete_fields
+                if f.attname in self.__dict__ and (saved is None or f.name in saved or f.attname in saved)
+            },
+        }
+
+
+# -------------------------
+# Customer Model (inventory.customers)
+# -------------------------
+class Customer(models.Model):
+    """
+    A business's customer: the orders and returns whose customer_name
+    normalises to `normalized_name`, with running totals of the orders.
+    """
+    business = models.ForeignKey(Business, on_delete=models.CASCADE, related_name="customers", db_constraint=False)
+    name = models.CharField(max_length=255)  # spelling first seen
+    normalized_name = models.CharField(max_length=255)
+    lifetime_revenue = models.BigIntegerField(default=0)  # paise
+    order_count = models.IntegerField(default=0)
+    last_order_date = models.DateField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["business", "normalized_name"], name="customer_business_normalized_name"),
+        ]
+        indexes = [models.Index(fields=["business", "-lifetime_revenue"], name="customer_business_revenue")]
+
+    def __str__(self):
+        return self.name
+
+
 # -------------------------
 # Product Model
 # -------------------------
-class Product(models.Model):
+class Product(ChangeTracked):
     CATEGORY_CHOICES = [
         ('electronics', 'Electronics'),
         ('furniture', 'Furniture'),
@@ -72,7 +419,8 @@ class Product(models.Model):
         on_delete=models.CASCADE,
         related_name="products",
         null=True,
-        blank=True
+        blank=True,
+        db_constraint=False,
     )
     product_name = models.CharField(max_length=255)
     sku = models.CharField(max_length=100)  # ❌ remove unique=True
@@ -85,27 +433,66 @@ class Product(models.Model):
     supplier = models.CharField(max_length=255)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # > 0: the stock lives in this many StockShard rows and current_stock is their total
+    # as of the last manage.py reconcile_stock (inventory.stock)
+    stock_shards = models.PositiveSmallIntegerField(default=0)
+    # Kept by the database on every write, so low stock is an indexed lookup
+    is_low_stock = models.GeneratedField(
+        expression=models.Q(current_stock__lte=models.F("min_stock")),
+        output_field=models.BooleanField(),
+        db_persist=True,
+    )
 
     class Meta:
         unique_together = ("business", "sku")  # ✅ SKU unique only per business
+        indexes = [
+            models.Index(fields=["business", "change_seq"], name="product_business_change_seq"),
+            models.Index(fields=["business"], condition=models.Q(is_low_stock=True), name="product_business_low_stock"),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.business_id:
             self.business_id = 1  # default business ID (optional, but fine)
         super().save(*args, **kwargs)
+        # An UPDATE doesn't read generated columns back; same comparison as the database's
+        if isinstance(self.current_stock, int) and isinstance(self.min_stock, int):
+            self.is_low_stock = self.current_stock <= self.min_stock
+
+
+class StockShard(models.Model):
+    """One of the rows a hot product's stock is split across, so concurrent orders lock different rows."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="shards")
+    shard = models.PositiveSmallIntegerField()
+    quantity = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["product", "shard"], name="stockshard_product_shard")]
+
+    def __str__(self):
+        return f"Shard {self.shard} of product {self.product_id}: {self.quantity}"
+
 
-class Order(models.Model):
-    business = models.ForeignKey(Business, on_delete=models.CASCADE, related_name="orders", blank=True, null=True)
+class Order(ChangeTracked):
+    business = models.ForeignKey(Business, on_delete=models.CASCADE, related_name="orders", blank=True, null=True, db_constraint=False)
     order_id = models.CharField(max_length=100)
     tracking_id = models.CharField(max_length=100, blank=True, null=True)
     product_name = models.CharField(max_length=255)
     quantity = models.PositiveIntegerField()
     customer_name = models.CharField(max_length=255)
+    customer = models.ForeignKey(Customer, on_delete=models.SET_NULL, null=True, blank=True, related_name="orders")
     
     # 🟢 Remove auto_now_add=True
     date = models.DateField()
     
     is_returned = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["business", "change_seq"], name="order_business_change_seq"),
+            # The admin's date drill-down, across businesses
+            models.Index(fields=["date"], name="order_date"),
+        ]
 
     def __str__(self):
         return f"Order {self.order_id} - {self.product_name}"
@@ -115,15 +502,23 @@ class Order(models.Model):
 
 from django.db import models
 
-class Return(models.Model):
-    business = models.ForeignKey(Business, on_delete=models.CASCADE, related_name="returns", blank=True, null=True)
+class Return(ChangeTracked):
+    business = models.ForeignKey(Business, on_delete=models.CASCADE, related_name="returns", blank=True, null=True, db_constraint=False)
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="returns")
     product_name = models.CharField(max_length=255)
     customer_name = models.CharField(max_length=255)
+    customer = models.ForeignKey(Customer, on_delete=models.SET_NULL, null=True, blank=True, related_name="returns")
     quantity = models.PositiveIntegerField()
     
     # 🟢 Remove auto_now_add=True
     date = models.DateField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["business", "change_seq"], name="return_business_change_seq"),
+            models.Index(fields=["date"], name="return_date"),
+        ]
 
     def __str__(self):
         return f"Return for {self.product_name} ({self.quantity})"
@@ -133,7 +528,7 @@ class SalesForecastModel(models.Model):
     """
     Stores the trained sales forecast model parameters for a business.
     """
-    business = models.OneToOneField(Business, on_delete=models.CASCADE)
+    business = models.OneToOneField(Business, on_delete=models.CASCADE, db_constraint=False)
     
     # Store the coefficients as a JSON field to handle arrays
     coefficients = models.JSONField(encoder=DjangoJSONEncoder, default=list)
@@ -142,3 +537,133 @@ class SalesForecastModel(models.Model):
 
     def __str__(self):
         return f"Sales Forecast Model for {self.business.name}"
+
+
+class Tombstone(models.Model):
+    """A deleted Product, Order or Return, for the change feed."""
+    KIND_CHOICES = [
+        ('product', 'Product'),
+        ('order', 'Order'),
+        ('return', 'Return'),
+    ]
+
+    # No FK constraint: tombstones outlive the rows and can be written while a business is being deleted
+    business = models.ForeignKey(Business, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name="+")
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    change_seq = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["business", "change_seq"], name="tombstone_business_change_seq")]
+
+    def __str__(self):
+        return f"Deleted {self.kind} {self.object_id}"
+
+
+@receiver(post_delete, sender=Product, dispatch_uid="product_tombstone")
+@receiver(post_delete, sender=Order, dispatch_uid="order_tombstone")
+@receiver(post_delete, sender=Return, dispatch_uid="return_tombstone")
+def record_tombstone(sender, instance, using, **kwargs):
+    Tombstone.objects.using(using).create(
+        business_id=instance.business_id,
+        kind=sender._meta.model_name,
+        object_id=instance.pk,
+        change_seq=allocate_change_seq(instance.business_id, using=using),
+    )
+
+
+# -------------------------
+# Archive (inventory.archive)
+# -------------------------
+class ArchivedOrder(models.Model):
+    """An Order moved out of the hot table by archive_orders, under its original id."""
+    id = models.BigIntegerField(primary_key=True)
+    business = models.ForeignKey(Business, on_delete=models.CASCADE, related_name="+", blank=True, null=True, db_constraint=False)
+    order_id = models.CharField(max_length=100)
+    tracking_id = models.CharField(max_length=100, blank=True, null=True)
+    product_name = models.CharField(max_length=255)
+    quantity = models.PositiveIntegerField()
+    customer_name = models.CharField(max_length=255)
+    customer = models.ForeignKey(Customer, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    date = models.DateField()
+    is_returned = models.BooleanField(default=False)
+    updated_at = models.DateTimeField()
+    change_seq = models.BigIntegerField(default=0)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["business", "date"], name="archivedorder_business_date")]
+
+    def __str__(self):
+        return f"Archived order {self.order_id} - {self.product_name}"
+
+
+class ArchivedReturn(models.Model):
+    """A Return archived together with its order."""
+    id = models.BigIntegerField(primary_key=True)
+    business = models.ForeignKey(Business, on_delete=models.CASCADE, related_name="+", blank=True, null=True, db_constraint=False)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name="returns")
+    product_name = models.CharField(max_length=255)
+    customer_name = models.CharField(max_length=255)
+    customer = models.ForeignKey(Customer, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    quantity = models.PositiveIntegerField()
+    date = models.DateField()
+    updated_at = models.DateTimeField()
+    change_seq = models.BigIntegerField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=["business", "date"], name="archivedreturn_business_date")]
+
+    def __str__(self):
+        return f"Archived return for {self.product_name} ({self.quantity})"
+
+
+class DailySummary(models.Model):
+    """
+    Total quantity of the archived orders or returns of one business, day,
+    product and customer. The analysis queries read these alongside the hot
+    rows, so results over archived periods don't change.
+    """
+    KIND_CHOICES = [
+        ('order', 'Order'),
+        ('return', 'Return'),
+    ]
+
+    business = models.ForeignKey(Business, on_delete=models.CASCADE, related_name="+", blank=True, null=True, db_constraint=False)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    date = models.DateField()
+    product_name = models.CharField(max_length=255)
+    customer_name = models.CharField(max_length=255)
+    is_returned = models.BooleanField(default=False)  # of the orders (always False for returns)
+    quantity = models.BigIntegerField()
+    rows = models.IntegerField()  # archived orders/returns summed up
+
+    class Meta:
+        indexes = [models.Index(fields=["business", "kind", "date"], name="dailysummary_business_date")]
+
+    def __str__(self):
+        return f"{self.kind} summary {self.date} {self.product_name}"
+
+
+# -------------------------
+# Dashboard snapshot (inventory.snapshots)
+# -------------------------
+class DashboardSnapshot(models.Model):
+    """
+    Today's orders and returns of one business, kept up to date by the write
+    paths, so dashboard_metrics reads its headline numbers from one row.
+    """
+    business = models.ForeignKey(Business, on_delete=models.CASCADE, related_name="+", db_constraint=False)
+    date = models.DateField()
+    orders = models.IntegerField(default=0)  # order rows dated `date`
+    returns = models.IntegerField(default=0)  # return rows dated `date`
+    # product_name -> [net quantity, selling price, cost price (paise)]
+    lines = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["business", "date"], name="dashboardsnapshot_business_date")]
+
+    def __str__(self):
+        return f"Dashboard snapshot {self.business_id} {self.date}"
@@ -0,0 +1,24 @@
+"""
+Money in the aggregation code is kept as integer paise (1/100 rupee).
+
+Prices are converted once when they are loaded. Sums of `quantity * price`
+are then exact integer arithmetic, and the result is turned back into rupees
+only when it is serialized.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+PAISE_PER_RUPEE = 100
+
+
+def to_paise(amount):
+    """Exact integer paise for a rupee amount (Decimal, int or str; None is 0)."""
+    if amount is None:
+        return 0
+    if not isinstance(amount, Decimal):
+        amount = Decimal(str(amount))
+    return int((amount * PAISE_PER_RUPEE).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def to_rupees(paise):
+    """Rupees as the float used in responses (same value as float(Decimal))."""
+    return int(paise) / PAISE_PER_RUPEE
@@ -0,0 +1,148 @@
+"""
+Read-replica routing for the analytics, report and forecast views.
+
+Views decorated with @use_replica read through the `replica` database when
+one is configured (DATABASE_REPLICA_URL). Everything else, and every write,
+uses `default`. Reads fall back to the primary when:
+
+- no replica is configured;
+- the user wrote within the last REPLICA_MAX_LAG seconds, so the replica may
+  not have their change yet (ReplicaPinMiddleware records the writes in the
+  "replica" cache, which every worker sees, since the next request may land
+  on another one);
+- the replica failed within the last REPLICA_RETRY_AFTER seconds. A view whose
+  replica query fails is re-run on the primary.
+
+To try it locally with two SQLite files, copy db.sqlite3 to replica.sqlite3
+and set DATABASE_REPLICA_URL=sqlite:///replica.sqlite3. The copy lags until
+you copy the file again.
+"""
+import time
+from contextvars import ContextVar
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, InterfaceError, OperationalError, connections
+
+from .models import Business
+
+REPLICA_DB_ALIAS = "replica"
+PIN_CACHE = "replica"
+
+# Alias that ORM reads in the current request should use (None: the primary)
+_read_alias = ContextVar("inventory_read_alias", default=None)
+
+# alias -> time.monotonic() until which it is considered down (per process)
+_unavailable_until = {}
+
+
+def replica_configured():
+    return REPLICA_DB_ALIAS in settings.DATABASES
+
+
+def replica_available():
+    if not replica_configured():
+        return False
+    return _unavailable_until.get(REPLICA_DB_ALIAS, 0) <= time.monotonic()
+
+
+def mark_unavailable():
+    """Stop reading from the replica for REPLICA_RETRY_AFTER seconds."""
+    _unavailable_until[REPLICA_DB_ALIAS] = time.monotonic() + getattr(settings, "REPLICA_RETRY_AFTER", 30)
+
+
+def fail_over():
+    """
+    After a database error in a replica-routed view: if the replica can't
+    answer a trivial query, mark it unavailable and return True.
+    """
+    try:
+        Business.objects.using(REPLICA_DB_ALIAS).exists()
+    except (OperationalError, InterfaceError):
+        connections[REPLICA_DB_ALIAS].close()
+        mark_unavailable()
+        return True
+    return False
+
+
+def _pin_key(user_id):
+    return f"replica-pin:{user_id}"
+
+
+def pin_to_primary(user):
+    """Send `user`'s replica reads to the primary until the replica has caught up with their write."""
+    if replica_configured() and user is not None and user.is_authenticated:
+        caches[PIN_CACHE].set(_pin_key(user.pk), True, timeout=getattr(settings, "REPLICA_MAX_LAG", 5))
+
+
+def is_pinned(user):
+    return user is not None and user.is_authenticated and bool(caches[PIN_CACHE].get(_pin_key(user.pk)))
+
+
+class ReplicaRouter:
+    """Reads go to the replica inside @use_replica views; writes always go to the primary."""
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        if {obj1._state.db, obj2._state.db} <= {DEFAULT_DB_ALIAS, REPLICA_DB_ALIAS}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema from the primary
+        return db != REPLICA_DB_ALIAS
+
+
+def use_replica(view):
+    """
+    Run `view`'s ORM reads on the replica when it is usable for this request.
+    Put it under @api_view so `request.user` is the authenticated user.
+    Works on async views too; their worker-thread queries inherit the routing.
+    """
+
+    def use_primary(request):
+        return not replica_available() or is_pinned(getattr(request, "user", None))
+
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def awrapped(request, *args, **kwargs):
+            if use_primary(request):
+                return await view(request, *args, **kwargs)
+            token = _read_alias.set(REPLICA_DB_ALIAS)
+            try:
+                return await view(request, *args, **kwargs)
+            except (OperationalError, InterfaceError):
+                # Only a failure of the replica is retried on the primary
+                if not await sync_to_async(fail_over)():
+                    raise
+            finally:
+                _read_alias.reset(token)
+            return await view(request, *args, **kwargs)
+
+        return awrapped
+
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        if use_primary(request):
+            return view(request, *args, **kwargs)
+        token = _read_alias.set(REPLICA_DB_ALIAS)
+        try:
+            return view(request, *args, **kwargs)
+        except (OperationalError, InterfaceError):
+            # Only a failure of the replica is retried on the primary
+            if not fail_over():
+                raise
+        finally:
+            _read_alias.reset(token)
+        return view(request, *args, **kwargs)
+
+    return wrapped
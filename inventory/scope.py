@@ -0,0 +1,108 @@
+from .models import Business
+
+
+class BusinessScopeError(ValueError):
+    """Raised when a `business` parameter is not a valid business id."""
+
+
+class BusinessNotFound(BusinessScopeError):
+    """Raised when a `business` parameter names a business the user does not own."""
+
+
+class BusinessScope:
+    """
+    The businesses the authenticated user may act on, resolved once per request.
+
+    Business rows are loaded lazily with a single query and reused by every
+    lookup made while handling the request.
+    """
+
+    def __init__(self, user, business_ids=None, requested=None):
+        self.user = user
+        # Raw `?business=` value of the request ('all', an id, or None)
+        self.requested = requested
+        self._business_ids = list(business_ids) if business_ids is not None else None
+        self._businesses = None
+
+    def _load(self):
+        rows = Business.objects.filter(owner_id=self.user.pk).order_by("id")
+        self._businesses = {b.id: b for b in rows}
+        self._business_ids = list(self._businesses)
+
+    @property
+    def business_ids(self):
+        if self._business_ids is None:
+            self._load()
+        return self._business_ids
+
+    @property
+    def businesses(self):
+        if self._businesses is None:
+            self._load()
+        return list(self._businesses.values())
+
+    def __bool__(self):
+        return bool(self.business_ids)
+
+    def __contains__(self, business_id):
+        return business_id in self.business_ids
+
+    def _parse(self, value):
+        try:
+            business_id = int(value)
+        except (TypeError, ValueError):
+            raise BusinessScopeError(f"Invalid business id: {value!r}")
+        if business_id not in self.business_ids:
+            raise BusinessNotFound(f"Business {business_id} not found for user")
+        return business_id
+
+    def select(self, value=None):
+        """
+        Business ids selected by a `business` parameter (defaults to the
+        request's `?business=`). Missing or 'all' selects every business.
+        """
+        if value is None:
+            value = self.requested
+        if value in (None, "", "all"):
+            return list(self.business_ids)
+        return [self._parse(value)]
+
+    def business(self, business_id):
+        """The Business instance for an owned id."""
+        business_id = self._parse(business_id)
+        if self._businesses is None:
+            self._load()
+        business = self._businesses.get(business_id)
+        if business is None:
+            # In the token's claims, but since deleted or given away
+            raise BusinessNotFound(f"Business {business_id} not found for user")
+        return business
+
+    @property
+    def default_business(self):
+        """The user's first business (what `user.businesses.first()` returned)."""
+        if self._businesses is None:
+            # Loaded first, so a deleted business named first in the token's claims isn't picked
+            self._load()
+        return self.business(self.business_ids[0]) if self else None
+
+    def resolve(self, value=None):
+        """A single Business: the one selected by `value`, else the default."""
+        if value is None:
+            value = self.requested
+        if value in (None, "", "all"):
+            return self.default_business
+        return self.business(value)
+
+
+def get_business_scope(request):
+    """
+    Return the BusinessScope attached to the request by the authentication
+    class, creating it for requests authenticated some other way.
+    """
+    scope = getattr(request, "business_scope", None)
+    if scope is None:
+        params = getattr(request, "query_params", request.GET)
+        scope = BusinessScope(request.user, requested=params.get("business"))
+        request.business_scope = scope
+    return scope
@@ -1,5 +1,11 @@
-from rest_framework import serializers
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
 from .models import UserProfile, Business, Product, Order, Return
+from .scope import get_business_scope
+from .tokens import RescopingRefreshToken
 import re
 
 class UserProfileSerializer(serializers.ModelSerializer):
@@ -22,6 +28,8 @@ class UserProfileSerializer(serializers.ModelSerializer):
         extra_kwargs = {
             "password": {"write_only": True, "min_length": 6},
             "email": {"required": False, "allow_blank": True},
+            # validate() checks uniqueness ignoring case; keep only the character check of the model field
+            "username": {"validators": [UnicodeUsernameValidator()]},
         }
 
     def validate(self, data):
@@ -51,15 +59,20 @@ class UserProfileSerializer(serializers.ModelSerializer):
             if not re.match(r"^(?=.*[A-Z])(?=.*\d).{6,}$", data["password"]):
                 errors["password"] = ["Password must have at least 6 chars, 1 uppercase, 1 number."]
 
-        if data.get("username") and UserProfile.objects.filter(username__iexact=data["username"]).exists():
-            errors["username"] = ["Username already exists."]
-        if data.get("email"):
+        email = data.get("email")
+        if email:
             try:
-                serializers.EmailField().run_validation(data["email"])
+                serializers.EmailField().run_validation(email)
             except serializers.ValidationError:
                 errors["email"] = ["Enter a valid email."]
-            else:
-                if UserProfile.objects.filter(email__iexact=data["email"]).exists():
+                email = None
+        if data.get("username") or email:
+            # One query for both, through the Lower() indexes
+            taken = UserProfile.objects.matching(username=data.get("username"), email=email)
+            for username_taken, email_taken in taken.values_list("username_matches", "email_matches"):
+                if username_taken:
+                    errors["username"] = ["Username already exists."]
+                if email_taken:
                     errors["email"] = ["Email already exists."]
 
         if data.get("contact_number"):
@@ -93,9 +106,14 @@ class UserProfileSerializer(serializers.ModelSerializer):
         return user
 
 class ProductSerializer(serializers.ModelSerializer):
+    # A GeneratedField, which ModelSerializer doesn't map
+    is_low_stock = serializers.BooleanField(read_only=True)
+
     class Meta:
         model = Product
         fields = "__all__"
+        # Changed by manage.py shard_stock, which moves the stock too
+        read_only_fields = ["stock_shards"]
 
     def validate(self, data):
         required_fields = ["product_name", "sku", "price", "selling_price"]
@@ -112,7 +130,7 @@ class ProductSerializer(serializers.ModelSerializer):
         request = self.context.get("request")
         context_business = self.context.get("business_for_validation")
         if request and request.user.is_authenticated:
-            business = context_business or request.user.businesses.first()
+            business = context_business or get_business_scope(request).default_business
             if business:
                 # 🟢 Exclude the current instance if it exists (for edits)
                 query = Product.objects.filter(business=business, sku=value)
@@ -133,7 +151,7 @@ class OrderSerializer(serializers.ModelSerializer):
         request = self.context.get("request")
         context_business = self.context.get("business_for_create")
         if request and request.user.is_authenticated:
-            business = context_business or request.user.businesses.first()
+            business = context_business or get_business_scope(request).default_business
             if not business:
                 raise serializers.ValidationError({"business": "No business found for this user."})
             validated_data['business'] = business
@@ -173,7 +191,7 @@ class ReturnSerializer(serializers.ModelSerializer):
 
         if request and request.user.is_authenticated:
             if not resolved_business:
-                user_first_business = request.user.businesses.first()
+                user_first_business = get_business_scope(request).default_business
                 if not user_first_business:
                     raise serializers.ValidationError({"business": "No business found for this user."})
                 resolved_business = user_first_business
@@ -187,4 +205,120 @@ class ReturnSerializer(serializers.ModelSerializer):
         validated_data['product_name'] = order.product_name
         validated_data['customer_name'] = order.customer_name
 
-        return super().create(validated_data)
\ No newline at end of file
+        return super().create(validated_data)
+
+
+class ScopedTokenRefreshSerializer(TokenRefreshSerializer):
+    # Refreshed access tokens pick up the user's current role and businesses
+    token_class = RescopingRefreshToken
+
+
+# -------------------------
+# Fast read paths for large lists
+# -------------------------
+# Converter factories: called once per serialize() call, they return the
+# function applied to each non-null value of a column.
+def _decimal_converter(field):
+    if field.localize or field.normalize_output:
+        return lambda: field.to_representation
+    places = field.decimal_places
+    coerce_to_string = getattr(field, "coerce_to_string", api_settings.COERCE_DECIMAL_TO_STRING)
+
+    def convert(value):
+        # Database decimals already carry the field's scale; only re-quantize when they don't
+        if places is not None and value.as_tuple().exponent != -places:
+            value = field.quantize(value)
+        return "{:f}".format(value) if coerce_to_string else value
+    return lambda: convert
+
+
+def _date_converter(field):
+    if getattr(field, "format", api_settings.DATE_FORMAT) != ISO_8601:
+        return lambda: field.to_representation
+    return lambda: _date_to_representation
+
+
+def _date_to_representation(value):
+    return value.isoformat()
+
+
+def _datetime_converter(field):
+    if getattr(field, "format", api_settings.DATETIME_FORMAT) != ISO_8601:
+        return lambda: field.to_representation
+
+    def make():
+        # Resolve the active timezone once per call rather than once per value
+        tz = timezone.get_current_timezone()
+
+        def convert(value):
+            if value.tzinfo is not None:
+                value = value.astimezone(tz)
+            value = value.isoformat()
+            return value[:-6] + "Z" if value.endswith("+00:00") else value
+        return convert
+    return make
+
+
+class ValuesSerializer:
+    """
+    Read-only counterpart of a ModelSerializer for large lists.
+
+    Rows come straight from values_list() in one pass and are turned into the
+    same dicts `serializer_class(queryset, many=True).data` would produce,
+    without building model instances or calling to_representation per field.
+    Columns are derived from the ModelSerializer, so the two stay in sync.
+    """
+
+    serializer_class = None
+    _columns = None
+
+    @classmethod
+    def get_columns(cls):
+        """(output key, values_list lookup, converter factory or None) per readable field."""
+        if cls.__dict__.get("_columns") is None:
+            columns = []
+            for name, field in cls.serializer_class().fields.items():
+                if field.write_only:
+                    continue
+                converter = None
+                if isinstance(field, serializers.DecimalField):
+                    converter = _decimal_converter(field)
+                elif isinstance(field, serializers.DateTimeField):
+                    converter = _datetime_converter(field)
+                elif isinstance(field, serializers.DateField):
+                    converter = _date_converter(field)
+                elif not isinstance(field, (serializers.CharField, serializers.ChoiceField, serializers.IntegerField,
+                                            serializers.BooleanField, serializers.FloatField,
+                                            serializers.PrimaryKeyRelatedField)):
+                    raise TypeError(f"{cls.__name__} cannot read field {name!r} ({type(field).__name__})")
+                columns.append((name, field.source.replace(".", "__"), converter))
+            cls._columns = columns
+        return cls._columns
+
+    @classmethod
+    def serialize(cls, queryset):
+        columns = cls.get_columns()
+        keys = [key for key, _lookup, _converter in columns]
+        converted = [(i, key, make()) for i, (key, _lookup, make) in enumerate(columns) if make]
+        data = []
+        append = data.append
+        for row in queryset.values_list(*(lookup for _key, lookup, _converter in columns)):
+            item = dict(zip(keys, row))
+            for i, key, converter in converted:
+                value = row[i]
+                if value is not None:
+                    item[key] = converter(value)
+            append(item)
+        return data
+
+
+class ProductValuesSerializer(ValuesSerializer):
+    serializer_class = ProductSerializer
+
+
+class OrderValuesSerializer(ValuesSerializer):
+    serializer_class = OrderSerializer
+
+
+class ReturnValuesSerializer(ValuesSerializer):
+    serializer_class = ReturnSerializer
@@ -0,0 +1,468 @@
+"""
+Tenant sharding: each business's rows can live in a database of its own.
+
+settings.SHARD_ALIASES lists the databases tenants can live in: `default`
+and those configured with DATABASE_SHARDS (see settings.py). A business is
+on `default` unless the TenantShard map names another alias. Users,
+businesses, tokens and the map itself stay on `default`.
+
+TenantRouter sends the queries of the models in TENANT_MODELS to their
+business's database:
+
+- a row's own business_id decides for saves, deletes and related lookups;
+- other queries, create() and bulk_create() included, follow the request's
+  tenant: BusinessScopedJWTAuthentication calls route() with the businesses
+  the request selects. Selecting businesses that live in different databases
+  (`?business=all` across shards) raises CrossShardQuery on the first tenant
+  query, which answers 400 listing the businesses of each database; pick
+  one with `?business=<id>`. Views whose results add up across businesses
+  (the dashboard) read each database in turn with fan_out() instead.
+- maintenance code that walks every database wraps each in use_shard().
+
+Every database gets the whole schema, and the foreign keys from tenant
+tables to Business have no database constraint, since the business row is on
+`default`. A business's change counter is one of its tenant rows and moves
+with it. Each shard's tenant tables number their rows from its own
+SHARD_ID_SPAN range (reserve_ids() after migrate), so a moved row keeps its
+id.
+
+move() (manage.py move_tenant) moves a business between databases while it
+keeps taking orders:
+
+1. copy all of its rows;
+2. copy again the Products, Orders, Returns and Tombstones whose change_seq
+   is past the business's counter at the previous pass, and the new rows of
+   the other tables, until few are left. Rows written between two tables'
+   reads can reference rows not copied yet, so these passes run with the
+   target's constraint checks off, like loaddata (where a database can't
+   turn them off, PostgreSQL, such a pass fails and the move can be rerun);
+3. mark it `moving`: its writes then fail with TenantMoving (503). Wait
+   SHARD_MAP_TTL for every process's cached map to see that, copy the last
+   changed rows and the untracked tables (change counter, customers, stock
+   shards, archives, summaries, snapshots, forecast) again and delete what
+   was deleted since. The counter comes along, so sync cursors stay valid;
+4. point the map at the target, wait SHARD_MAP_TTL again and delete the rows
+   from the source.
+
+Writes that bypass change_seq (backfill_customers linking rows) shouldn't run
+during a move.
+
+To try it locally with SQLite files:
+
+    export DATABASE_SHARDS="shard1=sqlite:///shard1.sqlite3"
+    python manage.py migrate --database shard1
+    python manage.py move_tenant --business 3 --to shard1
+"""
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, models, transaction
+from django.db.models.signals import post_migrate, pre_delete
+from django.dispatch import receiver
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .models import (
+    ArchivedOrder, ArchivedReturn, Business, BusinessChangeCounter, ChangeTracked, Customer, DailySummary,
+    DashboardSnapshot, Order, Product, Return, SalesForecastModel, StockShard, TenantShard, Tombstone,
+    delete_rows, start_change_counter,
+)
+from .scope import BusinessScopeError
+
+# Models whose rows belong to a business, in the order move() copies them
+# (referenced rows first), with the lookup of their business
+TENANT_MODELS = {
+    BusinessChangeCounter: "business_id",
+    Customer: "business_id",
+    Product: "business_id",
+    StockShard: "product__business_id",
+    Order: "business_id",
+    Return: "business_id",
+    ArchivedOrder: "business_id",
+    ArchivedReturn: "business_id",
+    DailySummary: "business_id",
+    DashboardSnapshot: "business_id",
+    SalesForecastModel: "business_id",
+    Tombstone: "business_id",
+}
+# Their every write stamps change_seq, so move() catches up on them by it
+TRACKED_MODELS = {model for model in TENANT_MODELS if issubclass(model, ChangeTracked)} | {Tombstone}
+
+# Rows move() copies or deletes per query
+BATCH_SIZE = 1000
+# Catch-up passes before move() stops the tenant's writes regardless
+CATCH_UP_PASSES = 5
+
+# Business ids the current request acts on (route()), and the alias use_shard() pins
+_tenant = ContextVar("inventory_tenant", default=None)
+_pinned = ContextVar("inventory_pinned_shard", default=None)
+
+# Per-process copy of the map: (time.monotonic() it expires, {business id: alias}, moving business ids)
+_map = (0.0, {}, frozenset())
+_map_lock = threading.Lock()
+
+
+class TenantMoving(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "This business is being moved to another database; try again in a few seconds."
+    default_code = "tenant_moving"
+
+
+class CrossShardQuery(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = "These businesses are kept in different databases; query one at a time with ?business=<id>."
+    default_code = "cross_shard"
+
+    def __init__(self, groups=None):
+        detail = {"detail": self.default_detail}
+        if groups:
+            # The businesses that can be asked for together
+            detail["business_groups"] = sorted(sorted(business_ids) for business_ids in groups.values())
+        super().__init__(code=self.default_code)
+        # Kept as is: APIException would turn the ids into strings
+        self.detail = detail
+
+
+class MoveError(Exception):
+    """Raised when move() can't move a business."""
+
+
+def databases():
+    """The aliases tenants can live in, `default` first."""
+    return list(getattr(settings, "SHARD_ALIASES", [DEFAULT_DB_ALIAS]))
+
+
+def sharded():
+    return len(databases()) > 1
+
+
+def forget():
+    """Drop this process's copy of the map, so the next lookup reads it again."""
+    global _map
+    _map = (0.0, {}, frozenset())
+
+
+def _shard_map():
+    global _map
+    expires, aliases, moving = _map
+    if expires > time.monotonic():
+        return aliases, moving
+    with _map_lock:
+        if _map[0] <= time.monotonic():
+            rows = list(TenantShard.objects.using(DEFAULT_DB_ALIAS).values_list("business_id", "alias", "moving"))
+            _map = (
+                time.monotonic() + getattr(settings, "SHARD_MAP_TTL", 5),
+                {business_id: alias for business_id, alias, _moving in rows},
+                frozenset(business_id for business_id, _alias, moving in rows if moving),
+            )
+        return _map[1], _map[2]
+
+
+def shard_for(business_id):
+    """The alias of the database `business_id`'s rows live in."""
+    if business_id is None or not sharded():
+        return DEFAULT_DB_ALIAS
+    return _shard_map()[0].get(business_id, DEFAULT_DB_ALIAS)
+
+
+def group(business_ids):
+    """{alias: [business id, ...]} of `business_ids` by the database they live in."""
+    groups = defaultdict(list)
+    for business_id in business_ids:
+        groups[shard_for(business_id)].append(business_id)
+    return dict(groups)
+
+
+def route(scope):
+    """Send the current request's tenant queries to the database of the businesses its BusinessScope selects."""
+    if not sharded():
+        return
+    try:
+        business_ids = scope.select()
+    except BusinessScopeError:
+        # The view reports the bad parameter; until then its queries stay with the user's businesses
+        business_ids = scope.business_ids
+    _tenant.set(tuple(business_ids))
+
+
+def clear():
+    """Stop routing by the current request's businesses."""
+    _tenant.set(None)
+
+
+def fan_out(business_ids, read):
+    """
+    [read(ids), ...] for the ids of `business_ids` in each database, with
+    that database's tenant queries pinned to it (use_shard()).
+    """
+    results = []
+    for alias, ids in group(business_ids).items():
+        with use_shard(alias):
+            results.append(read(ids))
+    return results
+
+
+@contextmanager
+def use_shard(alias):
+    """Send tenant queries that have no business of their own to `alias`."""
+    token = _pinned.set(alias)
+    try:
+        yield alias
+    finally:
+        _pinned.reset(token)
+
+
+def _business_of(instance):
+    if isinstance(instance, Business):
+        return instance.pk
+    return getattr(instance, "business_id", None)
+
+
+class TenantRouter:
+    """
+    Sends queries of TENANT_MODELS to their business's database and leaves
+    `default` reads to ReplicaRouter (listed after it).
+    """
+
+    def _route(self, model, hints):
+        """(alias or None, business ids it was chosen for)."""
+        instance = hints.get("instance")
+        if model not in TENANT_MODELS:
+            # A sharded row's business (and anything else global) is on default
+            if instance is not None and type(instance) in TENANT_MODELS and instance._state.db not in (None, DEFAULT_DB_ALIAS):
+                return DEFAULT_DB_ALIAS, ()
+            return None, ()
+        if not sharded():
+            return None, ()
+        business_id = _business_of(instance)
+        if business_id is not None:
+            return shard_for(business_id), (business_id,)
+        if instance is not None and instance._state.db:
+            return instance._state.db, ()
+        pinned = _pinned.get()
+        if pinned is not None:
+            return pinned, ()
+        business_ids = _tenant.get()
+        if not business_ids:
+            return None, ()
+        groups = group(business_ids)
+        if len(groups) > 1:
+            raise CrossShardQuery(groups)
+        return next(iter(groups)), business_ids
+
+    def db_for_read(self, model, **hints):
+        alias, _business_ids = self._route(model, hints)
+        # Tenants on default can still be read from the replica
+        return alias if alias != DEFAULT_DB_ALIAS or model not in TENANT_MODELS else None
+
+    def db_for_write(self, model, **hints):
+        alias, business_ids = self._route(model, hints)
+        if business_ids and not _shard_map()[1].isdisjoint(business_ids):
+            raise TenantMoving()
+        return alias
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # A tenant row and its business are in different databases
+        if (type(obj1) in TENANT_MODELS) != (type(obj2) in TENANT_MODELS):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Every database gets the whole schema
+        return None
+
+
+def reserve_ids(alias):
+    """
+    Start the ids of `alias`'s tenant tables at the beginning of its
+    SHARD_ID_SPAN range (the n-th database of SHARD_ALIASES numbers from
+    n * SHARD_ID_SPAN), unless they are past it already.
+    """
+    start = databases().index(alias) * settings.SHARD_ID_SPAN
+    connection = connections[alias]
+    if not start or connection.vendor not in ("sqlite", "postgresql"):
+        return
+    with connection.cursor() as cursor:
+        for model in TENANT_MODELS:
+            if not isinstance(model._meta.pk, models.AutoField):
+                continue
+            table = model._meta.db_table
+            if connection.vendor == "sqlite":
+                cursor.execute("UPDATE sqlite_sequence SET seq = %s WHERE name = %s AND seq < %s", [start, table, start])
+                cursor.execute(
+                    "INSERT INTO sqlite_sequence (name, seq) SELECT %s, %s "
+                    "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = %s)",
+                    [table, start, table],
+                )
+            else:
+                cursor.execute(
+                    "SELECT setval(s, %s) FROM pg_get_serial_sequence(%s, %s) AS s "
+                    "WHERE COALESCE(pg_sequence_last_value(s), 0) < %s",
+                    [start, table, model._meta.pk.column, start],
+                )
+
+
+@receiver(post_migrate, dispatch_uid="shard_ids")
+def shard_migrated(sender, app_config, using, **kwargs):
+    if app_config.label == "inventory" and using in databases():
+        reserve_ids(using)
+
+
+@receiver(pre_delete, sender=Business, dispatch_uid="business_shard")
+def business_deleted(sender, instance, using, **kwargs):
+    # The delete's cascade only reaches rows on default
+    alias = TenantShard.objects.using(using).filter(business_id=instance.pk).values_list("alias", flat=True).first()
+    if alias is not None and alias != using:
+        purge(instance.pk, alias)
+
+
+# -------------------------
+# Moving a tenant
+# -------------------------
+def _rows(model, business_id, alias):
+    return model._base_manager.using(alias).filter(**{TENANT_MODELS[model]: business_id})
+
+
+def _pks(model, business_id, alias, since=None):
+    rows = _rows(model, business_id, alias)
+    if since is not None:
+        rows = rows.filter(change_seq__gt=since)
+    return list(rows.order_by("pk").values_list("pk", flat=True))
+
+
+def _batches(pks, batch_size):
+    for start in range(0, len(pks), batch_size):
+        yield pks[start:start + batch_size]
+
+
+def _counter(business_id, alias):
+    """`business_id`'s change counter in `alias`, started if it has none yet (so move() copies it)."""
+    counter = BusinessChangeCounter.objects.using(alias).filter(pk=business_id)
+    value = counter.values_list("value", flat=True).first()
+    if value is None:
+        start_change_counter(business_id, alias)
+        value = counter.values_list("value", flat=True).first()
+    return value
+
+
+def _copy(model, pks, source, target, batch_size):
+    """Upsert the rows `pks` of `model` from `source` into `target` as they are, timestamps included."""
+    opts = model._meta
+    update_fields = [f.name for f in opts.concrete_fields if not f.primary_key and not f.generated]
+    # bulk_create() stamps these with the time of the copy; written back as read below
+    stamped = [f.attname for f in opts.concrete_fields if getattr(f, "auto_now", False) or getattr(f, "auto_now_add", False)]
+    rows = model._base_manager.using(target)
+    for batch in _batches(pks, batch_size):
+        objs = list(model._base_manager.using(source).filter(pk__in=batch).order_by())
+        stamps = [[getattr(obj, name) for name in stamped] for obj in objs]
+        rows.bulk_create(objs, update_conflicts=True, update_fields=update_fields, unique_fields=[opts.pk.name])
+        if stamped:
+            for obj, values in zip(objs, stamps):
+                obj.__dict__.update(zip(stamped, values))
+            rows.bulk_update(objs, stamped)
+    return len(pks)
+
+
+def _changed(model, business_id, source, target, since):
+    """The rows of `model` changed in `source` since the counter was `since`; for untracked models, those `target` lacks."""
+    if model in TRACKED_MODELS:
+        return _pks(model, business_id, source, since)
+    return sorted(set(_pks(model, business_id, source)) - set(_pks(model, business_id, target)))
+
+
+def _delete(model, pks, alias, batch_size):
+    for batch in _batches(pks, batch_size):
+        delete_rows(model, batch, alias)
+
+
+def purge(business_id, alias, batch_size=BATCH_SIZE):
+    """Delete `business_id`'s tenant rows from `alias`, referencing rows first."""
+    for model in reversed(TENANT_MODELS):
+        _delete(model, _pks(model, business_id, alias), alias, batch_size)
+
+
+def _point(business_id, alias, moving=False):
+    """Record that `business_id` lives in `alias` (and whether its writes are stopped)."""
+    rows = TenantShard.objects.using(DEFAULT_DB_ALIAS)
+    if alias == DEFAULT_DB_ALIAS and not moving:
+        rows.filter(business_id=business_id).delete()
+    else:
+        rows.update_or_create(business_id=business_id, defaults={"alias": alias, "moving": moving})
+    forget()
+
+
+def _check_ids(business_id, source, target, batch_size):
+    for model in TENANT_MODELS:
+        for batch in _batches(_pks(model, business_id, source), batch_size):
+            taken = model._base_manager.using(target).filter(pk__in=batch).exclude(**{TENANT_MODELS[model]: business_id})
+            if taken.exists():
+                raise MoveError(
+                    f"Some {model._meta.verbose_name_plural} ids of business {business_id} are used by other "
+                    f"businesses in {target!r}."
+                )
+
+
+def move(business_id, target, batch_size=BATCH_SIZE, keep_source=False, log=lambda message: None):
+    """Move `business_id`'s rows to the database `target` (see the module docstring)."""
+    if target not in databases():
+        raise MoveError(f"{target!r} is not one of SHARD_ALIASES {databases()}.")
+    if not Business.objects.using(DEFAULT_DB_ALIAS).filter(pk=business_id).exists():
+        raise MoveError(f"No business {business_id}.")
+    current = TenantShard.objects.using(DEFAULT_DB_ALIAS).filter(business_id=business_id).first()
+    if current is not None and current.moving:
+        raise MoveError(f"Business {business_id} is already being moved.")
+    source = current.alias if current is not None else DEFAULT_DB_ALIAS
+    if source == target:
+        raise MoveError(f"Business {business_id} is in {target!r} already.")
+    _check_ids(business_id, source, target, batch_size)
+    ttl = getattr(settings, "SHARD_MAP_TTL", 5)
+
+    moving = False
+    try:
+        # Left over from an earlier move back from the target
+        purge(business_id, target, batch_size)
+        mark = _counter(business_id, source)
+        with connections[target].constraint_checks_disabled():
+            copied = sum(_copy(model, _pks(model, business_id, source), source, target, batch_size) for model in TENANT_MODELS)
+            log(f"Copied {copied} rows from {source!r} to {target!r}.")
+            for _ in range(CATCH_UP_PASSES):
+                since, mark = mark, _counter(business_id, source)
+                copied = sum(
+                    _copy(model, _changed(model, business_id, source, target, since), source, target, batch_size)
+                    for model in TENANT_MODELS
+                )
+                log(f"Caught up on {copied} rows changed meanwhile.")
+                if copied < batch_size:
+                    break
+
+        _point(business_id, source, moving=True)
+        moving = True
+        log(f"Writes to business {business_id} stopped; waiting {ttl}s for every process to see that.")
+        time.sleep(ttl)
+        with transaction.atomic(using=target):
+            for model in reversed(TENANT_MODELS):
+                gone = set(_pks(model, business_id, target)) - set(_pks(model, business_id, source))
+                _delete(model, sorted(gone), target, batch_size)
+            copied = sum(
+                _copy(model, _pks(model, business_id, source, mark if model in TRACKED_MODELS else None), source, target, batch_size)
+                for model in TENANT_MODELS
+            )
+        _point(business_id, target)
+        moving = False
+        log(f"Copied the last {copied} rows; business {business_id} now lives in {target!r}.")
+    except BaseException:
+        if moving:
+            _point(business_id, source)
+        purge(business_id, target, batch_size)
+        raise
+
+    if not keep_source:
+        # Processes still reading the old map read the source until then
+        time.sleep(ttl)
+        purge(business_id, source, batch_size)
+        log(f"Deleted its rows from {source!r}.")
+    return source
@@ -0,0 +1,225 @@
+"""
+Today's dashboard numbers, kept up to date on write (DashboardSnapshot).
+
+A business's snapshot holds the number of its orders and returns dated today
+and, per product name, the net quantity (ordered minus returned) with the
+product's selling and cost price in paise. That is all dashboard_metrics needs
+for its totals, net profit and top sales.
+
+The receivers below apply every save and delete of an Order or Return dated
+today as a delta, and reprice the lines of a Product whose name or prices
+change. Bulk writes (models.bulk_written) drop the snapshots of the
+businesses they touch instead. A business without a snapshot gets one built
+from its rows when the dashboard first reads it (rebuild()), so writes to a
+business nobody looks at cost one indexed lookup. manage.py
+reconcile_snapshots rebuilds them all and reports any that had drifted.
+"""
+from collections import defaultdict
+from datetime import date
+
+from django.db import router, transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import DashboardSnapshot, Order, Product, Return, bulk_written, lock_change_seqs
+from .money import to_paise
+
+# Attributes of an order or return that move it between snapshot lines
+LINE_ATTRS = ("business_id", "date", "product_name", "quantity")
+LINE_FIELDS = {"business", "business_id", "date", "product_name", "quantity"}
+
+# Attributes of a product that price snapshot lines
+PRICE_ATTRS = ("business_id", "product_name", "price", "selling_price")
+PRICE_FIELDS = {"business", "business_id", "product_name", "price", "selling_price"}
+
+# model -> (snapshot count field, sign of its quantity in the net)
+COUNTS = {Order: ("orders", 1), Return: ("returns", -1)}
+
+# A date field's parsing, for dates assigned as 'YYYY-MM-DD' strings
+_as_date = Order._meta.get_field("date").to_python
+
+
+def today_lines(business_ids, day=None):
+    """
+    (lines, orders, returns) for `business_ids` on `day` (today): lines are
+    (product_name, net quantity, selling price, cost price) tuples, prices in
+    paise. One query, plus a rebuild() of the businesses without a snapshot.
+    """
+    day = day or date.today()
+    snapshots = list(DashboardSnapshot.objects.filter(business_id__in=business_ids, date=day))
+    missing = set(business_ids) - {s.business_id for s in snapshots}
+    if missing:
+        snapshots += rebuild(missing, day)
+    lines = [
+        (name, quantity, selling_price, price)
+        for snapshot in snapshots
+        for name, (quantity, selling_price, price) in snapshot.lines.items()
+    ]
+    return lines, sum(s.orders for s in snapshots), sum(s.returns for s in snapshots)
+
+
+def rebuild(business_ids, day=None, using=None):
+    """
+    Compute the snapshots of `business_ids` on `day` (today) from their
+    orders, returns and products, and save them. Returns the snapshots.
+    """
+    day = day or date.today()
+    using = using or router.db_for_write(DashboardSnapshot)
+    with transaction.atomic(using=using):
+        # Every write takes its business's change counter for its change_seq, so while
+        # this holds theirs none of these businesses' writes can commit between the
+        # reads below and the snapshots. Other businesses' writes don't wait.
+        lock_change_seqs(business_ids, using)
+        snapshots = {pk: DashboardSnapshot(business_id=pk, date=day) for pk in business_ids}
+        net = defaultdict(int)
+        for model, (count_field, sign) in COUNTS.items():
+            totals = (
+                model.objects.using(using).filter(business_id__in=business_ids, date=day)
+                .values_list("business_id", "product_name").annotate(total=Sum("quantity"), rows=Count("pk")).order_by()
+            )
+            for business_id, name, total, rows in totals:
+                net[business_id, name] += sign * total
+                snapshot = snapshots[business_id]
+                setattr(snapshot, count_field, getattr(snapshot, count_field) + rows)
+        keys = [key for key, quantity in net.items() if quantity]
+        price = prices(keys, using) if keys else {}
+        for business_id, name in keys:
+            snapshots[business_id].lines[name] = [net[business_id, name], *price.get((business_id, name), (0, 0))]
+        return DashboardSnapshot.objects.using(using).bulk_create(
+            snapshots.values(), update_conflicts=True, unique_fields=["business", "date"],
+            update_fields=["orders", "returns", "lines", "updated_at"],
+        )
+
+
+def forget(business_ids, day=None, using=None):
+    """Drop the snapshots of `business_ids` on `day` (today); the next read rebuilds them."""
+    if business_ids:
+        DashboardSnapshot.objects.using(using).filter(business_id__in=business_ids, date=day or date.today()).delete()
+
+
+def prices(keys, using=None):
+    """
+    (business_id, product_name) -> (selling price, cost price) in paise, for
+    the (business_id, product_name) `keys` that have a product.
+    """
+    names = defaultdict(set)
+    for business_id, name in keys:
+        names[business_id].add(name)
+    match = Q()
+    for business_id, business_names in names.items():
+        match |= Q(business_id=business_id, product_name__in=business_names)
+    rows = (
+        Product.objects.using(using).filter(match).order_by("pk")
+        .values_list("business_id", "product_name", "selling_price", "price")
+    )
+    # Like the dashboard's price maps, the last product of a name wins
+    return {(business_id, name): (to_paise(sp), to_paise(cp)) for business_id, name, sp, cp in rows}
+
+
+def _locked_snapshot(business_id, using):
+    return (
+        DashboardSnapshot.objects.using(using).select_for_update()
+        .filter(business_id=business_id, date=date.today()).first()
+    )
+
+
+def _apply(deltas, using):
+    """Add (business_id, day, product_name, quantity, count field, count) deltas dated today to the snapshots."""
+    today = date.today()
+    by_business = defaultdict(list)
+    for business_id, day, *change in deltas:
+        if business_id is not None and _as_date(day) == today:
+            by_business[business_id].append(change)
+    for business_id, changes in by_business.items():
+        snapshot = _locked_snapshot(business_id, using)
+        if snapshot is None:
+            continue
+        new_keys = {(business_id, name) for name, *_ in changes if name not in snapshot.lines}
+        price = prices(new_keys, using) if new_keys else {}
+        for name, quantity, count_field, count in changes:
+            line = snapshot.lines.get(name) or [0, *price.get((business_id, name), (0, 0))]
+            line[0] += quantity
+            if line[0]:
+                snapshot.lines[name] = line
+            else:
+                snapshot.lines.pop(name, None)
+            setattr(snapshot, count_field, getattr(snapshot, count_field) + count)
+        snapshot.save(using=using, update_fields=["lines", "orders", "returns", "updated_at"])
+
+
+def _reprice(keys, using):
+    """Refresh the prices of the snapshot lines of (business_id, product_name) `keys`."""
+    by_business = defaultdict(set)
+    for business_id, name in keys:
+        if business_id is not None:
+            by_business[business_id].add(name)
+    for business_id, names in by_business.items():
+        snapshot = _locked_snapshot(business_id, using)
+        names = [name for name in names if snapshot is not None and name in snapshot.lines]
+        if not names:
+            continue
+        price = prices([(business_id, name) for name in names], using)
+        for name in names:
+            snapshot.lines[name][1:] = price.get((business_id, name), (0, 0))
+        snapshot.save(using=using, update_fields=["lines", "updated_at"])
+
+
+@receiver(post_save, sender=Order, dispatch_uid="order_snapshot")
+@receiver(post_save, sender=Return, dispatch_uid="return_snapshot")
+def line_saved(sender, instance, created, using, update_fields, **kwargs):
+    if update_fields is not None and not LINE_FIELDS & set(update_fields):
+        return
+    count_field, sign = COUNTS[sender]
+    new = business_id, day, name, quantity = tuple(getattr(instance, attr) for attr in LINE_ATTRS)
+    deltas = [(business_id, day, name, sign * quantity, count_field, 1)]
+    if not created:
+        loaded = getattr(instance, "_loaded", {})
+        if any(attr not in loaded for attr in LINE_ATTRS):
+            # Saved without being loaded: what it replaced is unknown
+            forget({instance.business_id} - {None}, using=using)
+            return
+        old = tuple(loaded[attr] for attr in LINE_ATTRS)
+        if old == new:
+            return
+        business_id, day, name, quantity = old
+        deltas.append((business_id, day, name, -sign * quantity, count_field, -1))
+    _apply(deltas, using)
+
+
+@receiver(post_delete, sender=Order, dispatch_uid="order_snapshot")
+@receiver(post_delete, sender=Return, dispatch_uid="return_snapshot")
+def line_deleted(sender, instance, using, **kwargs):
+    count_field, sign = COUNTS[sender]
+    _apply([(instance.business_id, instance.date, instance.product_name, -sign * instance.quantity, count_field, -1)], using)
+
+
+@receiver(post_save, sender=Product, dispatch_uid="product_snapshot")
+def product_saved(sender, instance, created, using, update_fields, **kwargs):
+    if update_fields is not None and not PRICE_FIELDS & set(update_fields):
+        return
+    keys = {(instance.business_id, instance.product_name)}
+    if not created:
+        loaded = getattr(instance, "_loaded", {})
+        if any(attr not in loaded for attr in PRICE_ATTRS):
+            forget({instance.business_id} - {None}, using=using)
+            return
+        old = (loaded["business_id"], loaded["product_name"], to_paise(loaded["price"]), to_paise(loaded["selling_price"]))
+        if old == (instance.business_id, instance.product_name, to_paise(instance.price), to_paise(instance.selling_price)):
+            return
+        keys.add(old[:2])
+    _reprice(keys, using)
+
+
+@receiver(post_delete, sender=Product, dispatch_uid="product_snapshot")
+def product_deleted(sender, instance, using, **kwargs):
+    _reprice({(instance.business_id, instance.product_name)}, using)
+
+
+@receiver(bulk_written, sender=Order, dispatch_uid="order_snapshot")
+@receiver(bulk_written, sender=Return, dispatch_uid="return_snapshot")
+@receiver(bulk_written, sender=Product, dispatch_uid="product_snapshot")
+def rows_bulk_written(sender, using, business_ids, fields, **kwargs):
+    watched = PRICE_FIELDS if sender is Product else LINE_FIELDS
+    if fields is None or watched & set(fields):
+        forget(business_ids, using=using)
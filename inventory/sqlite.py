@@ -0,0 +1,29 @@
+"""
+The journal mode of SQLite database files (settings.SQLITE_JOURNAL_MODE).
+
+Unlike the per-connection pragmas in settings.SQLITE_OPTIONS, the journal
+mode is stored in the database file. Setting it in every connection's
+init_command rewrote the file's header on each manage.py run, so it is set
+once instead, after migrate (and by manage.py bench_sqlite).
+"""
+from django.conf import settings
+from django.db import connections
+from django.db.models.signals import post_migrate
+from django.dispatch import receiver
+
+
+def set_journal_mode(connection, mode=None):
+    """Put `connection`'s database file in `mode` (SQLITE_JOURNAL_MODE) unless it already is. Returns the mode."""
+    mode = (mode or settings.SQLITE_JOURNAL_MODE).lower()
+    with connection.cursor() as cursor:
+        if cursor.execute("PRAGMA journal_mode").fetchone()[0] != mode:
+            cursor.execute(f"PRAGMA journal_mode={mode}")
+    return mode
+
+
+@receiver(post_migrate, dispatch_uid="sqlite_journal_mode")
+def migrated(sender, app_config, using, **kwargs):
+    connection = connections[using]
+    # An in-memory database (the test runner's) has no file to set it on
+    if app_config.label == "inventory" and connection.vendor == "sqlite" and not connection.is_in_memory_db():
+        set_journal_mode(connection)
@@ -0,0 +1,152 @@
+"""
+Stock changes made by orders and returns, and sharded stock for hot products.
+
+A product's stock is normally its current_stock. take() and give() change it
+with one conditional UPDATE, so concurrent orders never oversell or lose a
+change the way a read-modify-write save() can.
+
+When one product sells fast, every order of it waits on that product's row.
+set_shards() splits its stock across N StockShard rows instead (N > 0 in
+Product.stock_shards):
+
+- take() tries a random shard with a conditional UPDATE, then the others in
+  random order. Only when no single shard holds the quantity does it lock
+  them all and take it across several.
+- give() adds to a random shard.
+- current_stock is the shards' total as of the last reconcile() (manage.py
+  reconcile_stock, run every few minutes; see render.yaml). Until then the
+  product list, low-stock flag and analyses show that total.
+
+Setting current_stock on a sharded product (a product edit) spreads the new
+value across its shards.
+"""
+import random
+
+from django.db import router, transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import Product, StockShard
+
+
+def take(product, quantity, clamp=False, using=None):
+    """
+    Take `quantity` off `product`'s stock. Returns False, taking nothing, if
+    there isn't that much; with `clamp`, takes what there is and returns True.
+    """
+    using = using or router.db_for_write(Product, instance=product)
+    for _attempt in range(2):
+        if product.stock_shards:
+            taken = _take_from_shards(product, quantity, clamp, using)
+        else:
+            unsharded = Product.objects.using(using).filter(pk=product.pk, stock_shards=0)
+            if clamp:
+                taken = unsharded.update(current_stock=Greatest(F("current_stock") - quantity, Value(0)))
+            else:
+                taken = unsharded.filter(current_stock__gte=quantity).update(current_stock=F("current_stock") - quantity)
+        if taken:
+            return True
+        # Short of stock, or switched to or from shards since it was loaded
+        shards = Product.objects.using(using).filter(pk=product.pk).values_list("stock_shards", flat=True).first()
+        if shards is None or shards == product.stock_shards:
+            return False
+        product.stock_shards = shards
+    return False
+
+
+def give(product, quantity, using=None):
+    """Add `quantity` to `product`'s stock."""
+    using = using or router.db_for_write(Product, instance=product)
+    for _attempt in range(2):
+        if product.stock_shards:
+            shard = random.randrange(product.stock_shards)
+            added = (
+                StockShard.objects.using(using).filter(product_id=product.pk, shard=shard)
+                .update(quantity=F("quantity") + quantity)
+            )
+        else:
+            added = (
+                Product.objects.using(using).filter(pk=product.pk, stock_shards=0)
+                .update(current_stock=F("current_stock") + quantity)
+            )
+        if added:
+            return
+        product.stock_shards = Product.objects.using(using).filter(pk=product.pk).values_list("stock_shards", flat=True).first()
+        if product.stock_shards is None:
+            return
+
+
+def _take_from_shards(product, quantity, clamp, using):
+    shards = StockShard.objects.using(using).filter(product_id=product.pk)
+    order = random.sample(range(product.stock_shards), product.stock_shards)
+    for shard in order:
+        if shards.filter(shard=shard, quantity__gte=quantity).update(quantity=F("quantity") - quantity):
+            return True
+    # No shard holds it all: take it across them, all locked (in shard order, so takers don't deadlock)
+    with transaction.atomic(using=using):
+        locked = list(shards.select_for_update().order_by("shard"))
+        available = sum(s.quantity for s in locked)
+        if not locked or (available < quantity and not clamp):
+            return False
+        remaining = min(quantity, available)
+        for s in locked:
+            part = min(s.quantity, remaining)
+            s.quantity -= part
+            remaining -= part
+        StockShard.objects.using(using).bulk_update(locked, ["quantity"])
+    return True
+
+
+def set_shards(product, shards, total=None, using=None):
+    """
+    Keep `product`'s stock in `shards` StockShard rows (0: in current_stock
+    again), spreading `total` (its current stock) evenly across them.
+    """
+    using = using or router.db_for_write(Product, instance=product)
+    with transaction.atomic(using=using):
+        # The product's row first, then its shards: the order take() falls back in
+        locked = Product.objects.using(using).select_for_update().get(pk=product.pk)
+        existing = StockShard.objects.using(using).select_for_update().filter(product_id=product.pk)
+        if total is None:
+            total = sum(s.quantity for s in existing) if locked.stock_shards else locked.current_stock
+        existing.delete()
+        StockShard.objects.using(using).bulk_create([
+            StockShard(product_id=product.pk, shard=i, quantity=total // shards + (i < total % shards))
+            for i in range(shards)
+        ])
+        Product.objects.using(using).filter(pk=product.pk).update(stock_shards=shards, current_stock=total)
+    product.stock_shards, product.current_stock = shards, total
+
+
+def reconcile(business_ids=None, using=None, product_ids=None):
+    """
+    Write the shards' totals into current_stock where it differs, for the
+    products of `business_ids` or `product_ids` (ids or a subquery), else
+    all. Returns the products updated.
+    """
+    using = using or router.db_for_write(Product)
+    totals = (
+        StockShard.objects.filter(product_id=OuterRef("pk")).order_by()
+        .values("product_id").annotate(total=Sum("quantity")).values("total")
+    )
+    sharded = Product.objects.using(using).filter(stock_shards__gt=0)
+    if business_ids is not None:
+        sharded = sharded.filter(business_id__in=business_ids)
+    if product_ids is not None:
+        sharded = sharded.filter(pk__in=product_ids)
+    drifted = sharded.alias(total=Coalesce(Subquery(totals), 0)).exclude(current_stock=F("total"))
+    # Re-read inside the UPDATE, so an order taken meanwhile is counted
+    return drifted.update(current_stock=Coalesce(Subquery(totals), 0))
+
+
+@receiver(post_save, sender=Product, dispatch_uid="product_stock_shards")
+def product_saved(sender, instance, created, using, update_fields, **kwargs):
+    if created or not instance.stock_shards:
+        return
+    if update_fields is not None and "current_stock" not in update_fields:
+        return
+    loaded = getattr(instance, "_loaded", {})
+    if "current_stock" in loaded and loaded["current_stock"] != instance.current_stock:
+        set_shards(instance, instance.stock_shards, total=instance.current_stock, using=using)
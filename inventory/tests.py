@@ -1,3 +1,1792 @@
-from django.test import TestCase
-
-# Create your tests here.
+import asyncio
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from itertools import count
+from unittest import mock, skipUnless
+
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.contrib.auth.signals import user_login_failed
+from django.conf import settings
+from django.db import OperationalError, connection, connections, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.core.wsgi import get_wsgi_application
+from django.db.backends.signals import connection_created
+from django.db.models import F, Sum
+from django.db.utils import load_backend
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+import numpy as np
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase, APITransactionTestCase
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from rojmel.warmup import open_connections, warm_up
+
+from . import archive, async_db, async_views, catalog, coalesce, customers, replica, sharding, snapshots, sqlite, stock, throttling
+from . import admin as inventory_admin
+from . import urls as inventory_urls
+from .admin import EstimatedCountPaginator
+from .analytics import NEVER, Window, first_seen, rank
+from .authentication import verified_tokens
+from .middleware import CompressionMiddleware, brotli, negotiate_encoding
+from .money import to_paise, to_rupees
+from .models import UserProfile, Business, Product, Order, Return, Tombstone
+from .models import ArchivedOrder, ArchivedReturn, CatalogCopy, Customer, DailySummary, DashboardSnapshot, StockShard, TenantShard
+from .models import delete_rows
+from .renderers import FastJSONRenderer
+from .serializers import (
+    OrderSerializer, OrderValuesSerializer, ProductSerializer, ProductValuesSerializer,
+    ReturnSerializer, ReturnValuesSerializer,
+)
+from .tokens import BUSINESS_IDS_CLAIM, ROLE_CLAIM, ScopedRefreshToken
+
+
+class InventoryAPITestCase(APITestCase):
+    """
+    Base test case: an authenticated owner with two businesses and a helper
+    to seed `count` products, each with one order (every other one returned).
+    """
+
+    password = "Secret123"
+    # TestCase data is never committed, so a replica test mirror couldn't see it
+    replica_reads = False
+
+    def setUp(self):
+        if not self.replica_reads:
+            self.enterContext(mock.patch.object(replica, "replica_configured", return_value=False))
+        # Throttle buckets outlive the test database
+        caches[throttling.THROTTLE_CACHE].clear()
+        throttling.CostThrottle._noted.clear()
+        caches[coalesce.ANALYTICS_CACHE].clear()
+        self.user = UserProfile.objects.create_user(
+            username="owner", email="owner@example.com", password=self.password,
+            full_name="Owner", role="admin",
+        )
+        self.business = Business.objects.create(owner=self.user, business_name="Main")
+        self.other_business = Business.objects.create(owner=self.user, business_name="Branch")
+        self.refresh = ScopedRefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.refresh.access_token}")
+
+    def seed(self, count, business=None):
+        business = business or self.business
+        today = date.today()
+        offset = Product.objects.filter(business=business).count()
+        products = Product.objects.bulk_create([
+            Product(
+                business=business, product_name=f"Product {offset + i}", sku=f"SKU-{offset + i}",
+                category="books" if i % 2 else "toys", current_stock=100, min_stock=5 if i % 3 else 200,
+                max_stock=500, price=Decimal("10.00"), selling_price=Decimal("15.50"), supplier="Acme",
+            )
+            for i in range(count)
+        ])
+        orders = Order.objects.bulk_create([
+            Order(
+                business=business, order_id=f"ORD-{offset + i}", tracking_id=f"TRK-{offset + i}",
+                product_name=p.product_name, quantity=2, customer_name=f"Customer {i % 4}",
+                date=today - timedelta(days=i % 20), is_returned=bool(i % 2),
+            )
+            for i, p in enumerate(products)
+        ])
+        returns = Return.objects.bulk_create([
+            Return(
+                business=business, order=o, product_name=o.product_name,
+                customer_name=o.customer_name, quantity=1, date=o.date,
+            )
+            for o in orders if o.is_returned
+        ])
+        return {"products": products, "orders": orders, "returns": returns}
+
+
+class QueryBudgetMixin:
+    """
+    assertQueryBudget() runs a request against several data sizes and checks
+    that the number of SQL queries stays constant and within `budget`.
+    """
+
+    budget_sizes = (2, 20)
+
+    def assertQueryBudget(self, budget, make_request, expected_status=200, sizes=None):
+        counts = {}
+        for size in sizes or self.budget_sizes:
+            sid = transaction.savepoint()
+            try:
+                rows = self.seed(size)
+                with CaptureQueriesContext(connection) as ctx:
+                    response = make_request(rows)
+                self.assertEqual(
+                    response.status_code, expected_status,
+                    getattr(response, "data", None) or response.content[:200],
+                )
+                counts[size] = len(ctx.captured_queries)
+            finally:
+                transaction.savepoint_rollback(sid)
+
+        self.assertEqual(len(set(counts.values())), 1, f"Query count grows with rows: {counts}")
+        self.assertLessEqual(max(counts.values()), budget, f"Query budget exceeded: {counts}")
+        return counts
+
+
+class EndpointQueryBudgetTests(QueryBudgetMixin, InventoryAPITestCase):
+    _signup_seq = count()
+
+    def endpoint_specs(self):
+        """url name -> (query budget, request builder, expected status)"""
+        c = self.client
+        biz = f"?business={self.business.id}"
+
+        def first(rows, key):
+            return rows[key][0]
+
+        def open_order(rows):
+            return next(o for o in rows["orders"] if not o.is_returned)
+
+        def signup(rows):
+            n = next(self._signup_seq)
+            return c.post(reverse("signup"), {
+                "full_name": "New User", "username": f"newuser{n}", "email": f"new{n}@example.com",
+                "role": "staff", "password": "Passw0rd", "confirm_password": "Passw0rd",
+                "business_name": "New Shop",
+            }, format="json")
+
+        logout_token = str(RefreshToken.for_user(self.user))
+        CatalogCopy.objects.get_or_create(business=self.other_business, source=self.business)
+
+        return {
+            "signup": (6, signup, 201),
+            "login": (4, lambda rows: c.post(reverse("login"), {"username": "owner", "password": self.password}, format="json"), 200),
+            "token_refresh": (4, lambda rows: c.post(reverse("token_refresh"), {"refresh": str(self.refresh)}, format="json"), 200),
+            "logout": (7, lambda rows: c.post(reverse("logout"), {"refresh_token": logout_token}, format="json"), 200),
+            "dashboard_metrics": (15, lambda rows: c.get(reverse("dashboard_metrics")), 200),
+            "list-businesses": (1, lambda rows: c.get(reverse("list-businesses")), 200),
+            "add-business": (16, lambda rows: c.post(reverse("add-business"), {"business_name": "Copy", "copy_from_business": self.business.id}, format="json"), 201),
+            "catalog-copy": (2, lambda rows: c.get(reverse("catalog-copy", args=[self.other_business.id])), 200),
+            "product_list": (1, lambda rows: c.get(reverse("product_list") + biz), 200),
+            "product_detail": (6, lambda rows: c.put(reverse("product_detail", args=[first(rows, "products").id]), {
+                "product_name": "Renamed", "sku": "SKU-RENAMED", "price": "11.00", "selling_price": "16.00", "current_stock": 7,
+            }, format="json"), 200),
+            "delete_product": (7, lambda rows: c.delete(reverse("delete_product", args=[first(rows, "products").sku])), 200),
+            "low-stock": (2, lambda rows: c.get(reverse("low-stock")), 200),
+            "orders_list": (1, lambda rows: c.get(reverse("orders_list")), 200),
+            "add_edit_order": (12, lambda rows: c.post(reverse("add_edit_order") + biz, {
+                "order_id": "NEW-1", "product_name": first(rows, "products").product_name,
+                "quantity": 1, "customer_name": "Walk-in", "date": date.today().isoformat(),
+            }, format="json"), 201),
+            "delete-order": (13, lambda rows: c.delete(reverse("delete-order", args=[open_order(rows).id])), 204),
+            "returns_list": (1, lambda rows: c.get(reverse("returns_list")), 200),
+            "add_edit_return": (11, lambda rows: c.post(reverse("add_edit_return"), {
+                "order": open_order(rows).id, "quantity": 1, "date": date.today().isoformat(),
+            }, format="json"), 201),
+            "remove-return": (11, lambda rows: c.delete(reverse("remove-return", args=[first(rows, "returns").id])), 200),
+            "remove-return-no-slash": (11, lambda rows: c.delete(reverse("remove-return-no-slash", args=[first(rows, "returns").id])), 200),
+            "delete-return": (5, lambda rows: c.delete(reverse("delete-return", args=[first(rows, "returns").id])), 200),
+            "remove-return-alt": (11, lambda rows: c.delete(reverse("remove-return-alt", args=[first(rows, "returns").id])), 200),
+            "remove-return-alt-no-slash": (11, lambda rows: c.delete(reverse("remove-return-alt-no-slash", args=[first(rows, "returns").id])), 200),
+            "sales-overview": (4, lambda rows: c.get(reverse("sales-overview")), 200),
+            "returns-analysis": (3, lambda rows: c.get(reverse("returns-analysis") + biz), 200),
+            "revenue-profit-analysis": (3, lambda rows: c.get(reverse("revenue-profit-analysis")), 200),
+            "inventory-analysis": (5, lambda rows: c.get(reverse("inventory-analysis")), 200),
+            "customer-sales-analysis": (2, lambda rows: c.get(reverse("customer-sales-analysis")), 200),
+            "top-customers": (1, lambda rows: c.get(reverse("top-customers")), 200),
+            "analysis-batch": (5, lambda rows: c.get(reverse("analysis-batch")), 200),
+            "changes": (7, lambda rows: c.get(reverse("changes")), 200),
+            "async-login": (4, lambda rows: c.post(reverse("async-login"), {"username": "owner", "password": self.password}, format="json"), 200),
+            "async-dashboard": (15, lambda rows: c.get(reverse("async-dashboard")), 200),
+            "async-sales-overview": (4, lambda rows: c.get(reverse("async-sales-overview")), 200),
+            "async-returns-analysis": (3, lambda rows: c.get(reverse("async-returns-analysis") + biz), 200),
+            "async-revenue-profit-analysis": (3, lambda rows: c.get(reverse("async-revenue-profit-analysis")), 200),
+            "async-inventory-analysis": (5, lambda rows: c.get(reverse("async-inventory-analysis")), 200),
+            "async-customer-sales-analysis": (2, lambda rows: c.get(reverse("async-customer-sales-analysis")), 200),
+            "async-analysis-batch": (5, lambda rows: c.get(reverse("async-analysis-batch")), 200),
+            "sales-overview-report": (3, lambda rows: c.get(reverse("sales-overview-report")), 200),
+            "returns-analysis-report": (3, lambda rows: c.get(reverse("returns-analysis-report") + biz), 200),
+            "revenue-profit-analysis-report": (3, lambda rows: c.get(reverse("revenue-profit-analysis-report")), 200),
+            "inventory-analysis-report": (5, lambda rows: c.get(reverse("inventory-analysis-report")), 200),
+            "customer-sales-analysis-report": (2, lambda rows: c.get(reverse("customer-sales-analysis-report")), 200),
+            "sales_forecast": (5, lambda rows: c.get(reverse("sales_forecast")), 200),
+            "retrain_forecast": (2, lambda rows: c.post(reverse("retrain_forecast")), 200),
+        }
+
+    def test_every_endpoint_has_a_budget(self):
+        names = {p.name for p in inventory_urls.urlpatterns}
+        self.assertEqual(names, set(self.endpoint_specs()))
+
+    def test_endpoint_query_budgets(self):
+        for name, (budget, make_request, expected_status) in self.endpoint_specs().items():
+            with self.subTest(endpoint=name):
+                self.assertQueryBudget(budget, make_request, expected_status)
+
+    def test_returns_list_does_not_query_orders_per_row(self):
+        counts = self.assertQueryBudget(3, lambda rows: self.client.get(reverse("returns_list")), sizes=(2, 60))
+        self.assertEqual(counts[2], counts[60])
+
+
+class BusinessScopeTests(InventoryAPITestCase):
+    def business_queries(self, make_request):
+        with CaptureQueriesContext(connection) as ctx:
+            response = make_request()
+        self.assertLess(response.status_code, 400, getattr(response, "data", None))
+        return [q["sql"] for q in ctx.captured_queries if 'FROM "inventory_business"' in q["sql"]]
+
+    def test_businesses_loaded_once_per_request(self):
+        # Each of these used to query the business table 2-4 times (now at most once)
+        self.seed(5)
+        biz = f"?business={self.business.id}"
+        for url in [
+            reverse("dashboard_metrics") + biz,
+            reverse("product_list") + biz,
+            reverse("orders_list") + biz,
+            reverse("returns_list") + biz,
+            reverse("sales-overview") + biz,
+            reverse("returns-analysis") + biz,
+            reverse("revenue-profit-analysis") + biz,
+            reverse("returns-analysis-report") + biz,
+        ]:
+            with self.subTest(url=url):
+                self.assertLessEqual(len(self.business_queries(lambda: self.client.get(url))), 1)
+
+        order = Order.objects.filter(business=self.business, is_returned=False).first()
+        queries = self.business_queries(lambda: self.client.post(
+            reverse("add_edit_return"), {"order": order.id, "quantity": 1, "date": date.today().isoformat()}, format="json",
+        ))
+        self.assertLessEqual(len(queries), 1)
+
+    def test_business_param_validation(self):
+        stranger = UserProfile.objects.create_user(username="stranger", password="x", full_name="S", role="staff")
+        foreign = Business.objects.create(owner=stranger, business_name="Other")
+
+        response = self.client.get(reverse("dashboard_metrics") + f"?business={foreign.id}")
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse("dashboard_metrics") + "?business=abc")
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse("orders_list") + f"?business={foreign.id}")
+        self.assertEqual(response.data, {"error": "Invalid business id"})
+        response = self.client.get(reverse("sales-overview") + "?business=abc")
+        self.assertEqual(response.data, {"detail": "Invalid business id"})
+
+    def test_analysis_accepts_all_businesses(self):
+        self.seed(3)
+        self.seed(2, business=self.other_business)
+        response = self.client.get(reverse("returns-analysis") + "?business=all")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sum(row["returns"] for row in response.data["line_data"]), 2)
+
+
+class TokenMaintenanceTests(InventoryAPITestCase):
+    def login(self, **extra):
+        body = {"username": "owner", "password": self.password, **extra}
+        return self.client.post(reverse("login"), body, format="json").json()
+
+    def test_login_reuses_a_valid_refresh_token(self):
+        first = self.login()
+        issued = OutstandingToken.objects.count()
+        again = self.login(refresh_token=first["refresh_token"])
+        self.assertEqual(again["refresh_token"], first["refresh_token"])
+        self.assertEqual(AccessToken(again["access_token"])[BUSINESS_IDS_CLAIM], [self.business.id, self.other_business.id])
+        self.assertEqual(OutstandingToken.objects.count(), issued)
+
+        other = UserProfile.objects.create_user(username="other", password="Other123", full_name="Other", role="staff")
+        refused = [str(ScopedRefreshToken.for_user(other)), "not-a-token"]
+        # Valid for less than REFRESH_TOKEN_REUSE_MIN_LIFETIME more
+        with mock.patch("inventory.tokens.timezone.now", return_value=timezone.now() + timedelta(days=25)):
+            self.assertNotEqual(self.login(refresh_token=first["refresh_token"])["refresh_token"], first["refresh_token"])
+        self.client.post(reverse("logout"), {"refresh_token": first["refresh_token"]}, format="json")
+        refused.append(first["refresh_token"])
+        for token in refused:
+            with self.subTest(token=token[:20]):
+                self.assertNotEqual(self.login(refresh_token=token)["refresh_token"], token)
+
+    def test_prune_deletes_expired_tokens_in_batches(self):
+        now = timezone.now()
+        for days in (-2, -1, 1):
+            token = OutstandingToken.objects.create(user=self.user, jti=f"jti{days}", token="t", expires_at=now + timedelta(days=days))
+            BlacklistedToken.objects.create(token=token)
+        out = StringIO()
+        call_command("prune_tokens", "--batch-size", "1", stdout=out)
+        self.assertIn("Deleted 2 expired outstanding tokens and 2 blacklist entries", out.getvalue())
+        self.assertEqual(set(OutstandingToken.objects.values_list("jti", flat=True)), {"jti1", self.refresh["jti"]})
+        self.assertEqual(BlacklistedToken.objects.count(), 1)
+
+
+class UserLookupTests(InventoryAPITestCase):
+    def signup(self, username, email):
+        return self.client.post(reverse("signup"), {
+            "full_name": "New User", "username": username, "email": email, "role": "staff",
+            "password": "Passw0rd", "confirm_password": "Passw0rd",
+        }, format="json")
+
+    def test_lookups_ignore_case_through_the_lower_indexes(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.signup("OWNER", "Owner@Example.com")
+        self.assertEqual(response.json()["errors"], {"username": "Username already exists.", "email": "Email already exists."})
+        self.assertEqual(len(queries), 1)
+        self.assertIn("LOWER(", queries[0]["sql"])
+        self.assertEqual(self.signup("fresh", "fresh@example.com").status_code, 201)
+
+        response = self.client.post(reverse("login"), {"username": "FRESH@example.COM", "password": "Passw0rd"}, format="json")
+        self.assertEqual(response.json()["username"], "fresh")
+        plan = UserProfile.objects.matching(email="fresh@example.com").explain()
+        self.assertIn("userprofile_email_lower", plan)
+
+
+class ScopedTokenTests(InventoryAPITestCase):
+    def setUp(self):
+        super().setUp()
+        verified_tokens.clear()
+
+    def test_login_token_carries_role_and_businesses(self):
+        response = self.client.post(reverse("login"), {"username": "owner", "password": self.password}, format="json")
+        token = AccessToken(response.data["access_token"])
+        self.assertEqual(token[ROLE_CLAIM], "admin")
+        self.assertEqual(token[BUSINESS_IDS_CLAIM], [self.business.id, self.other_business.id])
+
+    def test_authentication_needs_no_user_or_business_query(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("orders_list") + f"?business={self.business.id}")
+        self.assertEqual(response.status_code, 200)
+        tables = " ".join(q["sql"] for q in ctx.captured_queries)
+        self.assertNotIn('"inventory_userprofile"', tables)
+        self.assertNotIn('"inventory_business"', tables)
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+    def test_tokens_without_scope_claims_still_work(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(self.user).access_token}")
+        response = self.client.get(reverse("list-businesses"))
+        self.assertEqual([b["id"] for b in response.data], [self.business.id, self.other_business.id])
+
+    def test_add_business_issues_updated_token(self):
+        response = self.client.post(reverse("add-business"), {"business_name": "Third"}, format="json")
+        self.assertEqual(response.status_code, 201)
+        token = AccessToken(response.data["access_token"])
+        self.assertIn(response.data["id"], token[BUSINESS_IDS_CLAIM])
+
+    def test_refresh_rereads_business_claims(self):
+        new_business = Business.objects.create(owner=self.user, business_name="Added elsewhere")
+        response = self.client.post(reverse("token_refresh"), {"refresh": str(self.refresh)}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(new_business.id, AccessToken(response.data["access"])[BUSINESS_IDS_CLAIM])
+
+    def test_scoped_access_tokens_are_short_lived(self):
+        response = self.client.post(reverse("login"), {"username": "owner", "password": self.password}, format="json")
+        token = AccessToken(response.data["access_token"])
+        self.assertEqual(token["exp"] - token["iat"], settings.SCOPED_ACCESS_TOKEN_LIFETIME.total_seconds())
+
+        # Refreshing checks the user again
+        UserProfile.objects.filter(pk=self.user.pk).update(is_active=False)
+        response = self.client.post(reverse("token_refresh"), {"refresh": str(self.refresh)}, format="json")
+        self.assertEqual(response.status_code, 401)
+
+    def test_businesses_gone_since_the_token_was_issued(self):
+        self.seed(2)
+        stale = self.other_business.id
+        self.other_business.delete()
+        for url in [reverse("product_list"), reverse("add_edit_order")]:
+            with self.subTest(url=url):
+                response = self.client.post(url + f"?business={stale}", {"product_name": "Product 0", "quantity": 1}, format="json")
+                self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.get(reverse("dashboard_metrics")).status_code, 200)
+
+    def test_verified_tokens_are_cached(self):
+        with mock.patch.object(JWTAuthentication, "get_validated_token", autospec=True,
+                               side_effect=JWTAuthentication.get_validated_token) as verify:
+            for _ in range(3):
+                self.client.get(reverse("orders_list"))
+        self.assertEqual(verify.call_count, 1)
+
+    def test_expired_cached_token_is_rejected(self):
+        token = self.refresh.access_token
+        self.client.get(reverse("orders_list"))
+        with mock.patch("inventory.authentication.time.time", return_value=token["exp"] + 1):
+            self.assertIsNone(verified_tokens.get(str(token).encode()))
+
+
+class FastReadPathTests(InventoryAPITestCase):
+    def test_values_serializers_match_model_serializers(self):
+        self.seed(6)
+        Order.objects.filter(pk=Order.objects.first().pk).update(tracking_id=None)
+        for model, serializer_class, values_class in [
+            (Product, ProductSerializer, ProductValuesSerializer),
+            (Order, OrderSerializer, OrderValuesSerializer),
+            (Return, ReturnSerializer, ReturnValuesSerializer),
+        ]:
+            with self.subTest(model=model.__name__):
+                qs = model.objects.order_by("pk")
+                expected = [dict(row) for row in serializer_class(qs, many=True).data]
+                self.assertEqual(values_class.serialize(qs), expected)
+
+    def test_fast_renderer_matches_drf_renderer(self):
+        self.seed(4)
+        data = {
+            "products": ProductSerializer(Product.objects.all(), many=True).data,
+            "total": Decimal("12.50"),
+            "when": date.today(),
+            "text": "line\u2028separator ₹",
+        }
+        fast = FastJSONRenderer().render(data)
+        self.assertEqual(json.loads(fast), json.loads(JSONRenderer().render(data)))
+        self.assertNotIn("\u2028".encode(), fast)
+
+    def test_list_endpoints_render_with_fast_path(self):
+        self.seed(3)
+        response = self.client.get(reverse("returns_list"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]["order_id"], Return.objects.order_by("pk").first().order.order_id)
+
+
+class AnalysisBatchTests(InventoryAPITestCase):
+    def test_sections_match_individual_endpoints(self):
+        self.seed(12)
+        for params in ["range=weekly", "range=yearly", f"start_date={date.today() - timedelta(days=9)}&end_date={date.today()}"]:
+            with self.subTest(params=params):
+                batch = self.client.get(reverse("analysis-batch") + f"?{params}").json()
+                self.assertEqual(list(batch["sections"]), ["sales-overview", "returns-analysis", "revenue-profit-analysis",
+                                                           "inventory-analysis", "customer-sales-analysis"])
+                for name in ["returns-analysis", "revenue-profit-analysis", "inventory-analysis", "customer-sales-analysis"]:
+                    self.assertEqual(batch["sections"][name], self.client.get(reverse(name) + f"?{params}").json(), name)
+                overview = self.client.get(reverse("sales-overview") + f"?start_date={batch['start']}&end_date={batch['end']}").json()
+                self.assertEqual(batch["sections"]["sales-overview"], overview)
+
+    def test_orders_and_returns_are_scanned_once(self):
+        self.seed(4)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("analysis-batch") + "?range=yearly")
+        self.assertEqual(response.status_code, 200)
+        scans = [q["sql"] for q in ctx.captured_queries if 'FROM "inventory_order"' in q["sql"] or 'FROM "inventory_return"' in q["sql"]]
+        self.assertEqual(len(scans), 2, scans)
+
+    def test_section_selection(self):
+        data = self.client.get(reverse("analysis-batch") + "?sections=returns-analysis,returns-analysis").json()
+        self.assertEqual(list(data["sections"]), ["returns-analysis"])
+        response = self.client.get(reverse("analysis-batch") + "?sections=returns-analysis,nope")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("nope", response.json()["detail"])
+
+
+class MoneyArithmeticTests(InventoryAPITestCase):
+    def seed_cheap_product(self, orders=30, quantity=3):
+        """A ₹0.10 product (cost ₹0.07) sold `orders` times today; float sums of these drift."""
+        Product.objects.create(
+            business=self.business, product_name="Penny", sku="PENNY", category="books", current_stock=1000,
+            min_stock=1, max_stock=5000, price=Decimal("0.07"), selling_price=Decimal("0.10"), supplier="Acme",
+        )
+        Order.objects.bulk_create([
+            Order(business=self.business, order_id=f"P-{i}", product_name="Penny", quantity=quantity,
+                  customer_name="Walk-in", date=date.today())
+            for i in range(orders)
+        ])
+
+    def test_paise_conversion_round_trips(self):
+        for amount in ["0.01", "0.10", "19.99", "12345678.90", "-3.07"]:
+            self.assertEqual(to_rupees(to_paise(Decimal(amount))), float(Decimal(amount)))
+        self.assertEqual(to_paise(None), 0)
+        self.assertEqual(to_paise(7), 700)
+
+    def test_revenue_and_profit_totals_are_exact(self):
+        self.seed_cheap_product()
+        data = self.client.get(reverse("revenue-profit-analysis") + f"?business={self.business.id}").json()
+        self.assertEqual(data["revenue_cost_data"], [{"product_name": "Penny", "revenue": 9.0, "cost": 6.3}])
+        self.assertEqual(data["revenue_growth_data"][-1], {"label": date.today().isoformat(), "revenue": 9.0})
+        self.assertEqual(data["profit_category_data"], [{"category": "books", "Penny": 2.7}])
+
+    def test_dashboard_totals_are_exact(self):
+        self.seed_cheap_product()
+        data = self.client.get(reverse("dashboard_metrics") + f"?business={self.business.id}").json()
+        self.assertEqual((data["total_sales"], data["net_profit"]), (9.0, 2.7))
+        self.assertEqual(data["sales_chart_data"][-1], {"date": date.today().isoformat(), "sales": 9.0})
+
+class DashboardSnapshotTests(InventoryAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.seed(6)
+        self.url = reverse("dashboard_metrics") + f"?business={self.business.pk}"
+        self.client.get(self.url)
+
+    def snapshot(self):
+        return DashboardSnapshot.objects.get(business=self.business, date=date.today())
+
+    def assertSnapshotMatchesRows(self):
+        snapshot = self.snapshot()
+        kept = (snapshot.orders, snapshot.returns, snapshot.lines)
+        rebuilt = snapshots.rebuild([self.business.pk])[0]
+        self.assertEqual(kept, (rebuilt.orders, rebuilt.returns, rebuilt.lines))
+
+    def test_writes_update_the_snapshot(self):
+        product = Product.objects.filter(business=self.business).last()
+        created = self.client.post(reverse("add_edit_order") + f"?business={self.business.pk}", {
+            "order_id": "NEW-1", "product_name": product.product_name, "quantity": 3,
+            "customer_name": "Walk-in", "date": date.today().isoformat(),
+        }, format="json")
+        self.assertEqual(created.status_code, 201)
+        self.assertSnapshotMatchesRows()
+        order = Order.objects.get(order_id="NEW-1")
+
+        steps = [
+            lambda: self.client.put(reverse("add_edit_order"), {"id": order.pk, "quantity": 5}, format="json"),
+            lambda: self.client.post(reverse("add_edit_return"), {
+                "order": order.pk, "quantity": 2, "date": date.today().isoformat(),
+            }, format="json"),
+            lambda: self.client.put(reverse("product_detail", args=[product.pk]), {
+                "product_name": product.product_name, "sku": product.sku, "price": "11.00",
+                "selling_price": "19.00", "current_stock": 7,
+            }, format="json"),
+            lambda: self.client.delete(reverse("remove-return", args=[Return.objects.get(order=order).pk])),
+            lambda: self.client.put(reverse("add_edit_order"), {
+                "id": order.pk, "date": (date.today() - timedelta(days=1)).isoformat(),
+            }, format="json"),
+            lambda: self.client.delete(reverse("delete_product", args=[product.sku])),
+            lambda: self.client.delete(reverse("delete-order", args=[
+                Order.objects.filter(business=self.business, date=date.today()).exclude(product_name=product.product_name).get().pk
+            ])),
+        ]
+        for i, step in enumerate(steps):
+            with self.subTest(step=i):
+                self.assertLess(step().status_code, 300)
+                self.assertSnapshotMatchesRows()
+        self.assertEqual(self.client.get(self.url).json(), self.client.get(reverse("async-dashboard") + f"?business={self.business.pk}").json())
+
+    def test_warm_read_takes_no_order_or_return_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get(self.url + "&days=7").json()
+        today = [q["sql"] for q in queries if "inventory_dashboardsnapshot" in q["sql"]]
+        self.assertEqual(len(today), 1)
+        self.assertFalse(any("inventory_changecounter" in q["sql"] for q in queries))
+        self.assertEqual((data["total_orders"], data["total_returns"]), (1, 0))
+
+    def test_bulk_writes_drop_the_snapshot(self):
+        self.seed(4)
+        self.assertFalse(DashboardSnapshot.objects.filter(business=self.business).exists())
+        data = self.client.get(self.url).json()
+        self.assertEqual((data["total_orders"], data["total_returns"]), (2, 0))
+
+    def test_rebuild_holds_only_its_business_counter(self):
+        with CaptureQueriesContext(connection) as queries:
+            snapshots.rebuild([self.business.pk])
+        counters = [q["sql"] for q in queries if "changecounter" in q["sql"]]
+        self.assertEqual(len(counters), 1)
+        self.assertIn("inventory_businesschangecounter", counters[0])
+        self.assertIn(str(self.business.pk), counters[0])
+
+    def test_reconcile_rebuilds_drifted_snapshots(self):
+        DashboardSnapshot.objects.filter(business=self.business).update(orders=99)
+        DashboardSnapshot.objects.create(business=self.business, date=date.today() - timedelta(days=1))
+        out = StringIO()
+        call_command("reconcile_snapshots", stdout=out)
+        self.assertIn("Business %d: 99 orders" % self.business.pk, out.getvalue())
+        self.assertIn("Rebuilt 2 snapshots", out.getvalue())
+        self.assertIn("1 had drifted; deleted 1 older ones", out.getvalue())
+        self.assertEqual(self.snapshot().orders, 1)
+        self.assertSnapshotMatchesRows()
+
+
+class LowStockTests(InventoryAPITestCase):
+    def product(self, name, current_stock, min_stock, business=None):
+        return Product.objects.create(
+            business=business or self.business, product_name=name, sku=name, category="books",
+            current_stock=current_stock, min_stock=min_stock, price=Decimal("1.00"), selling_price=Decimal("2.00"),
+            supplier="Acme",
+        )
+
+    def low(self, **params):
+        return self.client.get(reverse("low-stock"), params).json()
+
+    def test_sorted_by_shortfall_and_paged(self):
+        self.product("Plenty", 50, 10)
+        self.product("Short 5", 5, 10)
+        self.product("At min", 10, 10)
+        self.product("Short 9", 1, 10)
+        self.product("Elsewhere", 0, 20, business=self.other_business)
+
+        page = self.low(business=self.business.pk, limit=2)
+        self.assertEqual(page["count"], 3)
+        self.assertTrue(page["has_more"])
+        self.assertEqual([(p["product_name"], p["shortfall"]) for p in page["results"]], [("Short 9", 9), ("Short 5", 5)])
+        page = self.low(business=self.business.pk, limit=2, offset=2)
+        self.assertEqual([p["product_name"] for p in page["results"]], ["At min"])
+        self.assertFalse(page["has_more"])
+        self.assertEqual(self.low(business="all")["results"][0]["product_name"], "Elsewhere")
+        self.assertEqual(self.client.get(reverse("low-stock"), {"limit": "x"}).status_code, 400)
+
+    def test_flag_follows_every_stock_write(self):
+        product = self.product("Widget", 3, 2)
+        self.assertFalse(product.is_low_stock)
+
+        def flagged():
+            return Product.objects.get(pk=product.pk).is_low_stock
+
+        order = self.client.post(reverse("add_edit_order") + f"?business={self.business.pk}", {
+            "order_id": "W-1", "product_name": "Widget", "quantity": 1, "customer_name": "Walk-in",
+            "date": date.today().isoformat(),
+        }, format="json")
+        self.assertEqual(order.status_code, 201)
+        self.assertTrue(flagged())
+        response = self.client.put(reverse("product_detail", args=[product.pk]), {
+            "product_name": "Widget", "sku": "Widget", "price": "1.00", "selling_price": "2.00", "min_stock": 1,
+        }, format="json")
+        self.assertFalse(response.json()["is_low_stock"])
+        self.assertFalse(flagged())
+        Product.objects.filter(pk=product.pk).update(current_stock=F("current_stock") - 2)
+        self.assertTrue(flagged())
+        product.refresh_from_db()
+        product.current_stock = 40
+        Product.objects.bulk_update([product], ["current_stock"])
+        self.assertFalse(flagged())
+        self.assertEqual(self.low()["count"], 0)
+
+
+class StockShardTests(InventoryAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(
+            business=self.business, product_name="Hot", sku="HOT", category="gaming", current_stock=10,
+            min_stock=0, price=Decimal("1.00"), selling_price=Decimal("2.00"), supplier="Acme",
+        )
+
+    def shards(self):
+        return list(StockShard.objects.filter(product=self.product).order_by("shard").values_list("quantity", flat=True))
+
+    def order(self, quantity):
+        return self.client.post(reverse("add_edit_order") + f"?business={self.business.pk}", {
+            "order_id": f"H-{Order.objects.count()}", "product_name": "Hot", "quantity": quantity,
+            "customer_name": "Walk-in", "date": date.today().isoformat(),
+        }, format="json")
+
+    def test_take_never_oversells(self):
+        for shards in (0, 3):
+            stock.set_shards(self.product, shards, total=10)
+            self.assertTrue(stock.take(self.product, 4))
+            self.assertFalse(stock.take(self.product, 7))
+            # Across shards once no single one holds it
+            self.assertTrue(stock.take(self.product, 6))
+            self.assertFalse(stock.take(self.product, 1))
+            stock.give(self.product, 5)
+            self.assertTrue(stock.take(self.product, 8, clamp=True))
+            stock.reconcile()
+            self.assertEqual(Product.objects.get(pk=self.product.pk).current_stock, 0)
+
+    def test_set_shards_spreads_and_gathers(self):
+        stock.set_shards(self.product, 4)
+        self.assertEqual(self.shards(), [3, 3, 2, 2])
+        stale = Product.objects.get(pk=self.product.pk)
+        stale.stock_shards = 0
+        # Loaded before sharding: take() finds out and uses the shards
+        self.assertTrue(stock.take(stale, 1))
+        self.assertEqual(sum(self.shards()), 9)
+        stock.set_shards(self.product, 0)
+        self.assertEqual(self.shards(), [])
+        self.assertEqual(Product.objects.get(pk=self.product.pk).current_stock, 9)
+
+    def test_orders_and_returns_use_the_shards(self):
+        stock.set_shards(self.product, 2)
+        self.assertEqual(self.order(6).status_code, 201)
+        self.assertEqual(self.order(5).status_code, 400)
+        order = Order.objects.get()
+        response = self.client.post(reverse("add_edit_return") + f"?business={self.business.pk}", {
+            "order": order.pk, "product_name": "Hot", "customer_name": "Walk-in", "quantity": 6,
+            "date": date.today().isoformat(),
+        }, format="json")
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(sum(self.shards()), 10)
+        self.client.delete(reverse("remove-return", args=[Return.objects.get().pk]))
+        self.assertEqual(sum(self.shards()), 4)
+        self.client.delete(reverse("delete-order", args=[order.pk]))
+        self.assertEqual(sum(self.shards()), 10)
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_reconcile_and_edits(self):
+        stock.set_shards(self.product, 2)
+        stock.take(self.product, 3)
+        out = StringIO()
+        call_command("reconcile_stock", "--business", str(self.business.pk), stdout=out)
+        self.assertIn("of 1 sharded products", out.getvalue())
+        self.assertEqual(Product.objects.get(pk=self.product.pk).current_stock, 7)
+        self.assertEqual(stock.reconcile(), 0)
+
+        response = self.client.put(reverse("product_detail", args=[self.product.pk]), {
+            "product_name": "Hot", "sku": "HOT", "price": "1.00", "selling_price": "2.00", "current_stock": 21,
+            "stock_shards": 0,
+        }, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["stock_shards"], 2)
+        self.assertEqual(self.shards(), [11, 10])
+
+    def test_shard_stock_command(self):
+        out = StringIO()
+        call_command("shard_stock", "--business", str(self.business.pk), "--sku", "HOT", "--shards", "3", stdout=out)
+        self.assertIn("10 in stock, kept in 3 shards", out.getvalue())
+        self.assertEqual(self.shards(), [4, 3, 3])
+        with self.assertRaises(CommandError):
+            call_command("shard_stock", "--business", str(self.business.pk), "--sku", "NOPE", "--shards", "3")
+
+
+class AdminTests(QueryBudgetMixin, InventoryAPITestCase):
+    def setUp(self):
+        super().setUp()
+        UserProfile.objects.filter(pk=self.user.pk).update(is_staff=True, is_superuser=True)
+        self.client.force_login(self.user)
+
+    def test_changelists_query_budget(self):
+        for name, budget in (("product", 5), ("order", 7), ("return", 7)):
+            with self.subTest(name=name):
+                url = reverse(f"admin:inventory_{name}_changelist")
+                self.assertQueryBudget(budget, lambda rows: self.client.get(url))
+        year = date.today().year
+        self.assertQueryBudget(7, lambda rows: self.client.get(reverse("admin:inventory_order_changelist"), {"date__year": year}))
+
+    def test_large_tables_are_counted_from_statistics(self):
+        self.seed(3)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        self.seed(2)
+        with mock.patch.object(inventory_admin, "ESTIMATE_ABOVE", 0):
+            self.assertEqual(EstimatedCountPaginator(Order.objects.all(), 10).count, 3)
+            self.assertEqual(EstimatedCountPaginator(Order.objects.filter(business=self.business), 10).count, 5)
+        self.assertEqual(EstimatedCountPaginator(Order.objects.all(), 10).count, 5)
+
+    def test_recompute_stock_action(self):
+        product = self.seed(1)["products"][0]
+        stock.set_shards(product, 2)
+        StockShard.objects.filter(product=product, shard=0).update(quantity=10)
+        response = self.client.post(reverse("admin:inventory_product_changelist"), {
+            "action": "recompute_stock", "_selected_action": [product.pk],
+        })
+        self.assertEqual(response.status_code, 302)
+        product.refresh_from_db()
+        self.assertEqual(product.current_stock, 60)
+
+
+class CatalogCopyTests(InventoryAPITestCase):
+    def add_copy(self, source=None):
+        return self.client.post(reverse("add-business"), {
+            "business_name": "Copy", "copy_from_business": (source or self.business).pk,
+        }, format="json")
+
+    def test_copies_in_the_request(self):
+        rows = self.seed(3)
+        response = self.add_copy()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["copied_products"], 3)
+        self.assertEqual(response.data["catalog_copy"]["status"], "done")
+        copied = Product.objects.filter(business_id=response.data["id"]).order_by("sku")
+        self.assertEqual(
+            [(p.sku, p.current_stock, p.price, p.is_low_stock) for p in copied],
+            [(p.sku, p.current_stock, p.price, p.min_stock >= p.current_stock) for p in rows["products"]],
+        )
+        # Numbered in the new business's own sequence
+        self.assertEqual({p.change_seq for p in copied}, {1})
+
+        # Copied again from the start: every SKU is there already
+        copy = CatalogCopy.objects.get(pk=response.data["id"])
+        copy.last_source_id = 0
+        catalog.copy_batch(copy)
+        self.assertEqual((copy.processed, copy.copied), (6, 3))
+        self.assertEqual(copied.count(), 3)
+
+    @override_settings(CATALOG_COPY_INLINE_LIMIT=2)
+    def test_large_catalogs_copy_in_the_background(self):
+        self.seed(3)
+        with mock.patch.object(catalog.threading, "Thread") as thread:
+            response = self.add_copy()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["copied_products"], 0)
+        self.assertEqual(response.data["catalog_copy"]["status"], "running")
+        thread.return_value.start.assert_called_once()
+
+        copy = CatalogCopy.objects.get(pk=response.data["id"])
+        catalog.run(copy, batch_size=2)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access_token']}")
+        progress = self.client.get(reverse("catalog-copy", args=[copy.pk])).json()
+        self.assertEqual(progress, {"source": self.business.pk, "status": "done", "total": 3, "processed": 3, "copied": 3, "error": None})
+
+        # Its process died: the next poll starts it again
+        CatalogCopy.objects.filter(pk=copy.pk).update(status="running", updated_at=timezone.now() - timedelta(hours=1))
+        with mock.patch.object(catalog.threading, "Thread") as thread:
+            self.client.get(reverse("catalog-copy", args=[copy.pk]))
+            self.client.get(reverse("catalog-copy", args=[copy.pk]))
+        thread.return_value.start.assert_called_once()
+
+    def test_copies_only_owned_businesses(self):
+        stranger = UserProfile.objects.create_user(username="stranger", password="x", full_name="S", role="staff")
+        elsewhere = Business.objects.create(owner=stranger, business_name="Elsewhere")
+        self.seed(1, business=elsewhere)
+        response = self.add_copy(elsewhere)
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Business.objects.filter(business_name="Copy").exists())
+
+
+@override_settings(SHARD_ALIASES=["default", "shard1"], SHARD_MAP_TTL=0)
+class TenantShardingTests(InventoryAPITestCase):
+    """Runs with a second SQLite file, migrated once, as the shard `shard1`."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp = tempfile.TemporaryDirectory()
+        # Not in connections.settings, where the test runner would expect to have created it
+        settings_dict = {**connections.settings["default"], "NAME": os.path.join(cls.tmp.name, "shard1.sqlite3")}
+        shard = load_backend(settings_dict["ENGINE"]).DatabaseWrapper(settings_dict, "shard1")
+        setattr(connections._connections, "shard1", shard)
+        call_command("migrate", database="shard1", verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections["shard1"].close()
+        delattr(connections._connections, "shard1")
+        cls.tmp.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        sharding.forget()
+        self.addCleanup(sharding.forget)
+        self.addCleanup(sharding.clear)
+        self.addCleanup(self.clear_shard1)
+
+    @staticmethod
+    def clear_shard1():
+        # Outside the test's transaction; referencing rows first
+        for model in reversed(sharding.TENANT_MODELS):
+            delete_rows(model, list(model._base_manager.using("shard1").values_list("pk", flat=True)), "shard1")
+
+    def order(self, business, order_id, quantity=1):
+        return self.client.post(reverse("add_edit_order") + f"?business={business.pk}", {
+            "order_id": order_id, "product_name": "Product 0", "quantity": quantity, "customer_name": "Walk-in",
+            "date": date.today().isoformat(),
+        }, format="json")
+
+    def test_tenant_rows_follow_the_map(self):
+        TenantShard.objects.create(business=self.other_business, alias="shard1")
+        # bulk_create() has no row to route by
+        with sharding.use_shard("shard1"):
+            self.seed(1, business=self.other_business)
+        self.seed(1)
+        product = Product.objects.using("shard1").get()
+        self.assertEqual(product.business_id, self.other_business.pk)
+        self.assertGreaterEqual(product.pk, settings.SHARD_ID_SPAN)
+        self.assertEqual(Product.objects.using("default").get().business_id, self.business.pk)
+        # A sharded row's business comes from default
+        self.assertEqual(product.business, self.other_business)
+
+        self.assertEqual(self.order(self.other_business, "S-1").status_code, 201)
+        self.assertEqual(Order.objects.using("shard1").filter(order_id="S-1").count(), 1)
+        self.assertEqual(Product.objects.using("shard1").get().current_stock, 99)
+        listed = self.client.get(reverse("orders_list"), {"business": self.other_business.pk}).json()
+        self.assertEqual(sorted(o["order_id"] for o in listed), ["ORD-0", "S-1"])
+        response = self.client.get(reverse("product_list"), {"business": "all"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("different databases", response.json()["detail"])
+        self.assertEqual(response.json()["business_groups"], [[self.business.pk], [self.other_business.pk]])
+
+    def test_default_requests_of_a_multi_shard_user(self):
+        TenantShard.objects.create(business=self.other_business, alias="shard1")
+        with sharding.use_shard("shard1"):
+            self.seed(2, business=self.other_business)
+        self.seed(3)
+        # The dashboard adds up what each database holds
+        for name in ["dashboard_metrics", "async-dashboard"]:
+            with self.subTest(name=name):
+                response = self.client.get(reverse(name))
+                self.assertEqual(response.status_code, 200)
+                by_business = [
+                    self.client.get(reverse(name), {"business": business.pk}).json()
+                    for business in (self.business, self.other_business)
+                ]
+                data = response.json()
+                for key in ["total_orders", "total_returns", "total_sales", "net_profit"]:
+                    self.assertAlmostEqual(data[key], sum(part[key] for part in by_business), msg=key)
+                self.assertEqual(
+                    sum(row["count"] for row in data["category_chart_data"]),
+                    Product.objects.using("default").count() + Product.objects.using("shard1").count(),
+                )
+        # Other views ask for the businesses of one database at a time
+        for name in ["orders_list", "sales-overview", "async-sales-overview"]:
+            with self.subTest(name=name):
+                response = self.client.get(reverse(name))
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()["business_groups"], [[self.business.pk], [self.other_business.pk]])
+
+    def test_move_while_writing(self):
+        rows = self.seed(3)
+        cursor = self.client.get(reverse("changes"), {"business": self.business.pk}).json()["cursor"]
+        ids = sorted(Order.objects.values_list("pk", flat=True))
+        deleted = rows["orders"][0].pk
+        stamps = {p.pk: (p.created_at, p.updated_at) for p in Product.objects.exclude(pk=rows["products"][2].pk)}
+
+        def write_meanwhile(message):
+            if message.startswith("Copied") and not Order.objects.using("default").filter(order_id="LATE").exists():
+                # Taken by the catch-up passes and the final copy
+                Order.objects.create(
+                    business=self.business, order_id="LATE", product_name="Product 1", quantity=1,
+                    customer_name="Walk-in", date=date.today(),
+                )
+                rows["orders"][0].delete()
+                Product.objects.filter(pk=rows["products"][2].pk).update(current_stock=7)
+
+        sharding.move(self.business.pk, "shard1", batch_size=2, log=write_meanwhile)
+        self.assertEqual(sharding.shard_for(self.business.pk), "shard1")
+        self.assertFalse(Order.objects.using("default").exists())
+        moved = Order.objects.using("shard1").order_by("pk")
+        self.assertEqual([o.pk for o in moved], [pk for pk in ids if pk != deleted] + [moved.last().pk])
+        self.assertEqual(moved.last().order_id, "LATE")
+        self.assertEqual(Product.objects.using("shard1").get(pk=rows["products"][2].pk).current_stock, 7)
+        # Copied as they were, timestamps included
+        self.assertEqual(
+            {p.pk: (p.created_at, p.updated_at) for p in Product.objects.using("shard1").filter(pk__in=stamps)}, stamps,
+        )
+        # Created meanwhile, and not change-tracked: copied while writes were stopped
+        self.assertTrue(Customer.objects.using("shard1").filter(normalized_name="walk-in").exists())
+        self.assertGreaterEqual(
+            sharding._counter(self.business.pk, "shard1"), max(Order.objects.using("shard1").values_list("change_seq", flat=True)),
+        )
+
+        # Sync clients carry on from their cursor
+        self.assertEqual(self.order(self.business, "AFTER").status_code, 201)
+        changes = self.client.get(reverse("changes"), {"business": self.business.pk, "since": cursor}).json()
+        self.assertIn("AFTER", [o["order_id"] for o in changes["upserts"]["orders"]])
+        self.assertIn(deleted, changes["deletes"]["orders"])
+
+        out = StringIO()
+        call_command("move_tenant", "--business", str(self.business.pk), "--to", "default", stdout=out)
+        self.assertIn("from 'shard1' to 'default'", out.getvalue())
+        self.assertFalse(TenantShard.objects.exists())
+        self.assertEqual(Order.objects.using("default").count(), 4)
+        self.assertFalse(Order.objects.using("shard1").exists())
+
+    def test_writes_refused_while_moving(self):
+        self.seed(1)
+        TenantShard.objects.create(business=self.business, alias="default", moving=True)
+        with self.assertRaises(sharding.TenantMoving):
+            Order.objects.create(
+                business=self.business, order_id="X", product_name="Product 0", quantity=1,
+                customer_name="Walk-in", date=date.today(),
+            )
+        self.assertNotEqual(self.order(self.business, "X").status_code, 201)
+        self.assertEqual(self.client.get(reverse("orders_list"), {"business": self.business.pk}).status_code, 200)
+        with self.assertRaises(CommandError):
+            call_command("move_tenant", "--business", str(self.business.pk), "--to", "shard1")
+
+    def test_move_refuses_taken_ids(self):
+        rows = self.seed(1)
+        TenantShard.objects.create(business=self.other_business, alias="shard1")
+        # save(), not create(): routed by the row's business
+        Order(
+            pk=rows["orders"][0].pk, business=self.other_business, order_id="CLASH", product_name="Product 0",
+            quantity=1, customer_name="Walk-in", date=date.today(),
+        ).save()
+        with self.assertRaisesMessage(sharding.MoveError, "orders ids of business"):
+            sharding.move(self.business.pk, "shard1")
+        self.assertEqual(sharding.shard_for(self.business.pk), "default")
+        self.assertEqual(Product.objects.using("shard1").count(), 0)
+
+    def test_deleting_a_business_deletes_its_shard_rows(self):
+        TenantShard.objects.create(business=self.other_business, alias="shard1")
+        with sharding.use_shard("shard1"):
+            self.seed(2, business=self.other_business)
+        self.other_business.delete()
+        self.assertFalse(Order.objects.using("shard1").exists())
+        self.assertFalse(Product.objects.using("shard1").exists())
+
+
+class CustomerTests(InventoryAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(
+            business=self.business, product_name="Widget", sku="W", category="books", current_stock=100,
+            min_stock=1, price=Decimal("1.00"), selling_price=Decimal("2.50"), supplier="Acme",
+        )
+
+    def order(self, customer_name, quantity=1, day=None, **fields):
+        return Order.objects.create(
+            business=self.business, order_id=f"O-{Order.objects.count()}", product_name="Widget",
+            quantity=quantity, customer_name=customer_name, date=day or date.today(), **fields,
+        )
+
+    def assertTotalsMatchRows(self):
+        kept = list(Customer.objects.order_by("pk").values_list("lifetime_revenue", "order_count", "last_order_date"))
+        customers.rebuild_totals(Customer.objects.values_list("pk", flat=True))
+        rebuilt = list(Customer.objects.order_by("pk").values_list("lifetime_revenue", "order_count", "last_order_date"))
+        self.assertEqual(kept, rebuilt)
+
+    def test_spellings_share_a_customer(self):
+        first = self.order("Asha  Patel")
+        second = self.order("ＡＳＨＡ patel ")
+        self.assertEqual(first.customer_id, second.customer_id)
+        customer = Customer.objects.get()
+        self.assertEqual((customer.name, customer.normalized_name), ("Asha  Patel", "asha patel"))
+        returned = Return.objects.create(
+            business=self.business, order=first, product_name="Widget", customer_name="asha patel",
+            quantity=1, date=date.today(),
+        )
+        self.assertEqual(returned.customer_id, customer.pk)
+        elsewhere = Order.objects.create(
+            business=self.other_business, order_id="B-1", product_name="Widget", quantity=1,
+            customer_name="Asha Patel", date=date.today(),
+        )
+        self.assertNotEqual(elsewhere.customer_id, customer.pk)
+
+    def test_writes_keep_the_totals(self):
+        yesterday = date.today() - timedelta(days=1)
+        old = self.order("Ravi", quantity=2, day=yesterday)
+        self.order("Ravi", quantity=1)
+        ravi = Customer.objects.get(normalized_name="ravi")
+        self.assertEqual((ravi.lifetime_revenue, ravi.order_count, ravi.last_order_date), (750, 2, date.today()))
+
+        steps = [
+            lambda: self.client.put(reverse("add_edit_order"), {"id": old.pk, "quantity": 4}, format="json"),
+            lambda: self.client.put(reverse("add_edit_order"), {"id": old.pk, "customer_name": "Meena"}, format="json"),
+            lambda: self.client.delete(reverse("delete-order", args=[Order.objects.get(customer__normalized_name="ravi").pk])),
+            lambda: Order.objects.filter(pk=old.pk).update(customer_name="RAVI", quantity=3),
+            lambda: self.seed(3),
+        ]
+        for i, step in enumerate(steps):
+            with self.subTest(step=i):
+                step()
+                self.assertTotalsMatchRows()
+        ravi.refresh_from_db()
+        self.assertEqual((ravi.lifetime_revenue, ravi.order_count, ravi.last_order_date), (750, 1, yesterday))
+        self.assertEqual(Customer.objects.get(normalized_name="meena").order_count, 0)
+
+    def test_top_customers(self):
+        self.order("Small")
+        self.order("Big", quantity=10)
+        self.order("Big", quantity=1, day=date.today() - timedelta(days=400))
+        data = self.client.get(reverse("top-customers"), {"business": self.business.pk, "limit": 1}).json()
+        self.assertEqual(data, [{
+            "id": Customer.objects.get(name="Big").pk, "business": self.business.pk, "customer_name": "Big",
+            "lifetime_revenue": 27.5, "order_count": 2, "last_order_date": date.today().isoformat(),
+        }])
+        self.assertEqual(self.client.get(reverse("top-customers"), {"limit": "x"}).status_code, 400)
+
+    def test_backfill_links_rows_and_rebuilds_totals(self):
+        order = self.order("Kiran", quantity=2)
+        Order._base_manager.update(customer=None)
+        Customer.objects.all().delete()
+        out = StringIO()
+        call_command("backfill_customers", "--batch-size", "1", stdout=out)
+        order.refresh_from_db()
+        self.assertEqual(order.customer.name, "Kiran")
+        self.assertEqual((order.customer.lifetime_revenue, order.customer.order_count), (500, 1))
+        self.assertIn("Linked 1 orders", out.getvalue())
+
+    def test_customer_analysis_merges_spellings(self):
+        self.order("Dev Shah", quantity=2)
+        self.order("dev  SHAH", quantity=2)
+        data = self.client.get(reverse("customer-sales-analysis"), {"business": self.business.pk}).json()
+        self.assertEqual(data["top_customers"], [{"customer_name": "Dev Shah", "total_revenue": 10.0}])
+
+
+class AnalyticsEngineTests(InventoryAPITestCase):
+    def test_rank_breaks_ties_by_first_appearance(self):
+        values = np.array([5, 7, 5, 7, 1, 0])
+        seen = first_seen(np.array([2, 3, 0, 1, 4, 2, 3]), 6)
+        self.assertEqual(seen[5], NEVER)
+        self.assertEqual(rank(values, seen).tolist(), [3, 1, 2, 0, 4])
+        self.assertEqual(rank(values, seen, limit=3).tolist(), [3, 1, 2])
+        self.assertEqual(rank(values, seen, mask=values > 4, limit=10).tolist(), [3, 1, 2, 0])
+
+    def test_monthly_window_buckets(self):
+        window = Window(date(2024, 11, 15), date(2025, 2, 3), monthly=True)
+        self.assertEqual(window.labels, ["2024-11", "2024-12", "2025-01", "2025-02"])
+        days = np.array([0, 15, 16, 47, (date(2025, 2, 3) - date(2024, 11, 15)).days])
+        self.assertEqual(window.buckets(days).tolist(), [0, 0, 1, 2, 3])
+
+    def test_sales_overview_totals(self):
+        self.seed(6)
+        data = self.client.get(reverse("sales-overview") + f"?business={self.business.id}").json()
+        # Every order is 2 x 15.50 and odd-indexed ones have 1 unit returned
+        expected = {f"Product {i}": 31.0 - (15.5 if i % 2 else 0) for i in range(6)}
+        self.assertEqual({row["product"]: row["sales"] for row in data["bar_data"]}, expected)
+        self.assertEqual(sum(row["sales"] for row in data["line_data"]), sum(expected.values()))
+        self.assertEqual(data["pie_data"], [{"category": "toys", "value": 66.67}, {"category": "books", "value": 33.33}])
+
+    def test_inventory_trend_walks_forward_from_current_stock(self):
+        self.seed(4)
+        data = self.client.get(reverse("inventory-analysis") + f"?business={self.business.id}").json()
+        trend = [row["stock"] for row in data["stock_movement_data"]]
+        self.assertEqual(len(trend), 12)
+        # 4 products x 100 in stock, 4 orders of 2 and 2 returns of 1 within the last 20 days
+        self.assertEqual(trend[-1], 400 - 8 + 2)
+
+class CompressionTests(InventoryAPITestCase):
+    def compress(self, response, accept_encoding="gzip", **headers):
+        request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING=accept_encoding)
+        for name, value in headers.items():
+            response[name] = value
+        return CompressionMiddleware(lambda r: response)(request)
+
+    def test_large_responses_are_gzipped(self):
+        self.seed(20)
+        plain = self.client.get(reverse("orders_list"))
+        response = self.client.get(reverse("orders_list"), HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertNotIn("Content-Encoding", plain)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertEqual(int(response["Content-Length"]), len(response.content))
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+
+    @override_settings(COMPRESSION_MIN_SIZE=200)
+    def test_csv_reports_are_gzipped(self):
+        self.seed(20)
+        url = reverse("inventory-analysis-report")
+        plain = self.client.get(url)
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+
+    @skipUnless(brotli, "brotli is not installed")
+    def test_brotli_is_preferred_when_available(self):
+        self.seed(20)
+        plain = self.client.get(reverse("product_list"))
+        response = self.client.get(reverse("product_list"), HTTP_ACCEPT_ENCODING="gzip, deflate, br")
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(brotli.decompress(response.content), plain.content)
+
+    def test_small_and_precompressed_responses_are_left_alone(self):
+        body = b"x" * 4096
+        self.assertNotIn("Content-Encoding", self.compress(HttpResponse(b"x" * 600)))
+        self.assertNotIn("Content-Encoding", self.compress(HttpResponse(body, content_type="image/png")))
+        self.assertNotIn("Content-Encoding", self.compress(HttpResponse(body), **{"Cache-Control": "no-transform"}))
+        self.assertNotIn("Content-Encoding", self.compress(HttpResponse(body), accept_encoding="gzip;q=0"))
+        self.assertEqual(self.compress(HttpResponse(body), **{"Content-Encoding": "br"})["Content-Encoding"], "br")
+        with override_settings(COMPRESSION_MIN_SIZE=500):
+            self.assertEqual(self.compress(HttpResponse(b"x" * 600))["Content-Encoding"], "gzip")
+
+    def test_streaming_responses_are_compressed(self):
+        chunks = [f"{i},row {i}\n".encode() for i in range(500)]
+        response = self.compress(StreamingHttpResponse(iter(chunks), content_type="text/csv"))
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertFalse(response.has_header("Content-Length"))
+        self.assertEqual(gzip.decompress(b"".join(response.streaming_content)), b"".join(chunks))
+
+    def test_strong_etag_is_weakened(self):
+        response = self.compress(HttpResponse(b"x" * 4096), ETag='"abc"')
+        self.assertEqual(response["ETag"], 'W/"abc"')
+
+    def test_accept_encoding_negotiation(self):
+        both = ("br", "gzip")
+        self.assertEqual(negotiate_encoding("gzip, deflate, br", both), "br")
+        self.assertEqual(negotiate_encoding("br;q=0.5, gzip", both), "gzip")
+        self.assertEqual(negotiate_encoding("*", both), "br")
+        self.assertEqual(negotiate_encoding("*;q=0.1, gzip;q=0", both), "br")
+        self.assertIsNone(negotiate_encoding("identity", both))
+        self.assertIsNone(negotiate_encoding("", both))
+        self.assertEqual(negotiate_encoding("br, gzip", ("gzip",)), "gzip")
+
+
+class ChangeFeedTests(InventoryAPITestCase):
+    def sync(self, since=None, limit=None, **params):
+        """Follow the feed from `since` until has_more is false; returns (pages, cursor)."""
+        pages, cursor = [], since
+        while True:
+            query = dict(params, **{k: v for k, v in {"since": cursor, "limit": limit}.items() if v is not None})
+            response = self.client.get(reverse("changes"), query)
+            self.assertEqual(response.status_code, 200, response.content)
+            pages.append(response.json())
+            cursor = pages[-1]["cursor"]
+            if not pages[-1]["has_more"]:
+                return pages, cursor
+
+    @staticmethod
+    def upserted(pages, key):
+        return [row["id"] for page in pages for row in page["upserts"][key]]
+
+    @staticmethod
+    def deleted(pages, key):
+        return [pk for page in pages for pk in page["deletes"][key]]
+
+    def test_writes_advance_the_change_sequence(self):
+        rows = self.seed(3)
+        product = Product.objects.get(pk=rows["products"][0].pk)
+        first = product.change_seq
+        self.assertGreater(first, 0)
+        product.current_stock = 1
+        product.save(update_fields=["current_stock"])
+        self.assertGreater(product.change_seq, first)
+        self.assertEqual(Product.objects.get(pk=product.pk).change_seq, product.change_seq)
+
+        Product.objects.filter(business=self.business).update(min_stock=1)
+        seqs = set(Product.objects.values_list("change_seq", flat=True))
+        self.assertEqual(len(seqs), 1)
+        self.assertGreater(seqs.pop(), product.change_seq)
+
+    def test_full_then_incremental_sync(self):
+        rows = self.seed(4)
+        pages, cursor = self.sync()
+        self.assertCountEqual(self.upserted(pages, "products"), [p.pk for p in rows["products"]])
+        self.assertCountEqual(self.upserted(pages, "orders"), [o.pk for o in rows["orders"]])
+        self.assertCountEqual(self.upserted(pages, "returns"), [r.pk for r in rows["returns"]])
+
+        pages, unchanged = self.sync(cursor)
+        self.assertEqual(unchanged, cursor)
+        self.assertEqual(pages[0]["upserts"], {"products": [], "orders": [], "returns": []})
+
+        order = rows["orders"][0]
+        Order.objects.filter(pk=order.pk).update(quantity=5)
+        pages, cursor = self.sync(cursor)
+        self.assertEqual(pages[0]["upserts"]["orders"], OrderValuesSerializer.serialize(Order.objects.filter(pk=order.pk)))
+        self.assertEqual(pages[0]["upserts"]["orders"][0]["quantity"], 5)
+        self.assertEqual(self.upserted(pages, "products") + self.upserted(pages, "returns"), [])
+
+        # A plain sequence number works as a cursor too
+        pages, _ = self.sync(cursor.split(".")[0])
+        self.assertEqual(self.upserted(pages, "orders"), [])
+
+    def test_deletes_leave_tombstones(self):
+        rows = self.seed(2)
+        _, cursor = self.sync()
+        returned = next(o for o in rows["orders"] if o.is_returned)
+        return_ids = list(Return.objects.filter(order=returned).values_list("pk", flat=True))
+        Order.objects.get(pk=returned.pk).delete()  # cascades to its returns
+
+        self.assertEqual(Tombstone.objects.filter(kind="return").count(), len(return_ids))
+        pages, _ = self.sync(cursor)
+        self.assertEqual(self.deleted(pages, "orders"), [returned.pk])
+        self.assertCountEqual(self.deleted(pages, "returns"), return_ids)
+        self.assertEqual(self.upserted(pages, "orders"), [])
+
+    def test_paging_does_not_skip_rows_sharing_a_sequence_number(self):
+        rows = self.seed(10)
+        pages, cursor = self.sync(limit=4)
+        self.assertEqual(len(pages), 7)  # 25 rows
+        self.assertEqual(sorted(self.upserted(pages, "orders")), sorted(o.pk for o in rows["orders"]))
+
+        # One update gives every order the same sequence number
+        Order.objects.filter(business=self.business).update(customer_name="Bulk")
+        pages, _ = self.sync(cursor, limit=3)
+        self.assertEqual(sorted(self.upserted(pages, "orders")), sorted(o.pk for o in rows["orders"]))
+
+    def test_other_businesses_are_not_listed(self):
+        self.seed(2)
+        self.seed(2, business=self.other_business)
+        stranger = UserProfile.objects.create_user(username="stranger", email="s@example.com", password="x", full_name="S")
+        self.seed(2, business=Business.objects.create(owner=stranger, business_name="Elsewhere"))
+
+        pages, _ = self.sync()
+        owned = Product.objects.filter(business__owner=self.user).values_list("pk", flat=True)
+        self.assertCountEqual(self.upserted(pages, "products"), owned)
+
+        pages, _ = self.sync(business=self.business.id)
+        self.assertCountEqual(self.upserted(pages, "products"), Product.objects.filter(business=self.business).values_list("pk", flat=True))
+
+    def test_businesses_have_their_own_sequences(self):
+        rows = self.seed(2)
+        self.seed(2, business=self.other_business)
+        pages, cursor = self.sync(limit=3)
+        seqs = {
+            business.id: set(Product.objects.filter(business=business).values_list("change_seq", flat=True))
+            for business in (self.business, self.other_business)
+        }
+        self.assertEqual(seqs[self.business.id], seqs[self.other_business.id])
+
+        # Writes to one business move only its position
+        order = rows["orders"][0]
+        Order.objects.filter(pk=order.pk).update(quantity=5)
+        Product.objects.filter(business=self.other_business).update(min_stock=1)
+        pages, after = self.sync(cursor)
+        self.assertEqual(self.upserted(pages, "orders"), [order.pk])
+        self.assertCountEqual(
+            self.upserted(pages, "products"), Product.objects.filter(business=self.other_business).values_list("pk", flat=True),
+        )
+        self.assertNotEqual(after, cursor)
+
+        # A cursor of the single sequence stands for every business
+        pages, _ = self.sync("0")
+        self.assertEqual(len(self.upserted(pages, "products")), 4)
+
+    def test_invalid_cursor(self):
+        for since in ["abc", "1.2", "1.9.0", "-1", "x:1", "1:1.2", "1:"]:
+            with self.subTest(since=since):
+                self.assertEqual(self.client.get(reverse("changes"), {"since": since}).status_code, 400)
+
+
+class ReplicaRouterTests(InventoryAPITestCase):
+    def test_reads_follow_the_request_writes_stay_on_primary(self):
+        router = replica.ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Order))
+        token = replica._read_alias.set(replica.REPLICA_DB_ALIAS)
+        try:
+            self.assertEqual(router.db_for_read(Order), replica.REPLICA_DB_ALIAS)
+            self.assertEqual(router.db_for_write(Order), "default")
+        finally:
+            replica._read_alias.reset(token)
+        self.assertFalse(router.allow_migrate(replica.REPLICA_DB_ALIAS, "inventory"))
+        self.assertTrue(router.allow_migrate("default", "inventory"))
+
+    def test_views_use_primary_without_a_replica(self):
+        self.seed(2)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get(reverse("sales-overview")).status_code, 200)
+        self.assertTrue(any('FROM "inventory_order"' in q["sql"] for q in ctx.captured_queries))
+
+    def test_write_requests_pin_the_user(self):
+        with mock.patch.object(replica, "replica_configured", return_value=True):
+            self.assertFalse(replica.is_pinned(self.user))
+            self.client.post(reverse("add-business"), {"business_name": "Third"}, format="json")
+            self.assertTrue(replica.is_pinned(self.user))
+        caches[replica.PIN_CACHE].delete(replica._pin_key(self.user.pk))
+
+    def test_pins_are_seen_by_other_workers(self):
+        # Each worker process has its own cache objects; only the shared store is common
+        self.assertNotIn("LocMemCache", settings.CACHES[replica.PIN_CACHE]["BACKEND"])
+        writer, reader = caches.create_connection(replica.PIN_CACHE), caches.create_connection(replica.PIN_CACHE)
+        self.addCleanup(writer.delete, replica._pin_key(self.user.pk))
+        with mock.patch.object(replica, "replica_configured", return_value=True):
+            with mock.patch.object(replica, "caches", {replica.PIN_CACHE: writer}):
+                replica.pin_to_primary(self.user)
+            with mock.patch.object(replica, "caches", {replica.PIN_CACHE: reader}):
+                self.assertTrue(replica.is_pinned(self.user))
+
+
+@skipUnless(replica.replica_configured(), "set DATABASE_REPLICA_URL to test replica routing")
+class ReplicaRoutingTests(APITransactionTestCase):
+    """Runs against the test mirror of DATABASE_REPLICA_URL (see settings.py)."""
+
+    databases = "__all__"
+    password = InventoryAPITestCase.password
+    replica_reads = True
+    setUp = InventoryAPITestCase.setUp
+    seed = InventoryAPITestCase.seed
+
+    def tearDown(self):
+        replica._unavailable_until.clear()
+        replica.cache.clear()
+
+    def order_reads(self, alias, make_request):
+        with CaptureQueriesContext(connections[alias]) as ctx:
+            response = make_request()
+        self.assertEqual(response.status_code, 200, response.content)
+        return [q["sql"] for q in ctx.captured_queries if 'FROM "inventory_order"' in q["sql"]]
+
+    def test_analytics_read_from_replica(self):
+        self.seed(3)
+        get = lambda: self.client.get(reverse("revenue-profit-analysis"))
+        self.assertEqual(self.order_reads("default", get), [])
+        self.assertTrue(self.order_reads(replica.REPLICA_DB_ALIAS, get))
+        self.assertTrue(self.order_reads("default", lambda: self.client.get(reverse("orders_list"))))
+
+    def test_reads_after_a_write_use_primary(self):
+        rows = self.seed(2)
+        self.client.post(reverse("add_edit_order"), {
+            "order_id": "NEW-1", "product_name": rows["products"][0].product_name,
+            "quantity": 1, "customer_name": "Walk-in", "date": date.today().isoformat(),
+        }, format="json")
+        self.assertTrue(self.order_reads("default", lambda: self.client.get(reverse("sales-overview"))))
+
+    def test_falls_back_to_primary_when_replica_fails(self):
+        self.seed(2)
+        broken = connections[replica.REPLICA_DB_ALIAS]
+        failure = broken.Database.OperationalError("unable to open database file")
+        with mock.patch.object(broken, "create_cursor", side_effect=failure):
+            self.assertTrue(self.order_reads("default", lambda: self.client.get(reverse("sales-overview"))))
+        self.assertFalse(replica.replica_available())
+        self.assertTrue(self.order_reads("default", lambda: self.client.get(reverse("returns-analysis"))))
+
+
+class AsyncViewTests(InventoryAPITestCase):
+    ENDPOINTS = [
+        ("dashboard_metrics", "async-dashboard"),
+        ("sales-overview", "async-sales-overview"),
+        ("returns-analysis", "async-returns-analysis"),
+        ("revenue-profit-analysis", "async-revenue-profit-analysis"),
+        ("inventory-analysis", "async-inventory-analysis"),
+        ("customer-sales-analysis", "async-customer-sales-analysis"),
+        ("analysis-batch", "async-analysis-batch"),
+    ]
+
+    def test_responses_match_sync_views(self):
+        self.seed(12)
+        self.seed(3, business=self.other_business)
+        today = date.today()
+        for params in ["", "range=weekly", "range=yearly", f"business={self.other_business.id}",
+                       f"start_date={today - timedelta(days=9)}&end_date={today}", "days=7"]:
+            for sync_name, async_name in self.ENDPOINTS:
+                with self.subTest(endpoint=async_name, params=params):
+                    expected = self.client.get(reverse(sync_name) + f"?{params}")
+                    actual = self.client.get(reverse(async_name) + f"?{params}")
+                    self.assertEqual(actual.status_code, expected.status_code)
+                    self.assertEqual(actual.json(), expected.json())
+
+    def test_dashboard_and_sales_overview_share_the_sync_cache(self):
+        self.seed(4)
+        for sync_name, async_name in [("dashboard_metrics", "async-dashboard"), ("sales-overview", "async-sales-overview")]:
+            with self.subTest(endpoint=async_name):
+                self.client.get(reverse(sync_name))
+                with CaptureQueriesContext(connection) as queries:
+                    self.assertEqual(self.client.get(reverse(async_name)).status_code, 200)
+                # Only the data version: the result comes from the sync view's cache entry
+                self.assertEqual(len(queries), 1, [q["sql"] for q in queries])
+                self.assertIn("MAX(", queries[0]["sql"])
+
+    def test_errors_match_sync_views(self):
+        today = date.today()
+        for params in ["business=nope", "business=999", f"start_date={today}&end_date={today - timedelta(days=1)}",
+                       "start_date=2024-01-01&end_date=bad", "sections=nope"]:
+            for sync_name, async_name in self.ENDPOINTS:
+                with self.subTest(endpoint=async_name, params=params):
+                    expected = self.client.get(reverse(sync_name) + f"?{params}")
+                    actual = self.client.get(reverse(async_name) + f"?{params}")
+                    self.assertEqual((actual.status_code, actual.json()), (expected.status_code, expected.json()))
+
+    def test_authentication_and_methods(self):
+        url = reverse("async-sales-overview")
+        self.assertEqual(self.client.post(url).status_code, 405)
+        self.client.credentials()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 401)
+        self.assertIn("WWW-Authenticate", response)
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer not-a-token")
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+    def test_login_matches_sync_view(self):
+        UserProfile.objects.create_user(username="Other", email="OWNER@example.org", password="Other123")
+        for body in [{"username": "OWNER", "password": self.password}, {"username": "owner@EXAMPLE.com", "password": self.password},
+                     {"username": "owner", "password": "wrong"}, {"username": "nobody", "password": "x"}, {"username": "owner"}]:
+            with self.subTest(body=body):
+                expected = self.client.post(reverse("login"), body, format="json")
+                actual = self.client.post(reverse("async-login"), body, format="json")
+                self.assertEqual(actual.status_code, expected.status_code)
+                self.assertEqual(
+                    {k: v for k, v in actual.json().items() if not k.endswith("_token")},
+                    {k: v for k, v in expected.json().items() if not k.endswith("_token")},
+                )
+        self.assertEqual(self.client.get(reverse("async-login")).status_code, 405)
+        self.assertEqual(self.client.post(reverse("async-login"), "{", content_type="application/json").status_code, 400)
+
+    async def test_cancelling_interrupts_the_running_query(self):
+        # Fast to start, and takes far longer than the test unless interrupted
+        slow = Product.objects.raw(
+            "WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n LIMIT 1000000000) "
+            "SELECT x AS id FROM n ORDER BY x DESC LIMIT 1"
+        )
+        evaluate, outcome, finished = async_db._evaluate, {}, threading.Event()
+
+        def recording_evaluate(queryset, running):
+            try:
+                return evaluate(queryset, running)
+            except Exception as exc:
+                outcome["error"] = exc
+                raise
+            finally:
+                finished.set()
+
+        with mock.patch.object(async_db, "_evaluate", recording_evaluate):
+            task = asyncio.ensure_future(async_db.run_query(slow))
+            await asyncio.sleep(0.3)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            self.assertTrue(await sync_to_async(finished.wait, thread_sensitive=False)(10))
+        self.assertIsInstance(outcome["error"], OperationalError)
+
+
+class ConcurrentQueryTests(APITransactionTestCase):
+    """gather_queries() outside a transaction: each query on its own thread and connection."""
+
+    password = InventoryAPITestCase.password
+    replica_reads = False
+    setUp = InventoryAPITestCase.setUp
+    seed = InventoryAPITestCase.seed
+
+    def test_queries_run_on_worker_threads(self):
+        self.seed(8)
+        querysets = [Product.objects.order_by("pk"), Order.objects.order_by("pk"), None, Return.objects.order_by("pk")]
+        with mock.patch.object(async_db, "_evaluate", wraps=async_db._evaluate) as evaluate:
+            rows = asyncio.run(async_db.gather_queries(*querysets))
+        self.assertEqual(evaluate.call_count, 3)
+        self.assertIsNone(rows[2])
+        self.assertEqual([len(r) for r in rows if r is not None], [8, 8, 4])
+        self.assertEqual(rows[0], list(Product.objects.order_by("pk")))
+
+    def test_async_login_authenticates_on_a_worker_thread(self):
+        threads, failures = [], []
+        authenticate = async_views.authenticate
+
+        def recording_authenticate(**credentials):
+            threads.append(threading.get_ident())
+            return authenticate(**credentials)
+
+        def failed(sender, credentials, **kwargs):
+            failures.append(credentials["username"])
+
+        user_login_failed.connect(failed)
+        self.addCleanup(user_login_failed.disconnect, failed)
+        with mock.patch.object(async_views, "authenticate", recording_authenticate):
+            self.assertEqual(self.client.post(reverse("async-login"), {"username": "owner", "password": self.password},
+                                              format="json").status_code, 200)
+            self.assertEqual(self.client.post(reverse("async-login"), {"username": "owner", "password": "wrong"},
+                                              format="json").status_code, 401)
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(threading.get_ident(), threads)
+        self.assertEqual(failures, ["owner"])
+
+    def test_async_batch_matches_sync(self):
+        self.seed(10)
+        for params in ["range=yearly", "range=weekly&sections=inventory-analysis,customer-sales-analysis"]:
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(reverse("async-analysis-batch") + f"?{params}").json(),
+                                 self.client.get(reverse("analysis-batch") + f"?{params}").json())
+
+
+class ArchiveTests(InventoryAPITestCase):
+    def analyses(self):
+        """Totals that must not change when orders move to or from the archive."""
+        today = date.today()
+        dates = {"start_date": (today - timedelta(days=19)).isoformat(), "end_date": today.isoformat()}
+        return {
+            "sales": self.client.get(reverse("sales-overview"), dates).json()["line_data"],
+            "returns": self.client.get(reverse("returns-analysis"), dates).json()["line_data"],
+            "dashboard": self.client.get(reverse("dashboard_metrics")).json()["sales_chart_data"],
+            "customers": sorted(
+                (c["customer_name"], c["total_revenue"])
+                for c in self.client.get(reverse("customer-sales-analysis"), dates).json()["top_customers"]
+            ),
+        }
+
+    def test_archived_orders_stay_in_the_analyses(self):
+        self.seed(20)
+        before = self.analyses()
+        call_command("archive_orders", "--days", "10", stdout=StringIO())
+
+        cutoff = date.today() - timedelta(days=10)
+        self.assertFalse(Order.objects.filter(date__lt=cutoff).exists())
+        self.assertEqual(ArchivedOrder.objects.count(), 9)
+        self.assertEqual(ArchivedReturn.objects.count(), 5)
+        self.assertEqual(DailySummary.objects.filter(kind="order").aggregate(n=Sum("rows"))["n"], 9)
+        self.assertEqual(self.analyses(), before)
+
+    def test_orders_returned_after_the_cutoff_stay_hot(self):
+        rows = self.seed(1)
+        order = rows["orders"][0]
+        Order.objects.filter(pk=order.pk).update(date=date.today() - timedelta(days=30))
+        Return.objects.create(business=self.business, order=order, product_name=order.product_name,
+                              customer_name=order.customer_name, quantity=1, date=date.today())
+        self.assertEqual(archive.archive(date.today() - timedelta(days=10)), (0, 0))
+
+    def test_restore_for_audit(self):
+        rows = self.seed(20)
+        before = self.analyses()
+        cursor = self.client.get(reverse("changes")).json()["cursor"]
+        tombstones = Tombstone.objects.count()
+        archive.archive(date.today() - timedelta(days=10))
+        self.assertEqual(Tombstone.objects.count(), tombstones)  # synced clients keep archived orders
+
+        old = [o.pk for o in rows["orders"] if o.date < date.today() - timedelta(days=10)]
+        call_command("restore_orders", "--start", "2000-01-01", "--end", date.today().isoformat(), stdout=StringIO())
+        self.assertCountEqual(Order.objects.values_list("pk", flat=True), [o.pk for o in rows["orders"]])
+        self.assertEqual(Return.objects.count(), len(rows["returns"]))
+        self.assertFalse(ArchivedOrder.objects.exists() or DailySummary.objects.exists())
+        self.assertEqual(self.analyses(), before)
+        page = self.client.get(reverse("changes"), {"since": cursor}).json()
+        self.assertCountEqual([row["id"] for row in page["upserts"]["orders"]], old)
+
+
+@override_settings(COST_THROTTLE_BUCKETS={
+    "user": {"capacity": 40, "rate": 1.0},
+    "business": {"capacity": 20, "rate": 0.5},
+})
+class CostThrottleTests(InventoryAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.seed(2)
+        self.now = 1_000_000.0
+        self.enterContext(mock.patch.object(throttling.CostThrottle, "timer", side_effect=lambda: self.now))
+
+    def report(self, days, name="sales-overview-report", **params):
+        end = date.today()
+        start = end - timedelta(days=days - 1)
+        return self.client.get(reverse(name), {"start_date": start.isoformat(), "end_date": end.isoformat(), **params})
+
+    def test_cost_follows_the_window(self):
+        business = str(self.business.pk)
+        self.assertEqual(self.report(30 * 18, business=business).status_code, 200)  # 18 tokens
+        response = self.report(30 * 6, business=business)
+        self.assertEqual(response.status_code, 429)
+        # The business bucket is 4 tokens short and refills 0.5 a second
+        self.assertEqual(response["Retry-After"], "8")
+        self.assertEqual(self.report(30, business=business).status_code, 200)
+
+        self.now += 8
+        self.assertEqual(self.report(30 * 5, business=business).status_code, 200)
+
+    def test_buckets_per_user_and_per_business(self):
+        self.assertEqual(self.report(30 * 20, business=str(self.business.pk)).status_code, 200)
+        self.assertEqual(self.report(30 * 19, business=str(self.other_business.pk)).status_code, 200)
+        # The user has 1 token left; both businesses none
+        response = self.report(30 * 2, business=str(self.other_business.pk))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "2")
+
+    def test_report_dearer_than_the_bucket_runs_when_it_is_full(self):
+        self.assertEqual(self.report(365 * 5, business=str(self.business.pk)).status_code, 200)
+        self.assertEqual(self.report(1, business=str(self.business.pk)).status_code, 429)
+
+    @mock.patch.object(throttling, "ROWS_PER_DAY", 1)
+    def test_business_size_comes_from_loaded_rows(self):
+        self.assertEqual(throttling.business_size([self.business.pk]), 1.0)
+        self.seed(118)  # with setUp's: 120 orders and 60 returns in the last 20 days
+        self.assertEqual(self.report(30, name="sales-overview", business=self.business.pk).status_code, 200)
+        self.assertEqual(throttling.business_size([self.business.pk]), 6.0)
+        # A 30-day report now costs 6 of the business's 20 tokens
+        for _ in range(3):
+            self.assertEqual(self.report(30, business=str(self.business.pk)).status_code, 200)
+        self.assertEqual(self.report(30, business=str(self.business.pk)).status_code, 429)
+
+    def test_cheap_endpoints_are_not_throttled(self):
+        self.report(365 * 5)
+        self.assertEqual(self.report(1).status_code, 429)
+        self.assertEqual(self.client.get(reverse("product_list")).status_code, 200)
+        self.assertEqual(self.client.get(reverse("sales-overview")).status_code, 200)
+
+
+class CoalesceTests(InventoryAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.key = coalesce.cache_key("test", self.id())
+        self.enterContext(mock.patch.object(coalesce, "POLL_INTERVAL", 0.01))
+
+    def counting(self, value, release=None):
+        """A compute() returning `value` that counts its calls and waits for `release`."""
+        calls = []
+
+        def compute():
+            calls.append(1)
+            if release is not None:
+                release.wait(5)
+            return value
+
+        return compute, calls
+
+    def test_concurrent_misses_compute_once(self):
+        release = threading.Event()
+        compute, calls = self.counting({"total": 1}, release)
+        with ThreadPoolExecutor(8) as pool:
+            results = [pool.submit(coalesce.cached, self.key, compute, 1) for _ in range(8)]
+            while not calls:
+                time.sleep(0.01)
+            release.set()
+            self.assertEqual([r.result() for r in results], [{"total": 1}] * 8)
+        self.assertEqual(len(calls), 1)
+
+    def test_other_worker_holding_the_lock_is_waited_for(self):
+        caches[coalesce.ANALYTICS_CACHE].add(f"{self.key}:lock", "other worker", 30)
+        compute, calls = self.counting("mine")
+        with ThreadPoolExecutor(1) as pool:
+            result = pool.submit(coalesce.cached, self.key, compute, 1)
+            coalesce._store(self.key, "theirs", 1, fresh=60, stale=60)
+            self.assertEqual(result.result(), "theirs")
+        self.assertEqual(calls, [])
+
+    def test_stale_entry_is_served_during_one_refresh(self):
+        coalesce._store(self.key, "old", 1, fresh=0, stale=60)
+        release = threading.Event()
+        compute, calls = self.counting("new", release)
+        self.assertEqual(coalesce.cached(self.key, compute, 1), "old")
+        self.assertEqual(coalesce.cached(self.key, compute, 1), "old")
+        release.set()
+        for _ in range(500):
+            if self.key not in coalesce._refreshing:
+                break
+            time.sleep(0.01)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(coalesce.cached(self.key, compute, 1), "new")
+
+    def test_new_version_is_computed_and_errors_are_not_cached(self):
+        coalesce._store(self.key, "old", 1, fresh=60, stale=60)
+
+        def fail():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            coalesce.cached(self.key, fail, 2)
+        self.assertEqual(coalesce.cached(self.key, lambda: "new", 2), "new")
+        self.assertEqual(coalesce._flights, {})
+
+    def test_dashboard_is_cached_until_a_write(self):
+        self.seed(4)
+        url = reverse("dashboard_metrics") + f"?business={self.business.pk}"
+        first = self.client.get(url).json()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).json(), first)
+        # Scope and data version only
+        self.assertLessEqual(len(queries), 2)
+
+        Order.objects.create(
+            business=self.business, order_id="AFTER", product_name=Product.objects.first().product_name,
+            quantity=3, customer_name="Walk-in", date=date.today(),
+        )
+        self.assertEqual(self.client.get(url).json()["total_orders"], first["total_orders"] + 1)
+
+
+@skipUnless(connection.vendor == "sqlite", "SQLite settings")
+class SQLiteSettingsTests(TestCase):
+    def setUp(self):
+        tmp = self.enterContext(tempfile.TemporaryDirectory())
+        self.file_connection = type(connections["default"])({**connection.settings_dict, "NAME": os.path.join(tmp, "db.sqlite3")}, "sqlite-file")
+        self.addCleanup(self.file_connection.close)
+
+    def pragmas(self, *names):
+        with self.file_connection.cursor() as cursor:
+            return {name: cursor.execute(f"PRAGMA {name}").fetchone()[0] for name in names}
+
+    def test_file_database_pragmas(self):
+        self.assertEqual(self.pragmas("synchronous", "temp_store", "busy_timeout", "cache_size"), {
+            "synchronous": 1, "temp_store": 2, "busy_timeout": 20000, "cache_size": -32000,
+        })
+
+    def test_journal_mode_is_set_once_after_migrate(self):
+        # Connecting leaves the file as it is
+        self.assertEqual(self.pragmas("journal_mode"), {"journal_mode": "delete"})
+        inventory = apps.get_app_config("inventory")
+        sqlite.migrated(sender=inventory, app_config=inventory, using="default")  # in memory: skipped
+        with mock.patch.object(sqlite, "connections", {"sqlite-file": self.file_connection}):
+            sqlite.migrated(sender=inventory, app_config=inventory, using="sqlite-file")
+        self.assertEqual(self.pragmas("journal_mode"), {"journal_mode": "wal"})
+
+    def test_transactions_take_the_write_lock_up_front(self):
+        with CaptureQueriesContext(self.file_connection) as queries:
+            # What transaction.atomic() runs to open a transaction
+            self.file_connection._start_transaction_under_autocommit()
+            self.file_connection.commit()
+        self.assertEqual([q["sql"] for q in queries], ["BEGIN IMMEDIATE", "COMMIT"])
+
+
+class ServerWarmUpTests(TestCase):
+    def test_warm_up_pushes_a_request_through_the_stack(self):
+        application, statuses = get_wsgi_application(), []
+
+        def recording_application(environ, start_response):
+            def start(status, headers, exc_info=None):
+                statuses.append(status)
+                return start_response(status, headers, exc_info)
+            return application(environ, start)
+
+        warm_up(recording_application)
+        self.assertEqual(statuses, ["401 Unauthorized"])
+
+    def test_open_connections_connects_every_pool_thread(self):
+        threads = set()
+
+        def record(sender, connection, **kwargs):
+            threads.add(threading.get_ident())
+
+        connection_created.connect(record)
+        try:
+            with ThreadPoolExecutor(3) as pool:
+                open_connections(pool, threads=3)
+        finally:
+            connection_created.disconnect(record)
+        self.assertEqual(len(threads), 3)
+        self.assertNotIn(threading.get_ident(), threads)
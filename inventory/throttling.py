@@ -0,0 +1,179 @@
+"""
+Cost-based throttling for the report and forecast endpoints.
+
+A request is charged a cost in tokens: about one per 30 days of data read,
+scaled by the size of the businesses it reads. The cost is taken from a token
+bucket of the user and one of each selected business
+(settings.COST_THROTTLE_BUCKETS); when any of them is short, the request gets
+429 with Retry-After set to when the bucket will have refilled enough.
+
+Business size is learned rather than counted, so throttling adds no query:
+CostThrottle hears from every SalesFrame (analytics.frame_loaded) how many
+order and return rows a day it loaded for its businesses
+(CostThrottle.note_density()). Businesses not seen yet count as size 1.
+
+Buckets live in the "throttle" cache, which all workers share. Like DRF's
+own throttles, a bucket is read and written without a lock, so two requests
+racing on one bucket may both be let through.
+"""
+import math
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import caches
+from django.dispatch import receiver
+from rest_framework.throttling import BaseThrottle
+
+from .analytics import frame_loaded
+from .scope import BusinessScopeError, get_business_scope
+
+THROTTLE_CACHE = "throttle"
+
+# Days of data that cost one token
+DAYS_PER_TOKEN = 30
+
+# Order and return rows a day that make a business of size 1
+ROWS_PER_DAY = 100
+
+# How long a learned density is kept (seconds)
+DENSITY_TTL = 24 * 60 * 60
+
+RANGE_DAYS = {"weekly": 7, "monthly": 30, "yearly": 365}
+
+def _density_key(business_ids):
+    return "density:" + ",".join(str(pk) for pk in sorted(business_ids))
+
+
+def business_ids_of(filters):
+    """The business ids of the analysis helpers' queryset filters (see views._business_filter)."""
+    if "business_id__in" in filters:
+        return list(filters["business_id__in"])
+    business = filters.get("business")
+    return [business.pk] if business is not None else []
+
+
+def business_size(business_ids):
+    """Size of the businesses in multiples of ROWS_PER_DAY rows a day (at least 1)."""
+    density = caches[THROTTLE_CACHE].get(_density_key(business_ids))
+    return max(1.0, (density or 0) / ROWS_PER_DAY)
+
+
+class CostThrottle(BaseThrottle):
+    """
+    Charge cost() tokens to the user's bucket and to each selected business's
+    bucket, all or nothing. Subclasses estimate the days of data read.
+    """
+
+    timer = time.time
+
+    # key -> (density, time.monotonic()) this process last wrote, to skip rewriting unchanged ones
+    _noted = {}
+
+    def __init__(self):
+        self.retry_after = None
+
+    @classmethod
+    def note_density(cls, business_ids, days, rows):
+        """Record that `days` days of `business_ids` held `rows` order and return rows."""
+        if not business_ids:
+            return
+        key = _density_key(business_ids)
+        density, now = rows / max(days, 1), time.monotonic()
+        last, written = cls._noted.get(key, (None, 0))
+        # Only a real change, or an entry about to expire, is worth a cache write
+        if last is not None and abs(density - last) <= 0.25 * max(last, 1) and now - written < DENSITY_TTL / 2:
+            return
+        cls._noted[key] = (density, now)
+        caches[THROTTLE_CACHE].set(key, density, DENSITY_TTL)
+
+    def days(self, request):
+        raise NotImplementedError
+
+    def business_ids(self, request):
+        try:
+            return get_business_scope(request).select()
+        except BusinessScopeError:
+            # The view answers 400
+            return []
+
+    def cost(self, request):
+        business_ids = self.business_ids(request)
+        return max(1.0, self.days(request) / DAYS_PER_TOKEN) * business_size(business_ids)
+
+    def buckets(self, request):
+        """(cache key, capacity, rate) of every bucket the request is charged to."""
+        config = settings.COST_THROTTLE_BUCKETS
+        user, business = config["user"], config["business"]
+        return [(f"bucket:user:{request.user.pk}", user["capacity"], user["rate"])] + [
+            (f"bucket:business:{pk}", business["capacity"], business["rate"])
+            for pk in self.business_ids(request)
+        ]
+
+    def allow_request(self, request, view):
+        if not request.user or not request.user.is_authenticated:
+            return True
+        cache = caches[THROTTLE_CACHE]
+        cost = self.cost(request)
+        buckets = self.buckets(request)
+        stored = cache.get_many([key for key, _capacity, _rate in buckets])
+        now = self.timer()
+        levels, wait = {}, 0.0
+        for key, capacity, rate in buckets:
+            tokens, stamp = stored.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - stamp) * rate)
+            # A request dearer than the whole bucket still runs when it is full
+            charge = min(cost, capacity)
+            if tokens < charge:
+                wait = max(wait, (charge - tokens) / rate)
+            levels[key] = (tokens - charge, capacity / rate)
+        if wait:
+            self.retry_after = wait
+            return False
+        for key, (tokens, refill) in levels.items():
+            # Expires once it would be full again anyway
+            cache.set(key, (tokens, now), timeout=math.ceil(refill))
+        return True
+
+    def wait(self):
+        # DRF truncates Retry-After to whole seconds
+        return math.ceil(self.retry_after) if self.retry_after else None
+
+
+class ReportThrottle(CostThrottle):
+    """Reports over ?start_date=&end_date=, or ?range= (`default_days` without either)."""
+
+    default_days = 30
+
+    def days(self, request):
+        params = request.query_params
+        try:
+            start = datetime.strptime(params.get("start_date", ""), "%Y-%m-%d").date()
+            end = datetime.strptime(params.get("end_date", ""), "%Y-%m-%d").date()
+        except ValueError:
+            return RANGE_DAYS.get(params.get("range", "").lower(), self.default_days)
+        return max((end - start).days + 1, 1)
+
+
+class InventoryReportThrottle(ReportThrottle):
+    """The inventory report defaults to twelve months."""
+
+    default_days = 365
+
+
+class ForecastThrottle(CostThrottle):
+    """The forecast reads the default business's whole order history, charged as a year."""
+
+    history_days = 365
+
+    def days(self, request):
+        return self.history_days
+
+    def business_ids(self, request):
+        business = get_business_scope(request).default_business
+        return [business.pk] if business else []
+
+
+@receiver(frame_loaded)
+def learn_density(sender, filters, days, rows, **kwargs):
+    CostThrottle.note_density(business_ids_of(filters), days, rows)
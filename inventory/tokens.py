@@ -0,0 +1,145 @@
+from django.conf import settings
+from django.db import router, transaction
+from django.utils import timezone
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from .models import Business, UserProfile, delete_rows
+
+ROLE_CLAIM = "role"
+BUSINESS_IDS_CLAIM = "business_ids"
+
+# Expired outstanding tokens deleted per transaction by prune_expired_tokens()
+PRUNE_BATCH_SIZE = 5000
+
+
+class ScopedAccessToken(AccessToken):
+    """
+    Access token with the scope claims. Requests carrying one don't load the
+    user (see authentication.BusinessScopedJWTAuthentication), so it lives
+    only settings.SCOPED_ACCESS_TOKEN_LIFETIME: a deactivated or deleted
+    user, or a change of businesses, takes effect by the next refresh.
+    """
+    lifetime = settings.SCOPED_ACCESS_TOKEN_LIFETIME
+
+
+class ScopedRefreshToken(RefreshToken):
+    """
+    Refresh token that carries the user's role and business ids as claims.
+    They are copied into every access token derived from it.
+    """
+    access_token_class = ScopedAccessToken
+
+    @classmethod
+    def for_user(cls, user, business_ids=None):
+        token = super().for_user(user)
+        token.set_scope_claims(user, business_ids)
+        return token
+
+    def set_scope_claims(self, user, business_ids=None):
+        if business_ids is None:
+            business_ids = Business.objects.filter(owner_id=user.pk).order_by("id").values_list("id", flat=True)
+        self[ROLE_CLAIM] = user.role
+        self[BUSINESS_IDS_CLAIM] = list(business_ids)
+
+
+class RescopingRefreshToken(ScopedRefreshToken):
+    """
+    Used by the refresh endpoint: re-reads role and business ids from the
+    database so a refreshed access token reflects ownership changes. (The
+    refresh serializer has checked that the user still exists and is active.)
+    """
+
+    @property
+    def access_token(self):
+        user = UserProfile.objects.only("id", "role").get(pk=self[api_settings.USER_ID_CLAIM])
+        self.set_scope_claims(user)
+        return super().access_token
+
+
+class ScopedTokenUser(TokenUser):
+    """
+    Stateless user built from a scoped access token, so authenticated requests
+    need no UserProfile query. `profile` loads the real row when needed.
+    """
+
+    @cached_property
+    def id(self):
+        return int(self.token[api_settings.USER_ID_CLAIM])
+
+    @cached_property
+    def role(self):
+        return self.token.get(ROLE_CLAIM)
+
+    @cached_property
+    def business_ids(self):
+        return list(self.token.get(BUSINESS_IDS_CLAIM, []))
+
+    @property
+    def businesses(self):
+        return Business.objects.filter(owner_id=self.id)
+
+    @cached_property
+    def profile(self):
+        return UserProfile.objects.get(pk=self.id)
+
+
+def get_tokens_for_user(user, business_ids=None, reuse=None):
+    """
+    Access/refresh token pair with scope claims, as returned by login and
+    signup. `reuse` is the refresh token the client already holds: while it
+    is valid for settings.REFRESH_TOKEN_REUSE_MIN_LIFETIME more, it is
+    returned again instead of issuing (and storing) a new one.
+    """
+    refresh = _reusable(user, reuse) if reuse else None
+    if refresh is not None:
+        refresh.set_scope_claims(user, business_ids)
+        return {"access_token": str(refresh.access_token), "refresh_token": reuse}
+    refresh = ScopedRefreshToken.for_user(user, business_ids)
+    return {
+        "access_token": str(refresh.access_token),
+        "refresh_token": str(refresh),
+    }
+
+
+def _reusable(user, token):
+    """`token` as a ScopedRefreshToken if it is `user`'s, not blacklisted and far enough from expiring."""
+    try:
+        refresh = ScopedRefreshToken(token)
+    except TokenError:
+        return None
+    if str(refresh.get(api_settings.USER_ID_CLAIM)) != str(user.pk):
+        return None
+    if datetime_from_epoch(refresh["exp"]) - timezone.now() < settings.REFRESH_TOKEN_REUSE_MIN_LIFETIME:
+        return None
+    return refresh
+
+
+def prune_expired_tokens(now=None, batch_size=PRUNE_BATCH_SIZE):
+    """
+    Delete the outstanding refresh tokens that expired by `now`, with their
+    blacklist entries, `batch_size` per transaction. Returns (outstanding,
+    blacklisted) deleted.
+
+    Every token gets the same lifetime, so the expired ones have the lowest
+    ids: each batch walks the primary key from the start, and expires_at
+    needs no index.
+    """
+    now = now or timezone.now()
+    using = router.db_for_write(OutstandingToken)
+    expired = OutstandingToken.objects.using(using).filter(expires_at__lte=now).order_by("pk").values_list("pk", flat=True)
+    deleted = [0, 0]
+    while True:
+        with transaction.atomic(using=using):
+            ids = list(expired[:batch_size])
+            if not ids:
+                return tuple(deleted)
+            # Nothing references blacklist entries, so Django deletes them without loading them
+            deleted[1] += BlacklistedToken.objects.using(using).filter(token_id__in=ids).delete()[0]
+            # The collector would load every token to look for blacklist entries, deleted just above
+            deleted[0] += delete_rows(OutstandingToken, ids, using)
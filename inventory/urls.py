@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     # -------------------------
@@ -8,9 +8,11 @@ urlpatterns = [
     path('signup/', views.signup, name='signup'),
     path('login/', views.login, name='login'),
     path('logout/', views.logout, name='logout'),
+    path('token/refresh/', views.token_refresh, name='token_refresh'),
     path('dashboard/', views.dashboard_metrics, name='dashboard_metrics'),
     path('businesses/', views.list_user_businesses, name='list-businesses'),
     path('businesses/add/', views.add_business, name='add-business'),
+    path('businesses/<int:pk>/catalog-copy/', views.catalog_copy_status, name='catalog-copy'),
 
     # -------------------------
     # Products (CORRECTED)
@@ -18,6 +20,7 @@ urlpatterns = [
     path('products/', views.product_list, name='product_list'),
     path('products/<int:pk>/', views.product_list, name='product_detail'),
     path('products/delete/<str:sku>/', views.delete_product, name='delete_product'),
+    path('products/low-stock/', views.low_stock_products, name='low-stock'),
 
     # -------------------------
     # Orders
@@ -46,6 +49,9 @@ urlpatterns = [
     path('analysis/revenue-profit-analysis/', views.revenue_profit_analysis, name="revenue-profit-analysis"),
     path('analysis/inventory-analysis/', views.inventory_analysis, name='inventory-analysis'),
     path('analysis/customer-sales-analysis/', views.customer_sales_analysis, name='customer-sales-analysis'),
+    path('analysis/top-customers/', views.top_customers, name='top-customers'),
+    path('analysis/batch/', views.analysis_batch, name='analysis-batch'),
+    path('changes/', views.changes_feed, name='changes'),
 
     path('analysis/sales-overview-report/', views.sales_overview_report, name='sales-overview-report'),
     path('analysis/returns-analysis-report/', views.returns_analysis_report, name='returns-analysis-report'),
@@ -55,4 +61,16 @@ urlpatterns = [
 
     path("sales-forecast/", views.sales_forecast_analysis, name="sales_forecast"),
     path("sales-forecast/retrain/", views.retrain_forecast_model, name="retrain_forecast"),
+
+    # -------------------------
+    # Async (ASGI) dashboard and analysis, same responses as above
+    # -------------------------
+    path('async/login/', async_views.login, name='async-login'),
+    path('async/dashboard/', async_views.dashboard_metrics, name='async-dashboard'),
+    path('async/analysis/sales-overview/', async_views.sales_overview, name='async-sales-overview'),
+    path('async/analysis/returns-analysis/', async_views.returns_analysis, name='async-returns-analysis'),
+    path('async/analysis/revenue-profit-analysis/', async_views.revenue_profit_analysis, name='async-revenue-profit-analysis'),
+    path('async/analysis/inventory-analysis/', async_views.inventory_analysis, name='async-inventory-analysis'),
+    path('async/analysis/customer-sales-analysis/', async_views.customer_sales_analysis, name='async-customer-sales-analysis'),
+    path('async/analysis/batch/', async_views.analysis_batch, name='async-analysis-batch'),
 ]
\ No newline at end of file
@@ -1,28 +1,38 @@
 import csv
 import random
-from django.db.models import Q
 from django.contrib.auth import authenticate
 import numpy as np
 import pandas as pd
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken, TokenError
+from rest_framework_simplejwt.views import TokenRefreshView
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
-from .serializers import UserProfileSerializer, ProductSerializer, OrderSerializer, ReturnSerializer
-from .models import SalesForecastModel, UserProfile, Product, Order, Return
-from .models import Business
+from .serializers import UserProfileSerializer, ProductSerializer, OrderSerializer, ReturnSerializer, ScopedTokenRefreshSerializer
+from .serializers import ProductValuesSerializer, OrderValuesSerializer, ReturnValuesSerializer
+from .models import SalesForecastModel, UserProfile, Product, Order, Return, Customer
+from .models import Business, CatalogCopy
+from .scope import BusinessScope, BusinessScopeError, BusinessNotFound, get_business_scope
+from .tokens import get_tokens_for_user
+from .money import to_paise, to_rupees
+from .replica import use_replica
+from .throttling import ForecastThrottle, InventoryReportThrottle, ReportThrottle
+from .archive import with_summaries
+from .coalesce import cache_key, cached, data_version
+from . import catalog, changes, sharding, snapshots, stock
+from .analytics import (
+    SalesFrame, Window, add_months, first_seen, group_sum, in_first_seen_order, net_totals, rank,
+)
 from django.core.exceptions import ObjectDoesNotExist
 from django.shortcuts import get_object_or_404
 from django.http import HttpResponse, JsonResponse
 from collections import defaultdict
 from django.db.models import Count, F
 from datetime import datetime, date, timedelta
-from django.db.models import Sum, DecimalField 
 from collections import OrderedDict
-from decimal import Decimal
 from sklearn.linear_model import LinearRegression 
 from sklearn.preprocessing import PolynomialFeatures
 from sklearn.pipeline import Pipeline
@@ -45,14 +55,12 @@ def signup(request):
     if serializer.is_valid():
         try:
             user = serializer.save()
-            refresh = RefreshToken.for_user(user)
             return Response({
                 "status": "success",
                 "message": "User created successfully!",
                 "user_id": user.id,
                 "username": user.username,
-                "access_token": str(refresh.access_token),
-                "refresh_token": str(refresh),
+                **get_tokens_for_user(user),
             }, status=status.HTTP_201_CREATED)
         except Exception as e:
             return Response({
@@ -70,6 +78,33 @@ def signup(request):
                 mapped[field] = str(msgs)
         return Response({"status": "error", "errors": mapped}, status=status.HTTP_400_BAD_REQUEST)
 
+def _login_user(username_or_email):
+    """
+    The user whose username or email is `username_or_email`, ignoring case,
+    in one query through the Lower() indexes. A username beats another
+    user's email.
+    """
+    return (
+        UserProfile.objects.matching(username=username_or_email, email=username_or_email)
+        .order_by("-username_matches", "pk").first()
+    )
+
+
+def _login_response(user, refresh_token=None):
+    """The login response; `refresh_token` is the client's current one, reused when still valid."""
+    return {
+        "status": "success",
+        "message": "Login successful",
+        "user_id": user.id,
+        "username": user.username,
+        **get_tokens_for_user(user, reuse=refresh_token),
+    }
+
+
+LOGIN_REQUIRED = {"status": "error", "message": "Username/Email and password are required"}
+LOGIN_FAILED = {"status": "error", "message": "Invalid username or password"}
+
+
 @api_view(["POST"])
 @permission_classes([AllowAny])
 def login(request):
@@ -77,30 +112,21 @@ def login(request):
     password = request.data.get("password", "")
 
     if not username_or_email or not password:
-        return Response({"status": "error", "message": "Username/Email and password are required"},
-                         status=status.HTTP_400_BAD_REQUEST)
+        return Response(LOGIN_REQUIRED, status=status.HTTP_400_BAD_REQUEST)
 
-    try:
-        user_obj = UserProfile.objects.get(Q(username__iexact=username_or_email) | Q(email__iexact=username_or_email))
-        uname = user_obj.username
-    except UserProfile.DoesNotExist:
-        return Response({"status": "error", "message": "Invalid username or password"},
-                         status=status.HTTP_401_UNAUTHORIZED)
+    user_obj = _login_user(username_or_email)
+    if user_obj is None:
+        return Response(LOGIN_FAILED, status=status.HTTP_401_UNAUTHORIZED)
 
-    user = authenticate(username=uname, password=password)
+    user = authenticate(username=user_obj.username, password=password)
     if not user:
-        return Response({"status": "error", "message": "Invalid username or password"},
-                         status=status.HTTP_401_UNAUTHORIZED)
+        return Response(LOGIN_FAILED, status=status.HTTP_401_UNAUTHORIZED)
+
+    return Response(_login_response(user, request.data.get("refresh_token")), status=status.HTTP_200_OK)
 
-    refresh = RefreshToken.for_user(user)
-    return Response({
-        "status": "success",
-        "message": "Login successful",
-        "user_id": user.id,
-        "username": user.username,
-        "access_token": str(refresh.access_token),
-        "refresh_token": str(refresh),
-    }, status=status.HTTP_200_OK)
+
+# Re-reads role/business claims from the database when minting the new access token
+token_refresh = TokenRefreshView.as_view(serializer_class=ScopedTokenRefreshSerializer)
 
 
 @api_view(["POST"])
@@ -120,8 +146,7 @@ def logout(request):
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def list_user_businesses(request):
-    user = request.user
-    businesses = user.businesses.all() if hasattr(user, "businesses") else []
+    businesses = get_business_scope(request).businesses
     data = [
         {"id": b.id, "business_name": b.business_name or f"Business {b.id}"}
         for b in businesses
@@ -131,11 +156,26 @@ def list_user_businesses(request):
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
 def add_business(request):
+    """
+    Creates a business. With `copy_from_business` (one of the user's
+    businesses), copies its products too (inventory.catalog): the response's
+    copied_products counts the rows inserted so far and catalog_copy reports
+    the copy, which continues in the background for large catalogs.
+    """
     user = request.user
     payload = request.data or {}
+    source_id = payload.get("copy_from_business")
+    source = None
+    if source_id:
+      try:
+        source = get_business_scope(request).business(source_id)
+      except BusinessNotFound:
+        return Response({"error": "Business to copy from not found for user"}, status=404)
+      except BusinessScopeError:
+        return Response({"error": "Invalid business id to copy from"}, status=400)
     try:
       biz = Business.objects.create(
-        owner=user,
+        owner_id=user.pk,
         business_name=payload.get("business_name", "").strip() or None,
         business_type=payload.get("business_type", "").strip() or None,
         contact_number=payload.get("contact_number", "").strip() or None,
@@ -143,37 +183,37 @@ def add_business(request):
         business_address=payload.get("business_address", "").strip() or None,
         department_branch=payload.get("department_branch", "").strip() or None,
       )
-      # Optional: copy products from an existing business owned by the user
-      source_id = payload.get("copy_from_business")
-      copied_count = 0
-      if source_id:
-        try:
-          source = Business.objects.get(owner=user, id=int(source_id))
-          from .models import Product
-          source_products = Product.objects.filter(business=source)
-          to_create = []
-          for sp in source_products:
-            to_create.append(Product(
-              business=biz,
-              product_name=sp.product_name,
-              sku=sp.sku,
-              category=sp.category,
-              current_stock=sp.current_stock,
-              min_stock=sp.min_stock,
-              max_stock=sp.max_stock,
-              price=sp.price,
-              selling_price=sp.selling_price,
-              supplier=sp.supplier,
-            ))
-          if to_create:
-            Product.objects.bulk_create(to_create, ignore_conflicts=True)
-            copied_count = len(to_create)
-        except Exception:
-          # Ignore copy failures and still return created business
-          pass
-      return Response({"id": biz.id, "business_name": biz.business_name, "copied_products": copied_count}, status=201)
+      data = {"id": biz.id, "business_name": biz.business_name, "copied_products": 0}
+      if source is not None:
+        copy = catalog.start(biz, source)
+        data.update(copied_products=copy.copied, catalog_copy=_catalog_copy_data(copy))
+      # Token claims list the user's businesses: issue tokens that include the new one
+      tokens = get_tokens_for_user(getattr(user, "profile", user))
+      return Response({**data, **tokens}, status=201)
     except Exception as e:
       return Response({"error": str(e)}, status=400)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def catalog_copy_status(request, pk):
+    """Progress of copying products into business `pk` (see add_business)."""
+    try:
+        business = get_business_scope(request).business(pk)
+    except BusinessScopeError:
+        return Response({"error": "Business not found for user"}, status=404)
+    copy = CatalogCopy.objects.filter(business=business).first()
+    if copy is None:
+        return Response({"error": "No products are being copied into this business"}, status=404)
+    catalog.resume_if_stale(copy)
+    return Response(_catalog_copy_data(copy))
+
+
+def _catalog_copy_data(copy):
+    return {
+        "source": copy.source_id, "status": copy.status, "total": copy.total, "processed": copy.processed,
+        "copied": copy.copied, "error": copy.error or None,
+    }
     
 
 @api_view(["GET"])
@@ -184,104 +224,143 @@ def dashboard_metrics(request):
     total_sales, total_orders, net_profit, total_returns,
     top_sales, low_stock_products, sales_chart_data, category_chart_data
     """
-    user = request.user
-    user_businesses = user.businesses.all() if hasattr(user, "businesses") else []
-    if not user_businesses:
+    scope = get_business_scope(request)
+    if not scope:
         return Response({"error": "No business found for this user."}, status=400)
 
     # business query param: id or 'all'
-    business_param = request.GET.get("business")
-    if business_param and business_param != "all":
-        try:
-            business_ids = [int(business_param)] if user_businesses.filter(id=int(business_param)).exists() else []
-        except Exception:
-            return Response({"error": "Invalid business id"}, status=400)
-        if not business_ids:
-            return Response({"error": "Business not found for user"}, status=404)
-    else:
-        business_ids = list(user_businesses.values_list("id", flat=True))
+    try:
+        business_ids = scope.select()
+    except BusinessNotFound:
+        return Response({"error": "Business not found for user"}, status=404)
+    except BusinessScopeError:
+        return Response({"error": "Invalid business id"}, status=400)
+
+    days = int(request.GET.get("days", 30))
+    if days <= 0 or days > 365:
+        days = 30
+    return Response(_cached_dashboard(business_ids, days))
+
 
-    # Load querysets
+def _cached_dashboard(business_ids, days):
+    """
+    The dashboard_metrics response for `business_ids` over the last `days`
+    days, from the analytics cache while no write changed their data (the
+    sync and async views both answer with it).
+    """
     today = date.today()
-    orders_qs = Order.objects.filter(business_id__in=business_ids, date=today)
-    returns_qs = Return.objects.filter(business_id__in=business_ids, date=today)
+    start = today - timedelta(days=days - 1)
 
+    def read(ids):
+        rows = {name: list(qs) for name, qs in _dashboard_queries(ids, today, start).items()}
+        rows["today"] = snapshots.today_lines(ids, today)
+        return rows
 
-    # Price lookups (maps by product_name)
-    products = Product.objects.filter(business_id__in=business_ids)
-    price_map = {p.product_name: Decimal(str(p.price)) for p in products}
-    sp_map = {p.product_name: Decimal(str(p.selling_price)) for p in products}
+    def compute():
+        # Its numbers add up across businesses, so businesses in different databases are read in turn
+        return _dashboard_data(_merge_dashboard_rows(sharding.fan_out(business_ids, read)), start, days)
 
-    # Totals
-    total_sales = Decimal("0.00")
-    net_profit = Decimal("0.00")
+    key = cache_key("dashboard_metrics", sorted(business_ids), today, days)
+    return cached(key, compute, version=data_version(business_ids))
 
-    for o in orders_qs:
-        sp = sp_map.get(o.product_name, Decimal("0.00"))
-        cp = price_map.get(o.product_name, Decimal("0.00"))
-        total_sales += sp * o.quantity
-        net_profit += (sp - cp) * o.quantity
 
-    for r in returns_qs:
-        sp = sp_map.get(r.product_name, Decimal("0.00"))
-        cp = price_map.get(r.product_name, Decimal("0.00"))
-        total_sales -= sp * r.quantity
-        net_profit -= (sp - cp) * r.quantity
+def _dashboard_queries(business_ids, today, start):
+    """
+    The querysets behind dashboard_metrics, by name; `start` begins the sales
+    chart. Today's orders and returns come from snapshots.today_lines() as
+    rows["today"].
+    """
+    products = Product.objects.filter(business_id__in=business_ids)
+    range_filter = {"business_id__in": business_ids, "date__gte": start, "date__lte": today}
+    range_fields = ["date", "product_name", "quantity"]
+    return {
+        "prices": products.values_list("product_name", "price", "selling_price"),
+        "low_stock": products.filter(is_low_stock=True).order_by("pk").values("product_name", "current_stock", "min_stock")[:50],
+        # Full range for the chart (not only today)
+        "range_orders": with_summaries(
+            Order.objects.filter(**range_filter).values_list(*range_fields), "order", range_fields, **range_filter
+        ),
+        "range_returns": with_summaries(
+            Return.objects.filter(**range_filter).values_list(*range_fields), "return", range_fields, **range_filter
+        ),
+        # Category distribution for products
+        "categories": products.values("category").annotate(count=Count("id")),
+    }
+
 
+def _merge_dashboard_rows(parts):
+    """One set of dashboard rows from those read in each database."""
+    if len(parts) == 1:
+        return parts[0]
+    rows = {name: [row for part in parts for row in part[name]] for name in parts[0] if name != "today"}
+    categories = defaultdict(int)
+    for row in rows["categories"]:
+        categories[row["category"]] += row["count"]
+    rows["categories"] = [{"category": category, "count": count} for category, count in categories.items()]
+    rows["low_stock"] = rows["low_stock"][:50]
+    rows["today"] = (
+        [line for part in parts for line in part["today"][0]],
+        sum(part["today"][1] for part in parts),
+        sum(part["today"][2] for part in parts),
+    )
+    return rows
+
+
+def _dashboard_data(rows, start, days):
+    """The dashboard_metrics response from the evaluated _dashboard_queries() and rows["today"]."""
+    # Price lookups (maps by product_name), in integer paise
+    price_map = {}
+    sp_map = {}
+    for name, price, selling_price in rows["prices"]:
+        price_map[name] = to_paise(price)
+        sp_map[name] = to_paise(selling_price)
+
+    # Today's (product_name, net quantity, selling price, cost price) lines
+    today_lines, order_count, return_count = rows["today"]
+
+    # Totals
+    total_sales = 0
+    net_profit = 0
 
     # Top sales (quantity net = orders - returns)
     qty_by_product = defaultdict(int)
-    for o in orders_qs:
-        qty_by_product[o.product_name] += o.quantity
-    for r in returns_qs:
-        qty_by_product[r.product_name] -= r.quantity
+    revenue_by_product = defaultdict(int)
+
+    for name, quantity, sp, cp in today_lines:
+        total_sales += sp * quantity
+        net_profit += (sp - cp) * quantity
+        qty_by_product[name] += quantity
+        revenue_by_product[name] += sp * quantity
 
     top_sales = []
     for name, qty in qty_by_product.items():
         if qty > 0:
-            revenue = float((sp_map.get(name, Decimal("0.00")) * qty))
+            revenue = to_rupees(revenue_by_product[name])
             top_sales.append({"product_name": name, "quantity": qty, "revenue": round(revenue, 2)})
     top_sales = sorted(top_sales, key=lambda x: (-x["quantity"], x["product_name"]))[:5]
 
-    # Low stock products
-    low_stock_qs = products.filter(current_stock__lte=F("min_stock")).values("product_name", "current_stock", "min_stock")[:50]
-    low_stock_products = list(low_stock_qs)
+    # Sales chart data (last `days` days), prefilled with 0
+    daily = { (start + timedelta(days=i)).isoformat(): 0 for i in range(days) }
+    for d, name, quantity in rows["range_orders"]:
+        key = d.isoformat()
+        daily[key] = daily.get(key, 0) + sp_map.get(name, 0) * quantity
+    for d, name, quantity in rows["range_returns"]:
+        key = d.isoformat()
+        daily[key] = daily.get(key, 0) - sp_map.get(name, 0) * quantity
 
-    # Sales chart data (last 30 days)
-    days = int(request.GET.get("days", 30))
-    if days <= 0 or days > 365:
-        days = 30
-    start = date.today() - timedelta(days=days - 1)
-    # prefill dates with 0
-    daily = { (start + timedelta(days=i)).isoformat(): 0.0 for i in range(days) }
+    sales_chart_data = [{"date": d, "sales": to_rupees(v)} for d, v in sorted(daily.items())]
+    category_chart_data = [{"category": c["category"], "count": c["count"]} for c in rows["categories"]]
 
-    # Query full range for chart data (not only today)
-    orders_range_qs = Order.objects.filter(business_id__in=business_ids, date__gte=start, date__lte=today)
-    returns_range_qs = Return.objects.filter(business_id__in=business_ids, date__gte=start, date__lte=today)
-
-    for o in orders_range_qs:
-        sp = float(sp_map.get(o.product_name, Decimal("0.00")))
-        daily[o.date.isoformat()] = daily.get(o.date.isoformat(), 0.0) + sp * o.quantity
-    for r in returns_range_qs:
-        sp = float(sp_map.get(r.product_name, Decimal("0.00")))
-        daily[r.date.isoformat()] = daily.get(r.date.isoformat(), 0.0) - sp * r.quantity
-
-    sales_chart_data = [{"date": d, "sales": round(v, 2)} for d, v in sorted(daily.items())]
-
-    # Category distribution for products
-    cat_counts = products.values("category").annotate(count=Count("id"))
-    category_chart_data = [{"category": c["category"], "count": c["count"]} for c in cat_counts]
-
-    return Response({
-        "total_sales": round(float(total_sales), 2),
-        "total_orders": orders_qs.count(),
-        "net_profit": round(float(net_profit), 2),
-        "total_returns": returns_qs.count(),
+    return {
+        "total_sales": to_rupees(total_sales),
+        "total_orders": order_count,
+        "net_profit": to_rupees(net_profit),
+        "total_returns": return_count,
         "top_sales": top_sales,
-        "low_stock_products": low_stock_products,
+        "low_stock_products": list(rows["low_stock"]),
         "sales_chart_data": sales_chart_data,
         "category_chart_data": category_chart_data,
-    })
+    }
 
 
 
@@ -292,36 +371,28 @@ def dashboard_metrics(request):
 @api_view(['GET', 'POST', 'PUT'])
 @permission_classes([IsAuthenticated])
 def product_list(request, pk=None):
-    user_businesses = request.user.businesses.all()
-    if not user_businesses:
+    scope = get_business_scope(request)
+    if not scope:
         return Response({"message": "No business found for this user."}, status=status.HTTP_403_FORBIDDEN)
-    business_param = request.GET.get("business")
-    if business_param and business_param != "all":
-        try:
-            business = user_businesses.get(id=int(business_param))
-            business_ids = [business.id]
-        except Exception:
-            return Response({"message": "Invalid business id"}, status=status.HTTP_400_BAD_REQUEST)
-    else:
-        business_ids = list(user_businesses.values_list("id", flat=True))
+    try:
+        business_ids = scope.select()
+    except BusinessScopeError:
+        return Response({"message": "Invalid business id"}, status=status.HTTP_400_BAD_REQUEST)
     
     if request.method == 'GET':
         products = Product.objects.filter(business_id__in=business_ids)
-        serializer = ProductSerializer(products, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(ProductValuesSerializer.serialize(products), status=status.HTTP_200_OK)
 
     elif request.method == 'POST':
         # Handles adding a new product
         # Determine target business from query param or fall back to first
         business_param = request.GET.get("business") or request.data.get("business")
-        target_business = None
-        if business_param and business_param != 'all':
-            try:
-                target_business = user_businesses.get(id=int(business_param))
-            except Exception:
-                return Response({"message": "Invalid business id"}, status=status.HTTP_400_BAD_REQUEST)
-        if target_business is None:
-            target_business = user_businesses.first()
+        try:
+            target_business = scope.resolve(business_param or "all")
+        except BusinessNotFound:
+            return Response({"message": "Business not found for user"}, status=status.HTTP_404_NOT_FOUND)
+        except BusinessScopeError:
+            return Response({"message": "Invalid business id"}, status=status.HTTP_400_BAD_REQUEST)
 
         serializer = ProductSerializer(data=request.data, context={'request': request, 'business_for_validation': target_business})
         if serializer.is_valid():
@@ -331,7 +402,7 @@ def product_list(request, pk=None):
     
     elif request.method == 'PUT':
         # 🟢 CORRECTED: Handles editing an existing product
-        product = get_object_or_404(Product, pk=pk, business__in=user_businesses)
+        product = get_object_or_404(Product.objects.select_related('business'), pk=pk, business_id__in=scope.business_ids)
         serializer = ProductSerializer(product, data=request.data, partial=True, context={'request': request, 'business_for_validation': product.business})
         if serializer.is_valid():
             serializer.save()
@@ -342,7 +413,7 @@ def product_list(request, pk=None):
 @api_view(['POST', 'PUT'])
 @permission_classes([IsAuthenticated])
 def add_edit_product(request):
-    business = request.user.businesses.first()
+    business = get_business_scope(request).default_business
     if not business:
         return Response({'error': 'No business found for this user'}, status=400)
 
@@ -379,7 +450,7 @@ def add_edit_product(request):
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
 def delete_product(request, sku):
-    business = request.user.businesses.first()
+    business = get_business_scope(request).default_business
     if not business:
         return Response({'error': 'No business found for this user'}, status=400)
 
@@ -390,29 +461,56 @@ def delete_product(request, sku):
     except Product.DoesNotExist:
         return Response({'error': 'Product not found'}, status=404)
 
+LOW_STOCK_LIMIT = 50
+MAX_LOW_STOCK_LIMIT = 500
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def low_stock_products(request):
+    """
+    Products at or below their min_stock, the furthest below first
+    (min_stock - current_stock, then name). Page with `offset` and `limit`
+    (default 50, max 500) while `has_more` is true. Only the low products are
+    read, through the (business, is_low_stock) index.
+    """
+    scope = get_business_scope(request)
+    if not scope:
+        return Response({"detail": "No business found."}, status=400)
+    try:
+        business_ids = scope.select()
+    except BusinessScopeError:
+        return Response({"detail": "Invalid business id"}, status=400)
+    try:
+        offset = max(0, int(request.GET.get("offset", 0)))
+        limit = max(1, min(int(request.GET.get("limit", LOW_STOCK_LIMIT)), MAX_LOW_STOCK_LIMIT))
+    except ValueError:
+        return Response({"detail": "offset and limit must be integers."}, status=400)
+
+    low = Product.objects.filter(business_id__in=business_ids, is_low_stock=True)
+    page = list(
+        low.annotate(shortfall=F("min_stock") - F("current_stock"))
+        .order_by("-shortfall", "product_name", "pk")
+        .values("id", "business", "product_name", "sku", "category", "current_stock", "min_stock", "shortfall")
+        [offset:offset + limit + 1]
+    )
+    return Response({"count": low.count(), "results": page[:limit], "has_more": len(page) > limit})
+
 # -----------------------
 # ORDERS
 # -----------------------
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def orders_list(request):
-    user_businesses = request.user.businesses.all()
-    if not user_businesses:
+    scope = get_business_scope(request)
+    if not scope:
         return Response([], status=status.HTTP_200_OK)
     
     date_str = request.query_params.get('date')
-    business_param = request.query_params.get('business')
-    
-    if business_param and business_param != 'all':
-        try:
-            b_id = int(business_param)
-            if not user_businesses.filter(id=b_id).exists():
-                return Response({"error": "Invalid business id"}, status=400)
-            orders = Order.objects.filter(business_id=b_id)
-        except Exception:
-            return Response({"error": "Invalid business id"}, status=400)
-    else:
-        orders = Order.objects.filter(business__in=user_businesses)
+    try:
+        orders = Order.objects.filter(business_id__in=scope.select())
+    except BusinessScopeError:
+        return Response({"error": "Invalid business id"}, status=400)
     
     if date_str:
         try:
@@ -421,14 +519,14 @@ def orders_list(request):
         except ValueError:
             return Response({"error": "Invalid date format. Use YYYY-MM-DD."}, status=400)
 
-    serializer = OrderSerializer(orders, many=True)
-    return Response(serializer.data)
+    return Response(OrderValuesSerializer.serialize(orders))
 
 @api_view(['POST', 'PUT'])
 @permission_classes([IsAuthenticated])
 def add_edit_order(request):
     try:
-        business = request.user.businesses.first()
+        scope = get_business_scope(request)
+        business = scope.default_business
         if not business:
             return Response({'status': 'error', 'message': 'No business found for this user'}, status=400)
         
@@ -437,7 +535,7 @@ def add_edit_order(request):
             business_param = request.GET.get('business') or request.data.get('business')
             scoped_business = business
             if business_param and business_param != 'all':
-                scoped_business = get_object_or_404(Business, id=int(business_param), owner=request.user)
+                scoped_business = scope.business(business_param)
 
             # Get the product name and quantity from the request
             product_name = request.data.get('product_name')
@@ -447,17 +545,20 @@ def add_edit_order(request):
             # Ensure the product exists before trying to add an order (scoped)
             product = get_object_or_404(Product, product_name=product_name, business=scoped_business)
 
-            # Check if there is enough stock
-            if product.current_stock < quantity:
+            # Check if there is enough stock (a sharded product's current_stock lags; stock.take() decides)
+            if not product.stock_shards and product.current_stock < quantity:
                 return Response({'status': 'error', 'message': f'Not enough stock for {product_name}.'}, status=400)
 
             serializer = OrderSerializer(data=request.data, context={'request': request, 'business_for_create': scoped_business})
             if serializer.is_valid():
-                order = serializer.save()
-
-                # Update the product's stock after a successful order
-                product.current_stock -= quantity
-                product.save()
+                # Taken first, with a conditional UPDATE, so concurrent orders can't oversell
+                if not stock.take(product, quantity):
+                    return Response({'status': 'error', 'message': f'Not enough stock for {product_name}.'}, status=400)
+                try:
+                    serializer.save()
+                except Exception:
+                    stock.give(product, quantity)
+                    raise
 
                 return Response({'status': 'success', 'data': serializer.data}, status=201)
             return Response({'status': 'error', 'errors': serializer.errors}, status=400)
@@ -476,6 +577,8 @@ def add_edit_order(request):
 
     except ObjectDoesNotExist:
         return Response({'status': 'error', 'message': f'Product with name "{product_name}" not found.'}, status=404)
+    except BusinessNotFound:
+        return Response({'status': 'error', 'message': 'Business not found for user'}, status=404)
     except Exception as e:
         return Response({'status': 'error', 'message': str(e)}, status=400)
 
@@ -488,10 +591,11 @@ def delete_order(request, pk):
     """
     try:
         # Fetch by PK first to handle historical records possibly missing business
+        # (not joined: businesses stay in default when the order's tenant is sharded)
         order = get_object_or_404(Order, pk=pk)
         # Enforce permission: order must belong to one of user's businesses (if set)
-        user_businesses = request.user.businesses.all()
-        if order.business and order.business not in user_businesses:
+        scope = get_business_scope(request)
+        if order.business_id and order.business_id not in scope:
             return Response(
                 {"error": "You do not have permission to delete this order, or it does not exist."},
                 status=status.HTTP_403_FORBIDDEN
@@ -500,24 +604,22 @@ def delete_order(request, pk):
         # 🟢 CRITICAL CHANGE: Get product and quantity BEFORE deleting the order
         # Resolve target business: prefer order.business; else use ?business param or single user's business
         business_param = request.GET.get('business')
-        user_businesses = request.user.businesses.all()
         target_business = order.business
         if not target_business:
             if business_param and business_param != 'all':
                 try:
-                    target_business = user_businesses.get(id=int(business_param))
+                    target_business = scope.business(business_param)
                 except Exception:
                     return Response({"error": "Invalid business id"}, status=status.HTTP_400_BAD_REQUEST)
-            elif user_businesses.count() == 1:
-                target_business = user_businesses.first()
+            elif len(scope.business_ids) == 1:
+                target_business = scope.default_business
             else:
                 return Response({"error": "Ambiguous business. Provide ?business=<id>."}, status=status.HTTP_400_BAD_REQUEST)
 
         product = get_object_or_404(Product, product_name=order.product_name, business=target_business)
         
         # 🟢 CRITICAL CHANGE: Restore the product's stock
-        product.current_stock += order.quantity
-        product.save()
+        stock.give(product, order.quantity)
 
         # Delete the order
         order.delete()
@@ -539,8 +641,8 @@ def delete_order(request, pk):
 @api_view(['GET', 'DELETE'])
 @permission_classes([IsAuthenticated])
 def returns_list(request):
-    user_businesses = request.user.businesses.all()
-    if not user_businesses:
+    scope = get_business_scope(request)
+    if not scope:
         return Response([], status=status.HTTP_200_OK)
     
     # Support deletion via this endpoint to avoid 405s from client routing mismatches
@@ -555,8 +657,8 @@ def returns_list(request):
                 return Response({"status": "error", "message": "Invalid id"}, status=400)
 
             # Find the return object first
-            return_obj = get_object_or_404(Return, pk=pk)
-            if return_obj.business and return_obj.business not in user_businesses:
+            return_obj = get_object_or_404(Return.objects.select_related('order'), pk=pk)
+            if return_obj.business_id and return_obj.business_id not in scope:
                 return Response({'status': 'error', 'message': 'Return does not belong to your business.'}, status=403)
 
             # Snapshot and delete first
@@ -577,9 +679,7 @@ def returns_list(request):
                 if product_name and target_business:
                     product = Product.objects.filter(product_name=product_name, business=target_business).first()
                     if product and quantity:
-                        new_stock = (product.current_stock or 0) - int(quantity)
-                        product.current_stock = new_stock if new_stock >= 0 else 0
-                        product.save()
+                        stock.take(product, int(quantity), clamp=True)
             except Exception:
                 pass
 
@@ -590,18 +690,10 @@ def returns_list(request):
             return Response({'status': 'error', 'message': str(e)}, status=400)
 
     date_str = request.query_params.get('date')
-    business_param = request.query_params.get('business')
-    
-    if business_param and business_param != 'all':
-        try:
-            b_id = int(business_param)
-            if not user_businesses.filter(id=b_id).exists():
-                return Response({"error": "Invalid business id"}, status=400)
-            returns = Return.objects.filter(business_id=b_id)
-        except Exception:
-            return Response({"error": "Invalid business id"}, status=400)
-    else:
-        returns = Return.objects.filter(business__in=user_businesses)
+    try:
+        returns = Return.objects.filter(business_id__in=scope.select())
+    except BusinessScopeError:
+        return Response({"error": "Invalid business id"}, status=400)
     
     if date_str:
         try:
@@ -610,23 +702,23 @@ def returns_list(request):
         except ValueError:
             return Response({"error": "Invalid date format. Use YYYY-MM-DD."}, status=400)
 
-    serializer = ReturnSerializer(returns, many=True)
-    return Response(serializer.data)
+    # order_id / tracking_id are read through a join in the same query
+    return Response(ReturnValuesSerializer.serialize(returns))
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def add_edit_return(request):
     try:
-        user_businesses = request.user.businesses.all()
-        if not user_businesses:
+        scope = get_business_scope(request)
+        if not scope:
             return Response({'status': 'error', 'message': 'No business found for this user'}, status=400)
         
         order_id = request.data.get('order')
 
         # Fetch order by PK first; then enforce permission
         order = get_object_or_404(Order, pk=order_id)
-        if order.business and order.business not in user_businesses:
+        if order.business_id and order.business_id not in scope:
             return Response({'status': 'error', 'message': 'Order does not belong to your business.'}, status=403)
         
         if order.is_returned:
@@ -638,11 +730,11 @@ def add_edit_return(request):
         if not target_business:
             if business_param and business_param != 'all':
                 try:
-                    target_business = user_businesses.get(id=int(business_param))
+                    target_business = scope.business(business_param)
                 except Exception:
                     return Response({'status': 'error', 'message': 'Invalid business id'}, status=400)
-            elif user_businesses.count() == 1:
-                target_business = user_businesses.first()
+            elif len(scope.business_ids) == 1:
+                target_business = scope.default_business
             else:
                 return Response({'status': 'error', 'message': 'Ambiguous business. Provide ?business=<id>.'}, status=400)
 
@@ -650,8 +742,7 @@ def add_edit_return(request):
         product = get_object_or_404(Product, product_name=order.product_name, business=target_business)
         
         # 🟢 Increase the product's stock for the return
-        product.current_stock += order.quantity
-        product.save()
+        stock.give(product, order.quantity)
 
         # Inject the resolved order to prevent internal re-query by the serializer
         serializer = ReturnSerializer(
@@ -677,7 +768,7 @@ def add_edit_return(request):
 @permission_classes([IsAuthenticated])
 def delete_return(request, pk):
     try:
-        business = request.user.businesses.first()
+        business = get_business_scope(request).default_business
         if not business:
             return Response({'status': 'error', 'message': 'No business found for this user'}, status=400)
 
@@ -692,13 +783,13 @@ def delete_return(request, pk):
 @permission_classes([IsAuthenticated])
 def remove_return(request, pk):
     try:
-        user_businesses = request.user.businesses.all()
-        if not user_businesses:
+        scope = get_business_scope(request)
+        if not scope:
             return Response({'status': 'error', 'message': 'No business found for this user'}, status=400)
         
         # 1. Find the return object first; then ensure it belongs to user's businesses
-        return_obj = get_object_or_404(Return, pk=pk)
-        if return_obj.business and return_obj.business not in user_businesses:
+        return_obj = get_object_or_404(Return.objects.select_related('order'), pk=pk)
+        if return_obj.business_id and return_obj.business_id not in scope:
             return Response({'status': 'error', 'message': 'Return does not belong to your business.'}, status=403)
         
         # 2. Snapshot details we need from the return itself and delete the return first
@@ -716,11 +807,11 @@ def remove_return(request, pk):
         if not target_business:
             if business_param and business_param != 'all':
                 try:
-                    target_business = user_businesses.get(id=int(business_param))
+                    target_business = scope.business(business_param)
                 except Exception:
                     return Response({'status': 'error', 'message': 'Invalid business id'}, status=400)
-            elif user_businesses.count() == 1:
-                target_business = user_businesses.first()
+            elif len(scope.business_ids) == 1:
+                target_business = scope.default_business
             else:
                 return Response({'status': 'error', 'message': 'Ambiguous business. Provide ?business=<id>.'}, status=400)
 
@@ -732,9 +823,7 @@ def remove_return(request, pk):
             if product_name and target_business:
                 product = Product.objects.filter(product_name=product_name, business=target_business).first()
                 if product and quantity:
-                    new_stock = (product.current_stock or 0) - int(quantity)
-                    product.current_stock = new_stock if new_stock >= 0 else 0
-                    product.save()
+                    stock.take(product, int(quantity), clamp=True)
         except Exception:
             pass
 
@@ -763,12 +852,23 @@ def update_product_stock(request):
     return JsonResponse({'message': 'This endpoint is for internal use only.'}, status=403)
 
 
+def _business_filter(business):
+    """
+    Queryset filter kwargs for the `business` argument of the analysis helpers:
+    a BusinessScope, a list of business ids, or a single Business.
+    """
+    if isinstance(business, BusinessScope):
+        return {"business_id__in": business.select()}
+    if isinstance(business, (list, tuple)):
+        return {"business_id__in": business}
+    return {"business": business}
+
+
 # --- Analysis: Sales Overview ---
 # views.py
 
-def _get_sales_overview_data(business, start_date, end_date):
-    from .models import Product, Order, Return
-
+def _overview_dates(start_date, end_date):
+    """(start, end) dates for _get_sales_overview_data's date or 'YYYY-MM-DD' arguments."""
     # Ensure start and end are proper date objects
     if isinstance(start_date, str):
         try:
@@ -789,56 +889,41 @@ def _get_sales_overview_data(business, start_date, end_date):
         end = end_date
     else:
         end = date.today()
+    return start, end
 
-    # Product lookups
-    # Support single business or a list of business ids
-    if isinstance(business, (list, tuple)):
-        products = Product.objects.filter(business_id__in=business).only("product_name", "selling_price", "category")
-        orders_qs = Order.objects.filter(business_id__in=business, date__gte=start, date__lte=end)
-        returns_qs = Return.objects.filter(business_id__in=business, date__gte=start, date__lte=end)
-    else:
-        products = Product.objects.filter(business=business).only("product_name", "selling_price", "category")
-        orders_qs = Order.objects.filter(business=business, date__gte=start, date__lte=end)
-        returns_qs = Return.objects.filter(business=business, date__gte=start, date__lte=end)
-    sp_map = {p.product_name: Decimal(str(p.selling_price)) for p in products}
-    cat_map = {p.product_name: p.category for p in products}
-
-    # orders_qs and returns_qs already set above
 
-    # ---- Line Chart (sales trend)
-    labels = [(start + timedelta(days=i)).isoformat() for i in range((end - start).days + 1)]
-    line_bucket = OrderedDict((k, Decimal("0.00")) for k in labels)
+def _get_sales_overview_data(business, start_date, end_date, frame=None):
+    start, end = _overview_dates(start_date, end_date)
 
-    for o in orders_qs:
-        line_bucket[o.date.isoformat()] += sp_map.get(o.product_name, Decimal("0.00")) * o.quantity
-    for r in returns_qs:
-        line_bucket[r.date.isoformat()] -= sp_map.get(r.product_name, Decimal("0.00")) * r.quantity
+    # Support a BusinessScope, a list of business ids or a single business
+    window = Window(start, end)
+    frame = frame.within(window) if frame is not None else SalesFrame(_business_filter(business), window)
+    orders, returns = frame.orders, frame.returns
+    order_sales, return_sales = frame.revenue(orders), frame.revenue(returns)
 
-    line_data = [{"label": k, "sales": float(v)} for k, v in line_bucket.items()]
+    # ---- Line Chart (sales trend)
+    line = group_sum(orders.bucket, order_sales, window.size) - group_sum(returns.bucket, return_sales, window.size)
+    line_data = [{"label": k, "sales": to_rupees(v)} for k, v in zip(window.labels, line)]
 
     # ---- Bar Chart (top products)
-    product_sales = defaultdict(Decimal)
-    for o in orders_qs:
-        product_sales[o.product_name] += sp_map.get(o.product_name, Decimal("0.00")) * o.quantity
-    for r in returns_qs:
-        product_sales[r.product_name] -= sp_map.get(r.product_name, Decimal("0.00")) * r.quantity
-
-    bar_data = [{"product": name, "sales": float(amount)} for name, amount in product_sales.items() if amount > 0]
-    bar_data.sort(key=lambda x: x["sales"], reverse=True)
-    bar_data = bar_data[:10]
+    product_sales, seen = net_totals((orders.product, returns.product), (order_sales, return_sales), frame.product_size)
+    bar_data = [
+        {"product": frame.product_names[c], "sales": to_rupees(product_sales[c])}
+        for c in rank(product_sales, seen, mask=product_sales > 0, limit=10)
+    ]
 
     # ---- Pie Chart (categories)
-    category_sales = defaultdict(Decimal)
-    for o in orders_qs:
-        cat = cat_map.get(o.product_name, "uncategorized")
-        category_sales[cat] += sp_map.get(o.product_name, Decimal("0.00")) * o.quantity
-    for r in returns_qs:
-        cat = cat_map.get(r.product_name, "uncategorized")
-        category_sales[cat] -= sp_map.get(r.product_name, Decimal("0.00")) * r.quantity
-
-    pie_raw = [{"category": c, "value": float(v)} for c, v in category_sales.items() if v > 0]
-    total = sum(x["value"] for x in pie_raw) or 1.0
-    pie_data = [{"category": x["category"], "value": round(100.0 * x["value"] / total, 2)} for x in pie_raw]
+    order_categories = frame.product_category[orders.product]
+    return_categories = frame.product_category[returns.product]
+    category_sales, seen = net_totals(
+        (order_categories, return_categories), (order_sales, return_sales), len(frame.category_names)
+    )
+    positive = in_first_seen_order(seen, mask=category_sales > 0)
+    total = int(category_sales[positive].sum()) or 1
+    pie_data = [
+        {"category": frame.category_names[c], "value": round(100.0 * int(category_sales[c]) / total, 2)}
+        for c in positive
+    ]
 
     return {
         "line_data": line_data,
@@ -849,56 +934,47 @@ def _get_sales_overview_data(business, start_date, end_date):
     }
 
 
-
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@use_replica
 def sales_overview(request):
-    user = request.user
-    user_businesses = list(user.businesses.values_list('id', flat=True)) if hasattr(user, 'businesses') else []
-    if not user_businesses:
+    scope = get_business_scope(request)
+    if not scope:
         return Response({"detail": "No business found."}, status=400)
+    try:
+        business_value = scope.select()
+    except BusinessScopeError:
+        return Response({"detail": "Invalid business id"}, status=400)
 
-    bparam = request.GET.get('business')
-    if bparam and bparam != 'all':
-        try:
-            bid = int(bparam)
-            if bid not in user_businesses:
-                return Response({"detail": "Invalid business id"}, status=400)
-            business = bid
-            business_value = [bid]
-        except Exception:
-            return Response({"detail": "Invalid business id"}, status=400)
-    else:
-        business_value = user_businesses
+    start, end = _overview_dates(request.GET.get("start_date"), request.GET.get("end_date"))
+    return Response(_cached_sales_overview(business_value, start, end))
 
-    start_date = request.GET.get("start_date")
-    end_date = request.GET.get("end_date")
-    data = _get_sales_overview_data(business_value, start_date, end_date)
-    return Response(data)
+
+def _cached_sales_overview(business_ids, start, end):
+    """
+    The sales_overview response for `business_ids` from `start` to `end`, from
+    the analytics cache while no write changed their data (the sync and async
+    views both answer with it).
+    """
+    key = cache_key("sales_overview", sorted(business_ids), start, end)
+    return cached(key, lambda: _get_sales_overview_data(business_ids, start, end), version=data_version(business_ids))
 
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@throttle_classes([ReportThrottle])
+@use_replica
 def sales_overview_report(request):
     """
     Generates and downloads a CSV report for the specified date range.
     """
-    user = request.user
-    user_businesses = list(user.businesses.values_list('id', flat=True)) if hasattr(user, 'businesses') else []
-    if not user_businesses:
+    scope = get_business_scope(request)
+    if not scope:
         return Response({"detail": "No business found."}, status=400)
-
-    bparam = request.GET.get('business')
-    if bparam and bparam != 'all':
-        try:
-            bid = int(bparam)
-            if bid not in user_businesses:
-                return Response({"detail": "Invalid business id"}, status=400)
-            business_value = [bid]
-        except Exception:
-            return Response({"detail": "Invalid business id"}, status=400)
-    else:
-        business_value = user_businesses
+    try:
+        business_value = scope.select()
+    except BusinessScopeError:
+        return Response({"detail": "Invalid business id"}, status=400)
     
     # Explicitly handle date parsing and defaulting
     try:
@@ -951,89 +1027,30 @@ def sales_overview_report(request):
 
 
 
-def add_months(d, m):
-    y = d.year + (d.month - 1 + m) // 12
-    mm = (d.month - 1 + m) % 12 + 1
-    return date(y, mm, 1)
-
-def _get_returns_analysis_data(business, rng, today, start_date=None, end_date=None):
+def _get_returns_analysis_data(business, rng, today, start_date=None, end_date=None, frame=None):
     """
     Helper function to get all raw data for both charts and reports.
     """
-    from .models import Product, Order, Return
-    
-    # If an explicit date range is provided and valid, use it. Otherwise fall back to rng logic
-    if start_date and end_date and isinstance(start_date, date) and isinstance(end_date, date):
-        start, end = start_date, end_date
-        def make_label(d): return d.isoformat()
-        labels = [(start + timedelta(days=i)).isoformat() for i in range((end - start).days + 1)]
-    else:
-        valid = {"weekly", "monthly", "yearly"}
-        if rng not in valid:
-            rng = "monthly"
-
-        # --- Time window + label function
-        if rng == "weekly":
-            start = today - timedelta(days=6)
-            end = today
-            def make_label(d): return d.isoformat()
-            labels = [(start + timedelta(days=i)).isoformat() for i in range(7)]
-        elif rng == "monthly":
-            start = today - timedelta(days=29)
-            end = today
-            def make_label(d): return d.isoformat()
-            labels = [(start + timedelta(days=i)).isoformat() for i in range(30)]
-        else: # yearly
-            first_month = add_months(date(today.year, today.month, 1), -11)
-            start = first_month
-            end = today
-            def make_label(d): return d.strftime("%Y-%m")
-            labels = []
-            for i in range(12):
-                m = add_months(first_month, i)
-                labels.append(m.strftime("%Y-%m"))
-
-    # Load product prices for calculations
-    products = Product.objects.filter(business=business).only("product_name", "selling_price")
-    sp_map = {p.product_name: Decimal(str(p.selling_price)) for p in products}
-
-    # Filter orders/returns in window
-    orders_qs = Order.objects.filter(business=business, date__gte=start, date__lte=end)
-    returns_qs = Return.objects.filter(business=business, date__gte=start, date__lte=end)
+    # An explicit, valid date range wins over the rng window
+    window, rng = Window.for_range(rng, today, start_date, end_date)
+    frame = frame.within(window) if frame is not None else SalesFrame(_business_filter(business), window)
+    orders, returns = frame.orders, frame.returns
 
     # --- 1) Line: returns trend over time (by quantity)
-    line_bucket = OrderedDict((k, 0) for k in labels)
-    if rng in ("weekly", "monthly"):
-        for r in returns_qs:
-            key = make_label(r.date)
-            line_bucket[key] = line_bucket.get(key, 0) + r.quantity
-    else: # yearly
-        for r in returns_qs:
-            key = make_label(date(r.date.year, r.date.month, 1))
-            line_bucket[key] = line_bucket.get(key, 0) + r.quantity
-
-    line_data = [{"label": k, "returns": v} for k, v in line_bucket.items()]
+    line = group_sum(returns.bucket, returns.quantity, window.size)
+    line_data = [{"label": k, "returns": int(v)} for k, v in zip(window.labels, line)]
 
     # --- 2) Bar: most returned products (by quantity)
-    bar_data_raw = returns_qs.values('product_name').annotate(
-        total_returns=Sum('quantity', output_field=DecimalField())
-    ).order_by('-total_returns')[:5]
-
-    bar_data = [{"product": item['product_name'], "returns": float(item['total_returns'])} for item in bar_data_raw]
-
+    returned = group_sum(returns.product, returns.quantity, frame.product_size)
+    bar_data = [
+        {"product": frame.product_names[c], "returns": float(returned[c])}
+        for c in rank(returned, first_seen(returns.product, frame.product_size), limit=5)
+    ]
 
     # --- 3) Donut: returns vs. sales (by value)
-    total_sales = Decimal("0.00")
-    for o in orders_qs:
-        total_sales += sp_map.get(o.product_name, Decimal("0.00")) * o.quantity
-
-    total_returns = Decimal("0.00")
-    for r in returns_qs:
-        total_returns += sp_map.get(r.product_name, Decimal("0.00")) * r.quantity
-    
     donut_data = [
-        {"name": "Sales", "value": float(total_sales)},
-        {"name": "Returns", "value": float(total_returns)}
+        {"name": "Sales", "value": to_rupees(frame.revenue(orders).sum())},
+        {"name": "Returns", "value": to_rupees(frame.revenue(returns).sum())}
     ]
 
     return {
@@ -1043,28 +1060,21 @@ def _get_returns_analysis_data(business, rng, today, start_date=None, end_date=N
         "range": rng,
     }
 
+
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@use_replica
 def returns_analysis(request):
     """
     Returns returns analysis data for charts.
     """
-    user = request.user
-    user_businesses = list(user.businesses.values_list('id', flat=True)) if hasattr(user, 'businesses') else []
-    if not user_businesses:
+    scope = get_business_scope(request)
+    if not scope:
         return Response({"detail": "No business found."}, status=400)
-
-    bparam = request.GET.get('business')
-    if bparam and bparam != 'all':
-        try:
-            bid = int(bparam)
-            if bid not in user_businesses:
-                return Response({"detail": "Invalid business id"}, status=400)
-            business = get_object_or_404(Business, id=bid, owner=user)
-        except Exception:
-            return Response({"detail": "Invalid business id"}, status=400)
-    else:
-        business = list(user_businesses)
+    try:
+        business = scope.select()
+    except BusinessScopeError:
+        return Response({"detail": "Invalid business id"}, status=400)
 
     rng = request.GET.get("range", "monthly").lower()
     # Optional date range support
@@ -1085,25 +1095,19 @@ def returns_analysis(request):
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@throttle_classes([ReportThrottle])
+@use_replica
 def returns_analysis_report(request):
     """
     Generates and downloads a CSV report for returns analysis.
     """
-    user = request.user
-    user_businesses = list(user.businesses.values_list('id', flat=True)) if hasattr(user, 'businesses') else []
-    if not user_businesses:
+    scope = get_business_scope(request)
+    if not scope:
         return Response({"detail": "No business found."}, status=400)
-    bparam = request.GET.get('business')
-    if bparam and bparam != 'all':
-        try:
-            bid = int(bparam)
-            if bid not in user_businesses:
-                return Response({"detail": "Invalid business id"}, status=400)
-            business = get_object_or_404(Business, id=bid, owner=user)
-        except Exception:
-            return Response({"detail": "Invalid business id"}, status=400)
-    else:
-        business = list(user_businesses)
+    try:
+        business = scope.select()
+    except BusinessScopeError:
+        return Response({"detail": "Invalid business id"}, status=400)
 
     rng = request.GET.get("range", "monthly").lower()
     start_date_str = request.GET.get("start_date")
@@ -1149,120 +1153,50 @@ def returns_analysis_report(request):
     return response
 
 
-def _get_revenue_profit_analysis_data(business, rng, today, start_date=None, end_date=None):
+def _get_revenue_profit_analysis_data(business, rng, today, start_date=None, end_date=None, frame=None):
     """
     Helper function to get all raw data for both charts and reports.
     """
-    from .models import Product, Order, Return
-
-    if start_date and end_date and isinstance(start_date, date) and isinstance(end_date, date):
-        start, end = start_date, end_date
-        def make_label(d): return d.isoformat()
-        labels = [(start + timedelta(days=i)).isoformat() for i in range((end - start).days + 1)]
-    else:
-        valid = {"weekly", "monthly", "yearly"}
-        if rng not in valid:
-            rng = "monthly"
-
-        # --- Time window + label function
-        if rng == "weekly":
-            start = today - timedelta(days=6)
-            end = today
-            def make_label(d): return d.isoformat()
-            labels = [(start + timedelta(days=i)).isoformat() for i in range(7)]
-        elif rng == "monthly":
-            start = today - timedelta(days=29)
-            end = today
-            def make_label(d): return d.isoformat()
-            labels = [(start + timedelta(days=i)).isoformat() for i in range(30)]
-        else: # yearly
-            first_month = add_months(date(today.year, today.month, 1), -11)
-            start = first_month
-            end = today
-            def make_label(d): return d.strftime("%Y-%m")
-            labels = []
-            for i in range(12):
-                m = add_months(first_month, i)
-                labels.append(m.strftime("%Y-%m"))
-
-    # Load product details for calculations (single or multiple businesses)
-    if isinstance(business, (list, tuple)):
-        products = Product.objects.filter(business_id__in=business).only("product_name", "selling_price", "price", "category")
-        orders_qs = Order.objects.filter(business_id__in=business, date__gte=start, date__lte=end)
-        returns_qs = Return.objects.filter(business_id__in=business, date__gte=start, date__lte=end)
-    else:
-        products = Product.objects.filter(business=business).only("product_name", "selling_price", "price", "category")
-        orders_qs = Order.objects.filter(business=business, date__gte=start, date__lte=end)
-        returns_qs = Return.objects.filter(business=business, date__gte=start, date__lte=end)
-
-    sp_map = {p.product_name: Decimal(str(p.selling_price)) for p in products}
-    cp_map = {p.product_name: Decimal(str(p.price)) for p in products}
-    cat_map = {p.product_name: p.category for p in products}
+    window, rng = Window.for_range(rng, today, start_date, end_date)
+    frame = frame.within(window) if frame is not None else SalesFrame(_business_filter(business), window)
+    names = frame.product_names
+
+    # Orders add revenue, cost and profit; returns take back revenue and profit
+    orders, returns = frame.sellable(frame.orders), frame.sellable(frame.returns)
+    order_revenue, return_revenue = frame.revenue(orders), frame.revenue(returns)
+    margin = frame.selling_paise - frame.cost_paise
+    revenue, seen = net_totals((orders.product, returns.product), (order_revenue, return_revenue), frame.product_size)
+    cost = group_sum(orders.product, frame.cost(orders), frame.product_size)
+    profit, _seen = net_totals(
+        (orders.product, returns.product),
+        (margin[orders.product] * orders.quantity, margin[returns.product] * returns.quantity),
+        frame.product_size,
+    )
 
     # --- 1) Bar: Revenue vs Cost per product
-    product_data = defaultdict(lambda: {"revenue": Decimal("0.00"), "cost": Decimal("0.00")})
-
-    for order in orders_qs:
-        product_name = order.product_name
-        if order.quantity and product_name in sp_map and product_name in cp_map:
-            revenue = sp_map[product_name] * Decimal(str(order.quantity))
-            cost = cp_map[product_name] * Decimal(str(order.quantity))
-            product_data[product_name]["revenue"] += revenue
-            product_data[product_name]["cost"] += cost
-    
-    for ret in returns_qs:
-        product_name = ret.product_name
-        if ret.quantity and product_name in sp_map:
-            revenue_reduction = sp_map[product_name] * Decimal(str(ret.quantity))
-            product_data[product_name]["revenue"] -= revenue_reduction
-
-    revenue_cost_data = [{"product_name": k, "revenue": float(v["revenue"]), "cost": float(v["cost"])} 
-                          for k, v in product_data.items() if v["revenue"] > 0]
-    revenue_cost_data.sort(key=lambda x: x["revenue"], reverse=True)
-
+    revenue_cost_data = [
+        {"product_name": names[c], "revenue": to_rupees(revenue[c]), "cost": to_rupees(cost[c])}
+        for c in rank(revenue, seen, mask=revenue > 0)
+    ]
 
     # --- 2) Line: Revenue growth over time
-    revenue_growth_bucket = OrderedDict((k, Decimal("0.00")) for k in labels)
-    for order in orders_qs:
-        product_name = order.product_name
-        if order.quantity and product_name in sp_map:
-            key = make_label(order.date) if rng in ("weekly", "monthly") else make_label(date(order.date.year, order.date.month, 1))
-            revenue_growth_bucket[key] += sp_map[product_name] * Decimal(str(order.quantity))
-    
-    for ret in returns_qs:
-        product_name = ret.product_name
-        if ret.quantity and product_name in sp_map:
-            key = make_label(ret.date) if rng in ("weekly", "monthly") else make_label(date(ret.date.year, ret.date.month, 1))
-            revenue_growth_bucket[key] -= sp_map[product_name] * Decimal(str(ret.quantity))
-
-    revenue_growth_data = [{"label": k, "revenue": float(v)} for k, v in revenue_growth_bucket.items()]
+    growth = group_sum(orders.bucket, order_revenue, window.size) - group_sum(returns.bucket, return_revenue, window.size)
+    revenue_growth_data = [{"label": k, "revenue": to_rupees(v)} for k, v in zip(window.labels, growth)]
 
-    
     # --- 3) Stacked Bar: Profit contribution by category
-    profit_by_category_and_product = defaultdict(lambda: defaultdict(Decimal))
-    for order in orders_qs:
-        product_name = order.product_name
-        if order.quantity and product_name in sp_map and product_name in cp_map and product_name in cat_map:
-            category = cat_map[product_name]
-            profit = (sp_map[product_name] - cp_map[product_name]) * Decimal(str(order.quantity))
-            profit_by_category_and_product[category][product_name] += profit
-
-    for ret in returns_qs:
-        product_name = ret.product_name
-        if ret.quantity and product_name in sp_map and product_name in cp_map and product_name in cat_map:
-            category = cat_map[product_name]
-            profit_reduction = (sp_map[product_name] - cp_map[product_name]) * Decimal(str(ret.quantity))
-            profit_by_category_and_product[category][product_name] -= profit_reduction
-    
+    products_by_category = OrderedDict()
+    for c in in_first_seen_order(seen):
+        products_by_category.setdefault(frame.product_category[c], []).append(c)
+
     profit_category_data = []
-    for category, products_data in profit_by_category_and_product.items():
-        if any(profit > 0 for profit in products_data.values()):
-            data_row = {"category": category}
-            for product, profit in products_data.items():
-                if profit > 0:
-                    data_row[product] = float(profit)
+    for category, codes in products_by_category.items():
+        positive = [c for c in codes if profit[c] > 0]
+        if positive:
+            data_row = {"category": frame.category_names[category]}
+            for c in positive:
+                data_row[names[c]] = to_rupees(profit[c])
             profit_category_data.append(data_row)
-    
+
     return {
         "revenue_cost_data": revenue_cost_data,
         "revenue_growth_data": revenue_growth_data,
@@ -1270,27 +1204,21 @@ def _get_revenue_profit_analysis_data(business, rng, today, start_date=None, end
         "range": rng,
     }
 
+
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@use_replica
 def revenue_profit_analysis(request):
     """
     Returns returns analysis data for charts.
     """
-    user = request.user
-    user_businesses = list(user.businesses.values_list('id', flat=True)) if hasattr(user, 'businesses') else []
-    if not user_businesses:
+    scope = get_business_scope(request)
+    if not scope:
         return Response({"detail": "No business found."}, status=400)
-    bparam = request.GET.get('business')
-    if bparam and bparam != 'all':
-        try:
-            bid = int(bparam)
-            if bid not in user_businesses:
-                return Response({"detail": "Invalid business id"}, status=400)
-            business = get_object_or_404(Business, id=bid, owner=user)
-        except Exception:
-            return Response({"detail": "Invalid business id"}, status=400)
-    else:
-        business = list(user_businesses)
+    try:
+        business = scope.select()
+    except BusinessScopeError:
+        return Response({"detail": "Invalid business id"}, status=400)
     
     rng = request.GET.get("range", "monthly").lower()
     start_date_str = request.GET.get("start_date")
@@ -1310,25 +1238,19 @@ def revenue_profit_analysis(request):
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@throttle_classes([ReportThrottle])
+@use_replica
 def revenue_profit_analysis_report(request):
     """
     Generates and downloads a CSV report for revenue and profit analysis.
     """
-    user = request.user
-    user_businesses = list(user.businesses.values_list('id', flat=True)) if hasattr(user, 'businesses') else []
-    if not user_businesses:
+    scope = get_business_scope(request)
+    if not scope:
         return Response({"detail": "No business found."}, status=400)
-    bparam = request.GET.get('business')
-    if bparam and bparam != 'all':
-        try:
-            bid = int(bparam)
-            if bid not in user_businesses:
-                return Response({"detail": "Invalid business id"}, status=400)
-            business = get_object_or_404(Business, id=bid, owner=user)
-        except Exception:
-            return Response({"detail": "Invalid business id"}, status=400)
-    else:
-        business = list(user_businesses)
+    try:
+        business = scope.select()
+    except BusinessScopeError:
+        return Response({"detail": "Invalid business id"}, status=400)
 
     rng = request.GET.get("range", "monthly").lower()
     start_date_str = request.GET.get("start_date")
@@ -1379,110 +1301,81 @@ def revenue_profit_analysis_report(request):
     return response
 
 
-def _get_inventory_analysis_data(business, today, start_date: date | None = None, end_date: date | None = None):
+def _inventory_window(today, start_date=None, end_date=None):
+    """Daily buckets for an explicit range, else the 12 months up to the end of this month."""
+    if start_date and end_date:
+        return Window(start_date, end_date)
+    start = add_months(date(today.year, today.month, 1), -11)
+    return Window(start, add_months(start, 12) - timedelta(days=1), monthly=True)
+
+
+def _inventory_queries(business_filter):
+    """Low-stock (name, stock) and inventory value (stock, price) rows for _get_inventory_analysis_data."""
+    products = Product.objects.filter(**business_filter)
+    return (
+        products.filter(is_low_stock=True).order_by('current_stock').values_list("product_name", "current_stock"),
+        products.values_list("current_stock", "price"),
+    )
+
+
+def _get_inventory_analysis_data(business, today, start_date: date | None = None, end_date: date | None = None, frame=None, rows=None):
     """
     Helper function to get all raw data for both charts and reports.
+    `rows` are the evaluated _inventory_queries(), when fetched by the caller.
     """
-    from .models import Product, Order, Return
+    business_filter = _business_filter(business)
+    low_stock_rows, value_rows = rows if rows is not None else _inventory_queries(business_filter)
 
     # --- 1) Low Stock Products
-    # Filter for products where current_stock is at or below min_stock
-    low_stock_products_filter = {"business_id__in": business} if isinstance(business, (list, tuple)) else {"business": business}
-    low_stock_products_qs = Product.objects.filter(
-        **low_stock_products_filter,
-        current_stock__lte=F('min_stock')
-    ).order_by('current_stock')
-
-    low_stock_products = [{"product_name": p.product_name, "current_stock": p.current_stock}
-                          for p in low_stock_products_qs]
+    # Products where current_stock is at or below min_stock
+    low_stock_products = [{"product_name": name, "current_stock": current_stock}
+                          for name, current_stock in low_stock_rows]
     
     # --- 2) Current Inventory Value
     # Calculate total value of all products in stock
-    products_qs = Product.objects.filter(**({"business_id__in": business} if isinstance(business, (list, tuple)) else {"business": business})).only("current_stock", "price")
-    total_inventory_value = Decimal("0.00")
-    for p in products_qs:
-        total_inventory_value += Decimal(str(p.current_stock)) * Decimal(str(p.price))
+    total_inventory_value = 0
+    for current_stock, price in value_rows:
+        total_inventory_value += current_stock * to_paise(price)
     
     # --- 3) Stock Movement Trend
     # If a date range is provided, compute daily net movement within the range.
     # Otherwise, provide monthly cumulative stock trend for the last 12 months (existing behavior).
+    window = _inventory_window(today, start_date, end_date)
+    frame = frame.within(window) if frame is not None else SalesFrame(business_filter, window)
+    orders, returns = frame.orders, frame.returns
     if start_date and end_date:
         # Daily net movement: returns add stock, orders subtract stock
-        num_days = (end_date - start_date).days + 1
-        labels = [(start_date + timedelta(days=i)).isoformat() for i in range(max(num_days, 0))]
-        daily_bucket = OrderedDict((k, 0) for k in labels)
-
-        orders = Order.objects.filter(**({"business_id__in": business} if isinstance(business, (list, tuple)) else {"business": business}), date__gte=start_date, date__lte=end_date)
-        returns = Return.objects.filter(**({"business_id__in": business} if isinstance(business, (list, tuple)) else {"business": business}), date__gte=start_date, date__lte=end_date)
-
-        for order in orders:
-            key = order.date.isoformat()
-            if key in daily_bucket:
-                daily_bucket[key] -= order.quantity
-        for ret in returns:
-            key = ret.date.isoformat()
-            if key in daily_bucket:
-                daily_bucket[key] += ret.quantity
-
-        stock_movement_data = [{"label": k, "stock": v} for k, v in daily_bucket.items()]
+        movement = group_sum(returns.bucket, returns.quantity, window.size) - group_sum(orders.bucket, orders.quantity, window.size)
+        stock_movement_data = [{"label": k, "stock": int(v)} for k, v in zip(window.labels, movement)]
     else:
-        # Default: last 12 months cumulative stock snapshot
-        start = add_months(date(today.year, today.month, 1), -11)
-
-        all_products = Product.objects.filter(**({"business_id__in": business} if isinstance(business, (list, tuple)) else {"business": business})).only("product_name", "current_stock")
-        stock_levels = {p.product_name: p.current_stock for p in all_products}
-
-        stock_trend = OrderedDict()
-
-        for i in range(12):
-            month_start = add_months(start, i)
-            month_end = add_months(start, i + 1) - timedelta(days=1)
-            month_label = month_start.strftime("%Y-%m")
-
-            orders = Order.objects.filter(**({"business_id__in": business} if isinstance(business, (list, tuple)) else {"business": business}), date__range=(month_start, month_end))
-            returns = Return.objects.filter(**({"business_id__in": business} if isinstance(business, (list, tuple)) else {"business": business}), date__range=(month_start, month_end))
-
-            for order in orders:
-                if order.product_name in stock_levels:
-                    stock_levels[order.product_name] -= order.quantity
-
-            for ret in returns:
-                if ret.product_name in stock_levels:
-                    stock_levels[ret.product_name] += ret.quantity
-
-            stock_trend[month_label] = sum(stock_levels.values())
-
-        stock_movement_data = [{"label": k, "stock": v} for k, v in stock_trend.items()]
+        # Default: last 12 months cumulative stock snapshot, walking forward from current stock
+        orders = orders.filter(frame.known[orders.product])
+        returns = returns.filter(frame.known[returns.product])
+        movement = group_sum(returns.bucket, returns.quantity, window.size) - group_sum(orders.bucket, orders.quantity, window.size)
+        stock = int(frame.stock.sum()) + np.cumsum(movement)
+        stock_movement_data = [{"label": k, "stock": int(v)} for k, v in zip(window.labels, stock)]
 
     return {
         "low_stock_products": low_stock_products,
-        "inventory_value": float(total_inventory_value),
+        "inventory_value": to_rupees(total_inventory_value),
         "stock_movement_data": stock_movement_data,
     }
 
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@use_replica
 def inventory_analysis(request):
     """
     Returns inventory analysis data for charts.
     """
-    user = request.user
-    user_businesses = list(user.businesses.values_list('id', flat=True)) if hasattr(user, 'businesses') else []
-    if not user_businesses:
+    scope = get_business_scope(request)
+    if not scope:
         return Response({"detail": "No business found."}, status=400)
-
-    bparam = request.GET.get('business')
-    if bparam and bparam != 'all':
-        try:
-            bid = int(bparam)
-            if bid not in user_businesses:
-                return Response({"detail": "Invalid business id"}, status=400)
-            business_value = [bid]
-        except Exception:
-            return Response({"detail": "Invalid business id"}, status=400)
-    else:
-        business_value = user_businesses
+    try:
+        business_value = scope.select()
+    except BusinessScopeError:
+        return Response({"detail": "Invalid business id"}, status=400)
 
     # Optional date range support
     start_date_str = request.GET.get("start_date")
@@ -1507,26 +1400,19 @@ def inventory_analysis(request):
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@throttle_classes([InventoryReportThrottle])
+@use_replica
 def inventory_analysis_report(request):
     """
     Generates and downloads a CSV report for inventory analysis.
     """
-    user = request.user
-    user_businesses = list(user.businesses.values_list('id', flat=True)) if hasattr(user, 'businesses') else []
-    if not user_businesses:
+    scope = get_business_scope(request)
+    if not scope:
         return Response({"detail": "No business found."}, status=400)
-
-    bparam = request.GET.get('business')
-    if bparam and bparam != 'all':
-        try:
-            bid = int(bparam)
-            if bid not in user_businesses:
-                return Response({"detail": "Invalid business id"}, status=400)
-            business_value = [bid]
-        except Exception:
-            return Response({"detail": "Invalid business id"}, status=400)
-    else:
-        business_value = user_businesses
+    try:
+        business_value = scope.select()
+    except BusinessScopeError:
+        return Response({"detail": "Invalid business id"}, status=400)
 
     # Optional date range support for the movement section
     start_date_str = request.GET.get("start_date")
@@ -1571,83 +1457,36 @@ def inventory_analysis_report(request):
     return response
 
 
-def _get_customer_sales_analysis_data(business, rng, today, start_date=None, end_date=None):
+def _get_customer_sales_analysis_data(business, rng, today, start_date=None, end_date=None, frame=None):
     """
     Helper function to get all raw data for both charts and reports.
     """
-    from .models import Product, Order
-    
-    if start_date and end_date and isinstance(start_date, date) and isinstance(end_date, date):
-        start, end = start_date, end_date
-        def make_label(d): return d.isoformat()
-        labels = [(start + timedelta(days=i)).isoformat() for i in range((end - start).days + 1)]
-    else:
-        valid = {"weekly", "monthly", "yearly"}
-        if rng not in valid:
-            rng = "monthly"
-
-        # --- Time window + label function
-        if rng == "weekly":
-            start = today - timedelta(days=6)
-            end = today
-            def make_label(d): return d.isoformat()
-            labels = [(start + timedelta(days=i)).isoformat() for i in range(7)]
-        elif rng == "monthly":
-            start = today - timedelta(days=29)
-            end = today
-            def make_label(d): return d.isoformat()
-            labels = [(start + timedelta(days=i)).isoformat() for i in range(30)]
-        else: # yearly
-            first_month = add_months(date(today.year, today.month, 1), -11)
-            start = first_month
-            end = today
-            def make_label(d): return d.strftime("%Y-%m")
-            labels = []
-            for i in range(12):
-                m = add_months(first_month, i)
-                labels.append(m.strftime("%Y-%m"))
-            
-    # Load product prices for revenue calculations
-    if isinstance(business, (list, tuple)):
-        products = Product.objects.filter(business_id__in=business).only("product_name", "selling_price")
-        orders_qs = Order.objects.filter(business_id__in=business, date__gte=start, date__lte=end)
+    window, rng = Window.for_range(rng, today, start_date, end_date)
+    if frame is not None:
+        frame = frame.within(window)
     else:
-        products = Product.objects.filter(business=business).only("product_name", "selling_price")
-        orders_qs = Order.objects.filter(business=business, date__gte=start, date__lte=end)
-    sp_map = {p.product_name: Decimal(str(p.selling_price)) for p in products}
+        frame = SalesFrame(_business_filter(business), window, returns=False, customers=True)
+    orders = frame.orders.filter(frame.orders.quantity > 0)
+    sold = frame.sellable(frame.orders)
+    revenue = frame.revenue(sold)
 
-    # Filter orders in window
-    # orders_qs already set above
-    
     # --- 1) Top Customers
-    customer_revenue = defaultdict(Decimal)
-    for order in orders_qs:
-        if order.quantity and order.product_name in sp_map:
-            revenue = sp_map[order.product_name] * Decimal(str(order.quantity))
-            customer_revenue[order.customer_name] += revenue
-    
-    sorted_customers = sorted(customer_revenue.items(), key=lambda item: item[1], reverse=True)[:5]
-    top_customers = [{"customer_name": k, "total_revenue": float(v)} for k, v in sorted_customers]
+    customer_revenue = group_sum(sold.customer, revenue, frame.customer_size)
+    top_customers = [
+        {"customer_name": frame.customer_names[c], "total_revenue": to_rupees(customer_revenue[c])}
+        for c in rank(customer_revenue, first_seen(sold.customer, frame.customer_size), limit=5)
+    ]
 
     # --- 2) Top Selling Products
-    product_sales = defaultdict(int)
-    for order in orders_qs:
-        if order.quantity:
-            product_sales[order.product_name] += order.quantity
-            
-    sorted_products = sorted(product_sales.items(), key=lambda item: item[1], reverse=True)[:5]
-    top_selling_products = [{"product_name": k, "total_quantity": v} for k, v in sorted_products]
+    product_sales = group_sum(orders.product, orders.quantity, frame.product_size)
+    top_selling_products = [
+        {"product_name": frame.product_names[c], "total_quantity": int(product_sales[c])}
+        for c in rank(product_sales, first_seen(orders.product, frame.product_size), limit=5)
+    ]
 
     # --- 3) Sales Trend over time
-    sales_trend_bucket = OrderedDict((k, Decimal("0.00")) for k in labels)
-    for order in orders_qs:
-        if order.quantity and order.product_name in sp_map:
-            key = make_label(order.date) if rng in ("weekly", "monthly") else make_label(date(order.date.year, order.date.month, 1))
-            revenue = sp_map[order.product_name] * Decimal(str(order.quantity))
-            if key in sales_trend_bucket:
-                sales_trend_bucket[key] += revenue
-    
-    sales_trend_data = [{"label": k, "sales": float(v)} for k, v in sales_trend_bucket.items()]
+    trend = group_sum(sold.bucket, revenue, window.size)
+    sales_trend_data = [{"label": k, "sales": to_rupees(v)} for k, v in zip(window.labels, trend)]
 
     return {
         "top_customers": top_customers,
@@ -1659,26 +1498,18 @@ def _get_customer_sales_analysis_data(business, rng, today, start_date=None, end
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@use_replica
 def customer_sales_analysis(request):
     """
     Returns customer sales analysis data for charts.
     """
-    user = request.user
-    user_businesses = list(user.businesses.values_list('id', flat=True)) if hasattr(user, 'businesses') else []
-    if not user_businesses:
+    scope = get_business_scope(request)
+    if not scope:
         return Response({"detail": "No business found."}, status=400)
-
-    bparam = request.GET.get('business')
-    if bparam and bparam != 'all':
-        try:
-            bid = int(bparam)
-            if bid not in user_businesses:
-                return Response({"detail": "Invalid business id"}, status=400)
-            business_value = [bid]
-        except Exception:
-            return Response({"detail": "Invalid business id"}, status=400)
-    else:
-        business_value = user_businesses
+    try:
+        business_value = scope.select()
+    except BusinessScopeError:
+        return Response({"detail": "Invalid business id"}, status=400)
 
     rng = request.GET.get("range", "monthly").lower()
     start_date_str = request.GET.get("start_date")
@@ -1704,26 +1535,19 @@ def customer_sales_analysis(request):
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@throttle_classes([ReportThrottle])
+@use_replica
 def customer_sales_analysis_report(request):
     """
     Generates and downloads a CSV report for customer sales analysis.
     """
-    user = request.user
-    user_businesses = list(user.businesses.values_list('id', flat=True)) if hasattr(user, 'businesses') else []
-    if not user_businesses:
+    scope = get_business_scope(request)
+    if not scope:
         return Response({"detail": "No business found."}, status=400)
-
-    bparam = request.GET.get('business')
-    if bparam and bparam != 'all':
-        try:
-            bid = int(bparam)
-            if bid not in user_businesses:
-                return Response({"detail": "Invalid business id"}, status=400)
-            business_value = [bid]
-        except Exception:
-            return Response({"detail": "Invalid business id"}, status=400)
-    else:
-        business_value = user_businesses
+    try:
+        business_value = scope.select()
+    except BusinessScopeError:
+        return Response({"detail": "Invalid business id"}, status=400)
 
     rng = request.GET.get("range", "monthly").lower()
     start_date_str = request.GET.get("start_date")
@@ -1769,6 +1593,165 @@ def customer_sales_analysis_report(request):
     return response
 
 
+TOP_CUSTOMERS_LIMIT = 10
+MAX_TOP_CUSTOMERS_LIMIT = 100
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+@use_replica
+def top_customers(request):
+    """
+    The customers with the highest lifetime revenue (`limit`, default 10, max
+    100), from the running totals kept by inventory.customers: one query
+    through the (business, -lifetime_revenue) index.
+    """
+    scope = get_business_scope(request)
+    if not scope:
+        return Response({"detail": "No business found."}, status=400)
+    try:
+        business_ids = scope.select()
+    except BusinessScopeError:
+        return Response({"detail": "Invalid business id"}, status=400)
+    try:
+        limit = max(1, min(int(request.GET.get("limit", TOP_CUSTOMERS_LIMIT)), MAX_TOP_CUSTOMERS_LIMIT))
+    except ValueError:
+        return Response({"detail": "limit must be an integer."}, status=400)
+
+    customers = (
+        Customer.objects.filter(business_id__in=business_ids, order_count__gt=0)
+        .order_by("-lifetime_revenue", "pk")
+        .values_list("id", "business", "name", "lifetime_revenue", "order_count", "last_order_date")[:limit]
+    )
+    return Response([
+        {
+            "id": pk, "business": business, "customer_name": name, "lifetime_revenue": to_rupees(revenue),
+            "order_count": order_count, "last_order_date": last_order_date,
+        }
+        for pk, business, name, revenue, order_count, last_order_date in customers
+    ])
+
+
+
+ANALYSIS_SECTIONS = (
+    "sales-overview",
+    "returns-analysis",
+    "revenue-profit-analysis",
+    "inventory-analysis",
+    "customer-sales-analysis",
+)
+
+
+def _batch_windows(sections, rng, today, start_date=None, end_date=None):
+    """
+    (window, rng, loaded) for analysis_batch: the shared window, the
+    normalised range and the union of every requested section's window,
+    which is loaded once.
+    """
+    window, rng = Window.for_range(rng, today, start_date, end_date)
+    windows = [window]
+    if "inventory-analysis" in sections:
+        windows.append(_inventory_window(today, start_date, end_date))
+    return window, rng, Window(min(w.start for w in windows), max(w.end for w in windows))
+
+
+def _batch_sections(business_value, sections, frame, window, rng, today, start_date=None, end_date=None, inventory_rows=None):
+    """The analysis_batch `sections` computed from one SalesFrame."""
+    data = {}
+    for name in sections:
+        if name == "sales-overview":
+            data[name] = _get_sales_overview_data(business_value, window.start, window.end, frame=frame)
+        elif name == "returns-analysis":
+            data[name] = _get_returns_analysis_data(business_value, rng, today, start_date, end_date, frame=frame)
+        elif name == "revenue-profit-analysis":
+            data[name] = _get_revenue_profit_analysis_data(business_value, rng, today, start_date, end_date, frame=frame)
+        elif name == "inventory-analysis":
+            data[name] = _get_inventory_analysis_data(business_value, today, start_date, end_date, frame=frame, rows=inventory_rows)
+        else:
+            section = _get_customer_sales_analysis_data(business_value, rng, today, start_date, end_date, frame=frame)
+            data[name] = {key: section[key] for key in ("top_customers", "top_selling_products", "sales_trend_data")}
+    return data
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+@use_replica
+def analysis_batch(request):
+    """
+    Several analysis sections in one response, computed from one scan of the
+    orders/returns window.
+
+    `sections` is a comma-separated list of section names (default: all).
+    `range`, `start_date` and `end_date` are shared by every section and mean
+    what they mean on the individual endpoints; the sales overview covers the
+    same dates as the other sections.
+    """
+    scope = get_business_scope(request)
+    if not scope:
+        return Response({"detail": "No business found."}, status=400)
+    try:
+        business_value = scope.select()
+    except BusinessScopeError:
+        return Response({"detail": "Invalid business id"}, status=400)
+
+    sections_param = request.GET.get("sections", "")
+    sections = list(dict.fromkeys(name.strip() for name in sections_param.split(",") if name.strip()))
+    sections = sections or list(ANALYSIS_SECTIONS)
+    unknown = [name for name in sections if name not in ANALYSIS_SECTIONS]
+    if unknown:
+        return Response({"detail": f"Unknown sections: {', '.join(unknown)}. Choose from {', '.join(ANALYSIS_SECTIONS)}."}, status=400)
+
+    rng = request.GET.get("range", "monthly").lower()
+    start_date_str = request.GET.get("start_date")
+    end_date_str = request.GET.get("end_date")
+    start_date = end_date = None
+    if start_date_str and end_date_str:
+        try:
+            start_date = datetime.strptime(start_date_str, "%Y-%m-%d").date()
+            end_date = datetime.strptime(end_date_str, "%Y-%m-%d").date()
+            if start_date > end_date:
+                return Response({"detail": "start_date cannot be after end_date"}, status=400)
+        except Exception:
+            return Response({"detail": "Invalid date format. Use YYYY-MM-DD."}, status=400)
+
+    today = date.today()
+    window, rng, loaded = _batch_windows(sections, rng, today, start_date, end_date)
+    frame = SalesFrame(_business_filter(business_value), loaded, customers="customer-sales-analysis" in sections)
+    data = _batch_sections(business_value, sections, frame, window, rng, today, start_date, end_date)
+
+    return Response({"range": rng, "start": str(window.start), "end": str(window.end), "sections": data})
+
+
+# ------------------------- Change feed -------------------------
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def changes_feed(request):
+    """
+    Incremental sync: products, orders and returns written, and the ids
+    deleted, after `since`. Omit `since` for a full sync, then pass the
+    returned `cursor` back while `has_more` is true. `limit` caps the number
+    of changes per page (default 500, max 5000).
+    """
+    scope = get_business_scope(request)
+    if not scope:
+        return Response({"detail": "No business found."}, status=400)
+    try:
+        business_ids = scope.select()
+    except BusinessScopeError:
+        return Response({"detail": "Invalid business id"}, status=400)
+
+    try:
+        since = changes.Cursor.parse(request.GET.get("since"))
+    except changes.InvalidCursor:
+        return Response({"detail": "Invalid cursor. Pass the cursor returned by the previous page."}, status=400)
+    try:
+        limit = int(request.GET.get("limit", changes.DEFAULT_LIMIT))
+    except ValueError:
+        return Response({"detail": "limit must be an integer."}, status=400)
+    limit = max(1, min(limit, changes.MAX_LIMIT))
+
+    return Response(changes.read_changes(business_ids, since, limit))
+
 
 # ------------------------- Daily Sales -------------------------
 def _get_daily_sales(business):
@@ -1777,13 +1760,18 @@ def _get_daily_sales(business):
     Returns DataFrame with columns ['date', 'sales'].
     """
     try:
-        orders_qs = Order.objects.filter(business=business, is_returned=False).order_by('date')
+        fields = ['date', 'product_name', 'quantity']
+        orders_qs = with_summaries(
+            Order.objects.filter(business=business, is_returned=False).values_list(*fields),
+            'order', fields, business=business, is_returned=False,
+        )
         products_qs = Product.objects.filter(business=business)
 
-        if not orders_qs.exists() or not products_qs.exists():
+        order_rows = list(orders_qs)
+        if not order_rows or not products_qs.exists():
             return pd.DataFrame(), "Not enough data to create a forecast. Please add sales and products."
 
-        orders_df = pd.DataFrame(list(orders_qs.values('date', 'product_name', 'quantity')))
+        orders_df = pd.DataFrame(order_rows, columns=fields)
         products_df = pd.DataFrame(list(products_qs.values('product_name', 'selling_price')))
 
         orders_df = pd.merge(orders_df, products_df, on='product_name', how='left')
@@ -1803,8 +1791,10 @@ def _get_daily_sales(business):
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@throttle_classes([ForecastThrottle])
+@use_replica
 def sales_forecast_analysis(request):
-    user_business = request.user.businesses.first()
+    user_business = get_business_scope(request).default_business
     if not user_business:
         return Response({"forecast_data": [], "message": "No business profile found."}, status=400)
 
@@ -1887,7 +1877,7 @@ def sales_forecast_analysis(request):
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
 def retrain_forecast_model(request):
-    user_business = request.user.businesses.first()
+    user_business = get_business_scope(request).default_business
     if not user_business:
         return Response({"message": "No business profile found."}, status=400)
 
@@ -1899,6 +1889,7 @@ def retrain_forecast_model(request):
 
 
 @csrf_exempt
+@use_replica
 def forecast_all_products(request):
     """
     API endpoint: returns forecast for all products
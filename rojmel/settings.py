@@ -46,15 +46,23 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware', # must be at the very top
     'django.middleware.security.SecurityMiddleware',
+    'inventory.middleware.CompressionMiddleware', # gzip/Brotli, see COMPRESSION_* below
     'whitenoise.middleware.WhiteNoiseMiddleware', # serve static files
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'inventory.middleware.ReplicaPinMiddleware', # read-your-writes for replica routing
+    'inventory.middleware.TenantRoutingMiddleware', # per-request tenant shard routing
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Response compression (inventory.middleware.CompressionMiddleware)
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", 1024))  # bytes; smaller bodies are sent as-is
+COMPRESSION_LEVEL = int(os.environ.get("COMPRESSION_LEVEL", 6))  # gzip, 1-9
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get("COMPRESSION_BROTLI_QUALITY", 5))  # brotli, 0-11
+
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
 # -------------------------
@@ -75,11 +83,15 @@ CSRF_TRUSTED_ORIGINS = [
 # -------------------------
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "inventory.authentication.BusinessScopedJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": (
         "rest_framework.permissions.IsAuthenticated",
     ),
+    "DEFAULT_RENDERER_CLASSES": (
+        "inventory.renderers.FastJSONRenderer",  # orjson when installed
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
 }
 
 SIMPLE_JWT = {
@@ -89,6 +101,16 @@ SIMPLE_JWT = {
     "ROTATE_REFRESH_TOKENS": False,
 }
 
+# Access tokens carrying the user's businesses skip loading the user on each
+# request, so they expire this soon; the client refreshes them (inventory.tokens)
+SCOPED_ACCESS_TOKEN_LIFETIME = timedelta(minutes=int(os.environ.get("SCOPED_ACCESS_TOKEN_MINUTES", 15)))
+
+# Login hands a client's own refresh token back while it is valid this much longer (inventory.tokens)
+REFRESH_TOKEN_REUSE_MIN_LIFETIME = timedelta(days=int(os.environ.get("REFRESH_TOKEN_REUSE_MIN_DAYS", 7)))
+
+# Validated access tokens kept in-process so repeat requests skip signature checks (0 disables)
+JWT_VERIFIED_TOKEN_CACHE_SIZE = int(os.environ.get("JWT_VERIFIED_TOKEN_CACHE_SIZE", 1024))
+
 AUTH_USER_MODEL = "inventory.UserProfile"
 
 # -------------------------
@@ -122,6 +144,103 @@ DATABASES = {
     )
 }
 
+# Optional read replica for the analytics, report and forecast views
+# (inventory.replica). For a local try-out with two SQLite files:
+# cp db.sqlite3 replica.sqlite3 && export DATABASE_REPLICA_URL=sqlite:///replica.sqlite3
+if os.environ.get("DATABASE_REPLICA_URL"):
+    DATABASES["replica"] = dj_database_url.parse(os.environ["DATABASE_REPLICA_URL"], conn_max_age=600)
+    DATABASES["replica"]["TEST"] = {"MIRROR": "default"}
+
+# Databases that businesses can be moved to with manage.py move_tenant
+# (inventory.sharding), as space-separated alias=URL pairs. Each needs
+# `manage.py migrate --database <alias>` first. For a local try-out:
+# export DATABASE_SHARDS="shard1=sqlite:///shard1.sqlite3 shard2=sqlite:///shard2.sqlite3"
+SHARD_ALIASES = ["default"]
+for _shard in os.environ.get("DATABASE_SHARDS", "").split():
+    _alias, _url = _shard.split("=", 1)
+    DATABASES[_alias] = dj_database_url.parse(_url, conn_max_age=600)
+    SHARD_ALIASES.append(_alias)
+
+# SQLite (the db.sqlite3 fallback, which small installs run on in production):
+# WAL lets reads carry on while a write commits, and BEGIN IMMEDIATE takes the
+# write lock when a transaction starts, so concurrent writers queue for up to
+# `timeout` seconds (sqlite's busy_timeout) instead of failing with "database
+# is locked" when a read lock can't be upgraded. synchronous=NORMAL is durable
+# under WAL except for the last commits before a power loss.
+# The journal mode is kept in the database file, so it is not set per
+# connection: manage.py migrate sets it once (inventory.sqlite).
+SQLITE_JOURNAL_MODE = "WAL"
+SQLITE_OPTIONS = {
+    "transaction_mode": "IMMEDIATE",
+    "timeout": 20,
+    "init_command": ";".join([
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA mmap_size=268435456",  # 256 MiB
+        "PRAGMA cache_size=-32000",  # 32 MiB per connection
+        "PRAGMA temp_store=MEMORY",
+    ]),
+}
+for _database in DATABASES.values():
+    if _database["ENGINE"] == "django.db.backends.sqlite3":
+        _database["OPTIONS"] = {**SQLITE_OPTIONS, **_database.get("OPTIONS", {})}
+
+DATABASE_ROUTERS = ["inventory.sharding.TenantRouter", "inventory.replica.ReplicaRouter"]
+
+REPLICA_MAX_LAG = int(os.environ.get("REPLICA_MAX_LAG", 5))  # seconds a user's reads stay on the primary after they write
+REPLICA_RETRY_AFTER = int(os.environ.get("REPLICA_RETRY_AFTER", 30))  # seconds on the primary after a replica error
+SHARD_MAP_TTL = int(os.environ.get("SHARD_MAP_TTL", 5))  # seconds a process caches which database each business is in
+SHARD_ID_SPAN = 10**12  # the n-th of SHARD_ALIASES numbers its tenant rows from n * SHARD_ID_SPAN
+
+# manage.py archive_orders moves orders older than this to the archive tables (inventory.archive)
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", 730))
+
+# -------------------------
+# Caches
+# -------------------------
+# "throttle" (inventory.throttling), "analytics" (inventory.coalesce) and
+# "replica" (inventory.replica's read-your-writes pins) must be seen by every
+# worker: file caches are shared by the workers of one host; set REDIS_URL
+# when more than one instance serves the API.
+def _shared_cache(name):
+    if os.environ.get("REDIS_URL"):
+        return {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+            "KEY_PREFIX": name,
+        }
+    return {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.path.join(os.environ.get("SHARED_CACHE_DIR", "/tmp/rojmel-cache"), name),
+        "OPTIONS": {"MAX_ENTRIES": 10_000},
+    }
+
+
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "throttle": _shared_cache("throttle"),
+    "analytics": _shared_cache("analytics"),
+    "replica": _shared_cache("replica"),
+}
+
+# Token buckets charged by the report and forecast endpoints. A request costs
+# about one token per 30 days of data of a typical business (see
+# inventory.throttling); buckets refill at `rate` tokens a second.
+COST_THROTTLE_BUCKETS = {
+    "user": {"capacity": 60, "rate": 0.5},
+    "business": {"capacity": 120, "rate": 1.0},
+}
+
+# Dashboard and sales overview results (inventory.coalesce) are fresh for
+# ANALYTICS_CACHE_FRESH seconds, then served stale for up to
+# ANALYTICS_CACHE_STALE more while one background refresh runs. Any write to a
+# business's data changes its cache keys.
+ANALYTICS_CACHE_FRESH = int(os.environ.get("ANALYTICS_CACHE_FRESH", 60))
+ANALYTICS_CACHE_STALE = int(os.environ.get("ANALYTICS_CACHE_STALE", 600))
+
+# add_business copies catalogs of up to this many products within the request,
+# larger ones on a background thread (inventory.catalog).
+CATALOG_COPY_INLINE_LIMIT = int(os.environ.get("CATALOG_COPY_INLINE_LIMIT", 5000))
+
 # -------------------------
 # Password validation
 # -------------------------
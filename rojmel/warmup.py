@@ -0,0 +1,77 @@
+"""
+Process warm-up for the gunicorn server hooks (gunicorn.conf.py).
+
+warm_up() runs once in the master after the app is preloaded: whatever it
+imports or builds is inherited copy-on-write by every worker, instead of each
+worker paying for it on its first request. open_connections() runs in each
+worker and gives every request thread its database connection up front.
+"""
+import io
+import threading
+
+from django.conf import settings
+from django.db import connections
+from django.urls import get_resolver
+from django.utils import translation
+
+
+def _environ(path, host):
+    return {
+        "REQUEST_METHOD": "GET",
+        "PATH_INFO": path,
+        "QUERY_STRING": "",
+        "SERVER_NAME": host,
+        "SERVER_PORT": "80",
+        "HTTP_HOST": host,
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": "http",
+        "wsgi.input": io.BytesIO(),
+        "wsgi.errors": io.StringIO(),
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+
+
+def warm_up(application, path="/api/dashboard/"):
+    """
+    Import every view (and numpy, pandas, scikit-learn with them), build the
+    URL resolver, load translations, and push one unauthenticated request
+    through the middleware and DRF stack. No database connection is left
+    open: a socket inherited by several workers would be shared between them.
+    """
+    get_resolver().url_patterns
+    translation.activate(settings.LANGUAGE_CODE)
+    hosts = [h for h in settings.ALLOWED_HOSTS if h and "*" not in h and not h.startswith(".")]
+    response = application(_environ(path, hosts[0] if hosts else "localhost"), lambda status, headers, exc_info=None: None)
+    for _chunk in response:
+        pass
+    if hasattr(response, "close"):
+        response.close()
+    connections.close_all()
+
+
+def open_connections(executor=None, threads=1, timeout=10):
+    """
+    Connect every database alias on `threads` threads of `executor` (a
+    gthread worker's pool), or on the calling thread without one. Django's
+    connections are per thread, so each request thread needs its own.
+    """
+
+    def connect():
+        for connection in connections.all():
+            connection.ensure_connection()
+
+    if executor is None:
+        connect()
+        return
+    # Every task waits at the barrier, so each one gets a thread of its own
+    barrier = threading.Barrier(threads)
+
+    def connect_and_wait():
+        connect()
+        barrier.wait(timeout)
+
+    for future in [executor.submit(connect_and_wait) for _ in range(threads)]:
+        future.result(timeout)